@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Approximate nearest neighbour (cosine) index over library vectors: an inverted file (IVF) index.
+# The unit vectors are clustered with spherical k-means into nlist lists; a query only scores
+# the vectors of the nprobe lists whose centroids are most similar to it. nprobe trades recall
+# for latency at query time (nprobe = nlist is an exact search); the probed lists should hold
+# many more than k vectors, so large k (e.g. the 1000 neighbours of nearestCategories) need a
+# coarser index (smaller nlist) or a larger nprobe. Batches of queries are scored together: every
+# probed list is multiplied with all the queries probing it at once.
+#
+# The index is saved next to the vectors of a vector store (see vector_store.py):
+#
+#   ivf_centroids.bin   float32  (nlist, dim) unit centroids
+#   ivf_rows.bin        int32    vector rows, grouped per list
+#   ivf_offsets.bin     int64    (nlist+1) list l has the rows ivf_rows[ivf_offsets[l]:ivf_offsets[l+1]]
+#   ivf.json            nlist, count and build parameters
+#
+# Usage: ./ann_index.py <vectorstoredir> [<nlist>]   (builds and saves the index of a vector store)
+
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from vector_store import VectorStore, unit_rows
+
+
+format_version = 1
+# max # scores computed at once when assigning vectors to centroids
+block_size = 1 << 24
+
+
+#index of the most similar centroid of every vector
+def assign(vectors, centroids):
+    step = max(1, block_size // max(1, len(centroids)))
+    return np.concatenate([np.argmax(vectors[i:i+step] @ centroids.T, axis=1)
+                           for i in range(0, len(vectors), step)] or [np.zeros(0, dtype=np.int64)])
+
+
+def spherical_kmeans(vectors, nlist, iterations=10, seed=0):
+    rng = np.random.RandomState(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=nlist)
+        #empty lists restart from a random vector
+        empty = np.nonzero(counts == 0)[0]
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = unit_rows(sums)
+    return centroids
+
+
+#top-k (rows, scores) of each row of a score matrix, best first
+def top_k(scores, k):
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((len(scores), 0), dtype=np.int64), np.zeros((len(scores), 0), dtype=scores.dtype)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    partscores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-partscores, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(partscores, order, axis=1)
+
+
+#exact cosine search: (rows, scores) of the k most similar vectors of every query
+def exact_search(vectors, queries, k=10):
+    queries = unit_rows(np.atleast_2d(queries))
+    return top_k(queries @ vectors.T, k)
+
+
+class IVFIndex:
+
+    #vectors: unit vectors, e.g. VectorStore.unit_vectors()
+    def __init__(self, vectors, centroids, rows, offsets, params=None):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.rows = rows
+        self.offsets = offsets
+        self.sizes = np.diff(offsets)
+        #the vectors of every list, contiguous
+        self.listvectors = np.ascontiguousarray(vectors[rows], dtype=np.float32)
+        self.params = params or {}
+
+    @classmethod
+    def build(cls, vectors, nlist=None, iterations=10, sample_per_list=256, seed=0):
+        count = len(vectors)
+        nlist = max(1, min(count, nlist or int(round(4 * math.sqrt(count)))))
+        rng = np.random.RandomState(seed)
+        sample = vectors
+        if count > sample_per_list * nlist:
+            sample = vectors[np.sort(rng.choice(count, sample_per_list * nlist, replace=False))]
+        centroids = spherical_kmeans(np.asarray(sample, dtype=np.float32), nlist, iterations, seed)
+        labels = assign(vectors, centroids)
+        rows = np.argsort(labels, kind='stable').astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))])
+        params = {'nlist': nlist, 'iterations': iterations, 'sample_per_list': sample_per_list, 'seed': seed}
+        return cls(vectors, centroids, rows, offsets, params)
+
+    def __len__(self):
+        return len(self.rows)
+
+    #(rows, scores) of the (approximately) k most similar vectors of every query, best first
+    #rows are padded with -1 (scores with -inf) when the probed lists have fewer than k vectors
+    def search(self, queries, k=10, nprobe=8):
+        queries = unit_rows(np.atleast_2d(queries))
+        nprobe = min(nprobe, len(self.centroids))
+        probes = top_k(queries @ self.centroids.T, nprobe)[0]
+
+        #the probed lists' columns in a (queries, max candidates) score matrix, padded with -inf
+        lengths = self.sizes[probes]
+        columns = np.cumsum(lengths, axis=1) - lengths
+        width = max(k, int(lengths.sum(axis=1).max()) if len(lengths) else 0)
+        scores = np.full((len(queries), width), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), width), -1, dtype=np.int64)
+
+        #each probed list scores all the queries that probe it at once
+        queryids = np.repeat(np.arange(len(queries)), probes.shape[1])
+        order = np.argsort(probes.ravel(), kind='stable')
+        lists = probes.ravel()[order]
+        bounds = np.concatenate([[0], np.nonzero(lists[1:] != lists[:-1])[0] + 1, [len(lists)]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            l = lists[start]
+            if self.sizes[l] == 0:
+                continue
+            pairs = order[start:end]
+            qs = queryids[pairs]
+            cols = columns.ravel()[pairs][:, None] + np.arange(self.sizes[l])
+            begin, finish = self.offsets[l], self.offsets[l+1]
+            scores[qs[:, None], cols] = queries[qs] @ self.listvectors[begin:finish].T
+            rows[qs[:, None], cols] = self.rows[begin:finish]
+        best, bestscores = top_k(scores, k)
+        return np.take_along_axis(rows, best, axis=1), bestscores
+
+    def save(self, dirname):
+        self.centroids.astype(np.float32).tofile(dirname+'/ivf_centroids.bin')
+        self.rows.astype(np.int32).tofile(dirname+'/ivf_rows.bin')
+        self.offsets.astype(np.int64).tofile(dirname+'/ivf_offsets.bin')
+        meta = dict(self.params, version=format_version, nlist=len(self.centroids), count=len(self.rows))
+        with open(dirname+'/ivf.json', 'w') as fd:
+            json.dump(meta, fd, indent=2)
+
+    @classmethod
+    def load(cls, dirname, vectors):
+        with open(dirname+'/ivf.json') as fd:
+            meta = json.load(fd)
+        if meta['version'] != format_version:
+            raise ValueError("Unsupported IVF index version %s in %s" % (meta['version'], dirname))
+        if meta['count'] != len(vectors):
+            raise ValueError("IVF index of %d vectors for %d vectors" % (meta['count'], len(vectors)))
+        centroids = np.fromfile(dirname+'/ivf_centroids.bin', dtype=np.float32).reshape(meta['nlist'], -1)
+        rows = np.memmap(dirname+'/ivf_rows.bin', dtype=np.int32, mode='r') if meta['count'] > 0 else np.zeros(0, dtype=np.int32)
+        offsets = np.fromfile(dirname+'/ivf_offsets.bin', dtype=np.int64)
+        return cls(vectors, centroids, rows, offsets, meta)
+
+
+#index of a vector store, built and saved on first use
+def load_index(store, nlist=None):
+    if os.path.isfile(store.dirname+'/ivf.json'):
+        return IVFIndex.load(store.dirname, store.unit_vectors())
+    index = IVFIndex.build(store.unit_vectors(), nlist)
+    index.save(store.dirname)
+    return index
+
+
+if __name__ == '__main__':
+    dirname = sys.argv[1] if len(sys.argv) > 1 else '../datasets/python/models/vectors_dim100'
+    nlist = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    store = VectorStore(dirname)
+
+    t0 = time.perf_counter()
+    index = IVFIndex.build(store.unit_vectors(), nlist)
+    index.save(dirname)
+    print("IVF index of %d vectors in %d lists built in %.1fs" % (len(index), len(index.centroids), time.perf_counter() - t0))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Minimal asyncio HTTP/1.1 client (http and https, keep-alive connection pool, Content-Length,
+# chunked and read-until-close bodies), so that the crawlers need no third-party HTTP library.
+# Response bodies are returned, or streamed to a callback (e.g. for large downloads).
+#
+# A client may be constructed before asyncio.run() (as gitgrab.py does), also on the Python 3.7 of
+# the Docker image: it creates its asyncio primitives in the loop of its first request.
+#
+# Usage: ./async_http.py <url>   (prints the status and headers of a GET request)
+
+import asyncio
+import ssl
+import sys
+import urllib.parse
+
+
+# read/connect timeout (seconds)
+timeout = 60
+# bytes per read of a streamed body
+read_size = 1 << 16
+
+
+class HTTPResponse:
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+#a keep-alive connection pool to one server
+class HTTPClient:
+
+    def __init__(self, baseurl, headers=None, connections=8):
+        url = urllib.parse.urlsplit(baseurl)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == 'https' else None
+        self.prefix = url.path.rstrip('/')
+        self.headers = dict(headers or {})
+        self.idle = []
+        self.connections = connections
+        #created in the running loop on the first request: before Python 3.10, asyncio primitives bind
+        #to the loop current at construction, which is not the one asyncio.run() creates later
+        self.slots = None
+
+    #a request on an idle connection is retried once on a new one (the server may have closed it)
+    async def request(self, method, target, headers=None, sink=None):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.connections)
+        async with self.slots:
+            while True:
+                reused = bool(self.idle)
+                connection = self.idle.pop() if reused else await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), timeout)
+                try:
+                    response, keepalive = await self.exchange(connection, method, target, headers, sink)
+                except (OSError, EOFError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    connection[1].close()
+                    if reused and sink is None:
+                        continue
+                    raise
+                if keepalive:
+                    self.idle.append(connection)
+                else:
+                    connection[1].close()
+                return response
+
+    async def get(self, target, headers=None, sink=None):
+        return await self.request('GET', target, headers, sink)
+
+    async def exchange(self, connection, method, target, headers, sink):
+        reader, writer = connection
+        allheaders = dict(self.headers, Host=self.host if self.port in (80, 443) else '%s:%d' % (self.host, self.port))
+        allheaders.update(headers or {})
+        writer.write(('%s %s HTTP/1.1\r\n%s\r\n' % (method, self.prefix + target, ''.join(
+            '%s: %s\r\n' % item for item in allheaders.items()))).encode('latin-1'))
+        await writer.drain()
+
+        statusline = await asyncio.wait_for(reader.readline(), timeout)
+        if not statusline:
+            raise EOFError("Connection closed")
+        version, status = statusline.decode('latin-1').split(None, 2)[:2]
+        responseheaders = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            responseheaders[key.strip().lower()] = value.strip()
+        keepalive = responseheaders.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+
+        chunks = []
+        write = sink or chunks.append
+        if method == 'HEAD' or status in ('204', '304'):
+            pass
+        elif responseheaders.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await asyncio.wait_for(reader.readline(), timeout)).split(b';')[0], 16)
+                if size == 0:
+                    #trailers
+                    while (await asyncio.wait_for(reader.readline(), timeout)) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                while size > 0:
+                    data = await asyncio.wait_for(reader.read(min(size, read_size)), timeout)
+                    if not data:
+                        raise EOFError("Connection closed")
+                    write(data)
+                    size -= len(data)
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+        elif 'content-length' in responseheaders:
+            size = int(responseheaders['content-length'])
+            while size > 0:
+                data = await asyncio.wait_for(reader.read(min(size, read_size)), timeout)
+                if not data:
+                    raise EOFError("Connection closed")
+                write(data)
+                size -= len(data)
+        else:
+            keepalive = False
+            while True:
+                data = await asyncio.wait_for(reader.read(read_size), timeout)
+                if not data:
+                    break
+                write(data)
+        return HTTPResponse(int(status), responseheaders, None if sink else b''.join(chunks)), keepalive
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+#(client base url, target) of an absolute url
+def split_url(url):
+    parts = urllib.parse.urlsplit(url)
+    return '%s://%s' % (parts.scheme, parts.netloc), urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+
+async def main(url):
+    baseurl, target = split_url(url)
+    client = HTTPClient(baseurl)
+    response = await client.get(target)
+    client.close()
+    print(response.status, len(response.body), "bytes")
+    for key, value in response.headers.items():
+        print("%s: %s" % (key, value))
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1]))
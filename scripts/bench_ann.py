@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Recall and throughput of the IVF index (see ann_index.py) against an exact search, on the
+# vectors of a vector store, or on synthetic clustered vectors. The queries are library vectors,
+# as for most_similar; recall@k is the fraction of the exact k nearest neighbours found.
+#
+# Usage: ./bench_ann.py [<vectorstoredir> | <#vectors>] [<k> [<#queries> [<batchsize>]]]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex, exact_search
+from vector_store import VectorStore, unit_rows
+
+
+source = sys.argv[1] if len(sys.argv) > 1 else '100000'
+k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+nqueries = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+batchsize = int(sys.argv[4]) if len(sys.argv) > 4 else 100
+nprobes = [1, 2, 4, 8, 16, 32, 64]
+seed = 42
+
+
+#vectors around random topic directions, of varying spread
+def synthetic_vectors(count, dim=100, ntopics=1000):
+    rng = np.random.RandomState(seed)
+    topics = rng.randn(ntopics, dim)
+    labels = rng.randint(0, ntopics, count)
+    return unit_rows(topics[labels] + rng.randn(count, dim) * rng.uniform(0.5, 2.0, (count, 1)))
+
+
+def timed(search, queries):
+    t0 = time.perf_counter()
+    results = [search(queries[i:i+batchsize]) for i in range(0, len(queries), batchsize)]
+    elapsed = time.perf_counter() - t0
+    return np.concatenate([rows for rows, _ in results]), len(queries) / elapsed
+
+
+def single_qps(search, queries):
+    t0 = time.perf_counter()
+    for query in queries:
+        search(query[None])
+    return len(queries) / (time.perf_counter() - t0)
+
+
+def recall(found, expected):
+    return np.mean([len(np.intersect1d(f, e)) / len(e) for f, e in zip(found, expected)])
+
+
+if __name__ == '__main__':
+    if os.path.isdir(source):
+        vectors = VectorStore(source).unit_vectors()
+    else:
+        vectors = synthetic_vectors(int(source))
+    rng = np.random.RandomState(seed)
+    queries = vectors[rng.choice(len(vectors), min(nqueries, len(vectors)), replace=False)]
+
+    t0 = time.perf_counter()
+    index = IVFIndex.build(vectors)
+    print("%d vectors (dim %d), %d lists, built in %.1fs; k=%d, %d queries in batches of %d" % (
+        len(vectors), vectors.shape[1], len(index.centroids), time.perf_counter() - t0, k, len(queries), batchsize))
+
+    print("             recall@%d  batched queries/s  single queries/s" % k)
+    expected, qps = timed(lambda q: exact_search(vectors, q, k), queries)
+    print("exact            1.000  %17.0f  %16.0f" % (qps, single_qps(lambda q: exact_search(vectors, q, k), queries[:200])))
+
+    for nprobe in nprobes:
+        if nprobe > len(index.centroids):
+            break
+        found, qps = timed(lambda q: index.search(q, k, nprobe), queries)
+        print("nprobe %4d       %.3f  %17.0f  %16.0f" % (
+            nprobe, recall(found, expected), qps, single_qps(lambda q: index.search(q, k, nprobe), queries[:200])))
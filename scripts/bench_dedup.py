@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Throughput benchmark for the MinHash/LSH project deduplication on a synthetic dataset: original
+# projects with Zipf-distributed imports, plus forks that add, drop or edit a file. Reports the
+# signature and clustering throughput, and the precision/recall of the detected fork pairs.
+#
+# Usage: ./bench_dedup.py [<#projects> [<threshold> [<seed>]]]
+
+import random
+import sys
+import time
+
+import numpy as np
+
+import minhash_dedup
+
+
+nprojects = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.9
+seed = int(sys.argv[3]) if len(sys.argv) > 3 else 42
+forkratio = 0.2
+vocabsize = 50000
+num_perm = 64
+
+
+#Zipf-distributed imports, around a per-project offset into the vocabulary (its 'domain')
+def random_file(rnd, vocab, offset):
+    return [vocab[(offset + int(rnd.paretovariate(1.0)) - 1) % len(vocab)] for _ in range(rnd.randint(1, 12))]
+
+
+def random_project(rnd, vocab):
+    offset = rnd.randrange(len(vocab))
+    return {'f%d' % i: random_file(rnd, vocab, offset) for i in range(rnd.randint(3, 30))}
+
+
+#a fork changes one file: large projects stay near-duplicates, small ones may not
+def fork_project(rnd, vocab, fileimports):
+    fork = dict(fileimports)
+    kind = rnd.random()
+    if kind < 0.4:
+        fork['extra'] = random_file(rnd, vocab, rnd.randrange(len(vocab)))
+    elif kind < 0.7 and len(fork) > 1:
+        del fork[rnd.choice(sorted(fork))]
+    else:
+        fname = rnd.choice(sorted(fork))
+        fork[fname] = fork[fname] + [rnd.choice(vocab)]
+    return fork
+
+
+#multiset Jaccard similarity
+def jaccard(a, b):
+    ca, cb = minhash_dedup.project_import_counts(a), minhash_dedup.project_import_counts(b)
+    return sum((ca & cb).values()) / sum((ca | cb).values())
+
+
+if __name__ == '__main__':
+    rnd = random.Random(seed)
+    vocab = ['lib%d' % i for i in range(vocabsize)]
+
+    #projects are generated on the fly; only the few needed for the ground truth are kept
+    signaturetime = 0.0
+    minhasher = minhash_dedup.MinHasher(num_perm)
+    origins = np.arange(nprojects)
+    recent = []
+    similarities = {}
+    for idx in range(nprojects):
+        if recent and rnd.random() < forkratio:
+            origin, fileimports = rnd.choice(recent)
+            project = fork_project(rnd, vocab, fileimports)
+            origins[idx] = origin
+            if len(similarities) < 10000:
+                similarities[idx] = jaccard(fileimports, project)
+        else:
+            project = random_project(rnd, vocab)
+            recent = (recent + [(idx, project)])[-100:]
+        t0 = time.perf_counter()
+        minhasher.add(minhash_dedup.project_import_counts(project))
+        signaturetime += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    signatures = minhasher.matrix()
+    signaturetime += time.perf_counter() - t0
+    t1 = time.perf_counter()
+
+    bands, rows = minhash_dedup.lsh_params(threshold, num_perm)
+    roots, ncandidates = minhash_dedup.cluster_signatures(signatures, threshold, bands, rows)
+    t2 = time.perf_counter()
+
+    #a fork should be merged with its origin if their true similarity reaches the threshold
+    sampled = np.array(sorted(similarities))
+    expected = np.array([similarities[idx] >= threshold for idx in sampled], dtype=bool)
+    found = roots[sampled] == roots[origins[sampled]]
+    nonforks = np.nonzero(origins == np.arange(nprojects))[0]
+    falsemerges = np.count_nonzero(roots[nonforks] != nonforks)
+
+    print("%d projects, %d forks, LSH %d bands x %d rows, threshold %.2f" % (
+        nprojects, nprojects - len(nonforks), bands, rows, threshold))
+    print("signatures:  %6.1fs, %8.0f projects/s" % (signaturetime, nprojects / signaturetime))
+    print("clustering:  %6.1fs, %8.0f projects/s, %d candidate pairs" % (t2 - t1, nprojects / (t2 - t1), ncandidates))
+    print("removed:     %d projects in %d clusters" % (np.count_nonzero(roots != np.arange(nprojects)),
+                                                       len(minhash_dedup.cluster_sizes(roots))))
+    print("forks >= threshold merged: %.3f (%d/%d sampled)" % (
+        np.count_nonzero(found & expected) / max(1, np.count_nonzero(expected)), np.count_nonzero(found & expected), np.count_nonzero(expected)))
+    print("forks <  threshold merged: %.3f (%d/%d sampled)" % (
+        np.count_nonzero(found & ~expected) / max(1, np.count_nonzero(~expected)), np.count_nonzero(found & ~expected), np.count_nonzero(~expected)))
+    print("originals merged into another project: %d" % falsemerges)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Benchmark of the tarball downloader (see download_tarballs.py) against the local mock API (see
+# mock_github.py), with response delays, rate limits, injected server errors and truncated
+# tarballs: downloads with one worker (like the former crawl scripts, without their sleeps) and
+# with a pool of workers, and a download interrupted halfway and resumed. Every download is checked
+# against the synthetic tarballs of the mock.
+#
+# Usage: ./bench_download.py [--projects N] [--jobs N] [--core-limit N] [--window S] [--latency S]
+#                            [--error-rate P] [--corrupt-rate P]
+
+import argparse
+import datetime
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_gitgrab import free_port, stats
+from mock_github import synthetic_repos, synthetic_tarball
+
+
+parser = argparse.ArgumentParser(description='Benchmark of the tarball downloader.')
+parser.add_argument('--projects', type=int, default=300)
+parser.add_argument('--jobs', type=int, default=16, help='concurrent downloads')
+parser.add_argument('--tarball-kb', type=int, default=64, help='mean tarball size (kb)')
+parser.add_argument('--core-limit', type=int, default=100, help='core requests per window')
+parser.add_argument('--window', type=float, default=2, help='rate limit window (seconds)')
+parser.add_argument('--latency', type=float, default=0.05, help='response delay of the mock API (seconds)')
+parser.add_argument('--error-rate', type=float, default=0.02)
+parser.add_argument('--corrupt-rate', type=float, default=0.02)
+parser.add_argument('--seed', type=int, default=42)
+
+
+#(mock process, url) of a started mock API
+def start_mock(args):
+    port = free_port()
+    mock = subprocess.Popen([sys.executable, 'mock_github.py', '--port', str(port), '--seed', str(args.seed),
+                             '--core-limit', str(args.core_limit), '--window', str(args.window), '--latency', str(args.latency),
+                             '--error-rate', str(args.error_rate), '--corrupt-rate', str(args.corrupt_rate),
+                             '--tarball-kb', str(args.tarball_kb)],
+                            stdout=subprocess.PIPE, text=True)
+    mock.stdout.readline()
+    return mock, 'http://127.0.0.1:%d' % port
+
+
+#gitGrab.json of a basedir with synthetic projects
+def write_gitgrab(basedir, args):
+    repos, day = [], datetime.date(2019, 1, 1)
+    while len(repos) < args.projects:
+        repos += synthetic_repos(day, args.seed, args.projects)
+        day += datetime.timedelta(days=1)
+    with open(basedir+'/gitGrab.json', 'w') as fd:
+        json.dump([{'full_name': repo['full_name'], 'stars': repo['stargazers_count']} for repo in repos[:args.projects]], fd)
+    return [repo['full_name'] for repo in repos[:args.projects]]
+
+
+def download_command(args, basedir, url, jobs):
+    return [sys.executable, 'download_tarballs.py', basedir, '--jobs', str(jobs), '--api-url', url, '--metrics', basedir+'/metrics.json']
+
+
+#whether every project has its tarball
+def check(basedir, projects, args):
+    for project in projects:
+        filename = '%s/dataset01/%s.tgz' % (basedir, project)
+        if not os.path.isfile(filename):
+            return False
+        with open(filename, 'rb') as fd:
+            if fd.read() != synthetic_tarball(project, args.tarball_kb):
+                return False
+    return True
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    print("%d projects of ~%dkb, core limit %d per %gs, %gs latency, %.0f%% errors, %.0f%% truncated tarballs" % (
+        args.projects, args.tarball_kb, args.core_limit, args.window, args.latency, args.error_rate * 100, args.corrupt_rate * 100))
+
+    times = {}
+    for jobs in [1, args.jobs]:
+        mock, url = start_mock(args)
+        with tempfile.TemporaryDirectory() as basedir:
+            projects = write_gitgrab(basedir, args)
+            subprocess.run(download_command(args, basedir, url, jobs), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            with open(basedir+'/metrics.json') as fd:
+                metrics = json.load(fd)
+            times[jobs] = metrics['seconds']
+            print("%2d job(s): %.1fs, %.1f projects/s, %.2f MB/s, p50 %.3fs, p95 %.3fs, %d retries, %d rate limited, complete: %s" % (
+                jobs, metrics['seconds'], metrics['projects_per_second'], metrics['megabytes_per_second'],
+                metrics['download_seconds_p50'], metrics['download_seconds_p95'], metrics['retries'], metrics['rate_limited'],
+                check(basedir, projects, args)))
+        mock.terminate()
+        mock.wait()
+    print("speedup: %.1fx" % (times[1] / times[args.jobs]))
+
+    mock, url = start_mock(args)
+    with tempfile.TemporaryDirectory() as basedir:
+        projects = write_gitgrab(basedir, args)
+        download = subprocess.Popen(download_command(args, basedir, url, args.jobs), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(times[args.jobs] / 2 + 1)
+        download.send_signal(signal.SIGINT)
+        download.wait()
+        before = stats(url).get('tarballs', 0)
+        subprocess.run(download_command(args, basedir, url, args.jobs), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        with open(basedir+'/metrics.json') as fd:
+            metrics = json.load(fd)
+        print("interrupted after %d tarballs; resumed: %d skipped, %d downloaded in %.1fs, complete: %s" % (
+            before, metrics['skipped'], metrics['downloaded'], metrics['seconds'], check(basedir, projects, args)))
+    mock.terminate()
+    mock.wait()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Benchmark of the GitHub crawler (see gitgrab.py) against the local mock API (see mock_github.py),
+# with short rate limit windows, response delays and injected server errors: a crawl with one day
+# at a time and with concurrent days, and a concurrent crawl interrupted halfway and resumed from
+# its checkpoint log. Every crawl is checked against the synthetic repositories of the mock.
+#
+# Usage: ./bench_gitgrab.py [--days N] [--jobs N] [--search-limit N] [--window S] [--error-rate P]
+#                           [--latency S]
+
+import argparse
+import datetime
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from mock_github import synthetic_repos
+
+
+parser = argparse.ArgumentParser(description='Benchmark of the GitHub crawler.')
+parser.add_argument('--days', type=int, default=14, help='days crawled')
+parser.add_argument('--jobs', type=int, default=8, help='days crawled concurrently')
+parser.add_argument('--repos-per-day', type=int, default=300)
+parser.add_argument('--minstars', type=int, default=2)
+parser.add_argument('--search-limit', type=int, default=60, help='search requests per window')
+parser.add_argument('--window', type=float, default=5, help='rate limit window (seconds)')
+parser.add_argument('--error-rate', type=float, default=0.02)
+parser.add_argument('--latency', type=float, default=0.3, help='response delay of the mock API (seconds)')
+parser.add_argument('--seed', type=int, default=42)
+
+since = datetime.date(2019, 1, 1)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def stats(url):
+    with urllib.request.urlopen(url + '/_stats') as response:
+        return json.load(response)
+
+
+#(mock process, url) of a started mock API
+def start_mock(args):
+    port = free_port()
+    mock = subprocess.Popen([sys.executable, 'mock_github.py', '--port', str(port), '--seed', str(args.seed),
+                             '--since', since.isoformat(), '--until', (since + datetime.timedelta(days=args.days - 1)).isoformat(),
+                             '--repos-per-day', str(args.repos_per_day), '--search-limit', str(args.search_limit),
+                             '--window', str(args.window), '--error-rate', str(args.error_rate), '--latency', str(args.latency)],
+                            stdout=subprocess.PIPE, text=True)
+    mock.stdout.readline()
+    return mock, 'http://127.0.0.1:%d' % port
+
+
+def crawl_command(args, basedir, url, jobs):
+    return [sys.executable, 'gitgrab.py', basedir, 'python', 'fast', '0', str(args.minstars), '0', '--jobs', str(jobs),
+            '--api-url', url, '--since', since.isoformat(), '--until', (since + datetime.timedelta(days=args.days - 1)).isoformat()]
+
+
+#the full names of the repositories a crawl should find
+def expected(args):
+    return set(repo['full_name'] for i in range(args.days)
+               for repo in synthetic_repos(since + datetime.timedelta(days=i), args.seed, args.repos_per_day)
+               if repo['stargazers_count'] >= args.minstars)
+
+
+def check(basedir, names):
+    with open(basedir+'/gitGrab.json') as fd:
+        gitgrab = json.load(fd)
+    found = [record['full_name'] for record in gitgrab]
+    return len(found) == len(names) and set(found) == names
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    names = expected(args)
+    print("%d days, %d repositories with >= %d stars, search limit %d per %gs, %.0f%% errors, %gs latency" % (
+        args.days, len(names), args.minstars, args.search_limit, args.window, args.error_rate * 100, args.latency))
+
+    times = {}
+    for jobs in [1, args.jobs]:
+        mock, url = start_mock(args)
+        with tempfile.TemporaryDirectory() as basedir:
+            t0 = time.perf_counter()
+            subprocess.run(crawl_command(args, basedir, url, jobs), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times[jobs] = time.perf_counter() - t0
+            counts = stats(url)
+            print("%d job(s): %.1fs, %d requests (%d rate limited, %d errors), complete: %s" % (
+                jobs, times[jobs], counts.get('requests', 0), counts.get('rate_limited', 0), counts.get('errors', 0), check(basedir, names)))
+        mock.terminate()
+        mock.wait()
+    print("speedup: %.1fx" % (times[1] / times[args.jobs]))
+
+    mock, url = start_mock(args)
+    with tempfile.TemporaryDirectory() as basedir:
+        crawl = subprocess.Popen(crawl_command(args, basedir, url, args.jobs), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(times[args.jobs] / 2)
+        crawl.send_signal(signal.SIGINT)
+        crawl.wait()
+        before = stats(url).get('requests', 0)
+        with open(basedir+'/gitGrab.checkpoint.jsonl') as fd:
+            entries = [json.loads(line) for line in fd]
+        t0 = time.perf_counter()
+        subprocess.run(crawl_command(args, basedir, url, args.jobs), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        print("interrupted after %d requests, %d partitions (%d days) checkpointed; resumed: %.1fs, %d requests, complete: %s" % (
+            before, sum('repos' in entry for entry in entries), sum('done' in entry for entry in entries),
+            time.perf_counter() - t0, stats(url).get('requests', 0) - before, check(basedir, names)))
+        os.remove(basedir+'/gitGrab.checkpoint.jsonl')
+    mock.terminate()
+    mock.wait()
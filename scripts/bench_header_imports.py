@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Regression check and benchmark for the header-only Java, C# and PHP extraction: compares it with
+# the full-file extraction on a synthetic corpus (with large generated sources and tricky comments
+# and strings), or on a real folder of sources if one is given.
+#
+# Usage: ./bench_header_imports.py [<folder>]
+
+import random
+import sys
+import time
+
+import extract_imports
+
+
+folder = sys.argv[1] if len(sys.argv) > 1 else None
+nfiles = 300
+seed = 42
+
+LANGUAGES = ['java', 'csharp', 'php']
+
+
+def java_file(rnd, generated):
+    parts = ['/* Copyright: this class is generated, do not edit\n * import fake.Comment;\n */\n',
+             'package com.example.p%d;\n\n' % rnd.randint(0, 99)]
+    parts.extend('import %s.%s.C%d;\n' % (rnd.choice(['java', 'javax', 'org']), rnd.choice(['util', 'io', 'x.y']), i)
+                 for i in range(rnd.randint(1, 30)))
+    parts.append('import static org.junit.Assert.*; // a class-less comment\n\n')
+    parts.append('@SuppressWarnings("unchecked class")\npublic final class Gen%d {\n' % rnd.randint(0, 999))
+    for i in range(rnd.randint(2000, 20000) if generated else rnd.randint(10, 100)):
+        parts.append('    private static final String F%d = "value: import x.y // not a comment";\n' % i)
+        parts.append('    public char c%d() { return \'"\'; } /* class */\n' % i)
+    parts.append('}\ninterface Other {}\n')
+    return ''.join(parts)
+
+
+def csharp_file(rnd, generated):
+    parts = ['// <auto-generated> class </auto-generated>\n']
+    parts.extend('using System.%s%d;\n' % (rnd.choice(['Linq', 'IO', 'Text']), i) for i in range(rnd.randint(1, 15)))
+    parts.append('using static System.Math;\n\nnamespace Example.N%d\n{\n' % rnd.randint(0, 99))
+    parts.extend('    using Inner.Ns%d;\n' % i for i in range(rnd.randint(0, 5)))
+    parts.append('    [Serializable]\n    public partial class Gen%d : Base\n    {\n' % rnd.randint(0, 999))
+    for i in range(rnd.randint(2000, 20000) if generated else rnd.randint(10, 100)):
+        parts.append('        public string P%d { get; set; } = "using Fake; class";\n' % i)
+        parts.append('        public void M%d() { using (var s = Open()) { s.Run(); } }\n' % i)
+    parts.append('    }\n}\n')
+    if rnd.random() < 0.3:
+        parts.append('namespace Example.Other\n{\n    using /* later */ Other.Ns;\n    class Helper {}\n}\n')
+    return ''.join(parts)
+
+
+def php_file(rnd, generated):
+    parts = ['<?php\n/** This class is generated: class Foo */\nnamespace App\\Models%d;\n\n' % rnd.randint(0, 99)]
+    parts.extend('use App\\Lib\\C%d;\n' % i for i in range(rnd.randint(1, 15)))
+    parts.append('use function App\\helpers\\h1, App\\helpers\\h2;\nuse const App\\X;\nuse App\\{A, B as BB};\n\n')
+    parts.append('abstract class Gen%d extends Model\n{\n' % rnd.randint(0, 999))
+    if rnd.random() < 0.3:
+        parts.append('    use SoftDeletes; use Notifiable;\n')
+    for i in range(rnd.randint(2000, 20000) if generated else rnd.randint(10, 100)):
+        parts.append('    protected $f%d = \'value ; class\';\n' % i)
+        parts.append('    public function m%d($x) { return array_map(function ($y) use ($x) { return $x + $y; }, $x); }\n' % i)
+    parts.append('}\n')
+    return ''.join(parts)
+
+
+generators = {'java': (java_file, '.java'), 'csharp': (csharp_file, '.cs'), 'php': (php_file, '.php')}
+
+
+def synthetic_corpus(rnd, language):
+    generator, ext = generators[language]
+    return [('src/F%d%s' % (i, ext), generator(rnd, rnd.random() < 0.2).encode('utf-8')) for i in range(nfiles)]
+
+
+def folder_corpus(language):
+    patterns = extract_imports.source_patterns[language]
+    return [(fname, fd.read()) for fname, fd in extract_imports.iter_folder_sources(folder, patterns)]
+
+
+def bench(corpus, language, header):
+    t0 = time.perf_counter()
+    fileimports = extract_imports.extraction_functions[language](corpus, header=header)
+    return fileimports, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    rnd = random.Random(seed)
+    failed = False
+    for language in LANGUAGES:
+        corpus = folder_corpus(language) if folder else synthetic_corpus(rnd, language)
+        mb = sum(len(data) for _, data in corpus) / 1024 / 1024
+
+        fullimports, fulltime = bench(corpus, language, False)
+        for key in extract_imports.header_stats:
+            extract_imports.header_stats[key] = 0
+        headerimports, headertime = bench(corpus, language, True)
+        stats = extract_imports.header_stats
+
+        different = [fname for fname in fullimports if fullimports[fname] != headerimports.get(fname)]
+        failed = failed or len(different) > 0 or len(fullimports) != len(headerimports)
+        print("%-7s %5d files, %7.1f MB: full %6.2fs, header %6.2fs (%.1fx), %d cut, %.1f MB skipped, %d different"
+              % (language, len(corpus), mb, fulltime, headertime, fulltime / max(headertime, 1e-9),
+                 stats['cut'], stats['bytes_skipped'] / 1024 / 1024, len(different)))
+        for fname in different[:5]:
+            print("  ", fname, fullimports[fname][:10], (headerimports.get(fname) or [])[:10])
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Benchmark of the incremental preprocessing (see manifest.py) on a synthetic Python dataset:
+# after a full build, a fraction of the projects is re-crawled (changed, added, removed, or only
+# touched), and the three stages (extract_tarballs.py, create_import_dataset.py and
+# filter_import_dataset.py) are run with --incremental. Reports the time of every stage against a
+# full rebuild of a copy of the dataset, and checks that all their outputs are byte-identical.
+#
+# Usage: ./bench_incremental.py [--projects N] [--per-dataset N] [--changed F] [--jobs N]
+
+import argparse
+import filecmp
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+
+parser = argparse.ArgumentParser(description='Benchmark of the incremental preprocessing.')
+parser.add_argument('--projects', type=int, default=4000)
+parser.add_argument('--per-dataset', type=int, default=1000, help='projects per dataset folder')
+parser.add_argument('--changed', type=float, default=0.02, help='fraction of re-crawled projects')
+parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='extraction worker processes')
+parser.add_argument('--seed', type=int, default=42)
+
+vocabsize = 5000
+
+# stage: command line (without --incremental)
+stages = [
+    ('extract', ['extract_tarballs.py', '{basedir}', 'python', '--no-cache', '--jobs', '{jobs}']),
+    ('raw', ['create_import_dataset.py', '{basedir}']),
+    ('filter', ['filter_import_dataset.py', '{basedir}']),
+]
+#the project names contain the dataset folder path, so the stages run in <rootdir>/work on ../dataset
+basedir_arg = '../dataset'
+
+
+#Zipf-distributed imports around the project's 'domain' in the vocabulary
+def random_files(rnd, offset):
+    return {'pkg/mod%d.py' % i: ''.join('import lib%d\n' % ((offset + int(rnd.paretovariate(1.0))) % vocabsize)
+                                        for _ in range(rnd.randint(1, 12)))
+            for i in range(rnd.randint(2, 20))}
+
+
+def write_tarball(filename, project, files):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with tarfile.open(filename, 'w:gz') as tar:
+        for name, text in files.items():
+            data = text.encode('utf-8')
+            info = tarfile.TarInfo('%s-master/%s' % (project.split('/')[-1], name))
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def tarball_file(basedir, i, project, args):
+    return '%s/dataset%02d/%s.tgz' % (basedir, 1 + i // args.per_dataset, project)
+
+
+#{project: files} of the dataset; a fifth of the projects are forks with a changed file
+def create_dataset(basedir, args, rnd):
+    projects = {}
+    for i in range(args.projects):
+        project = 'user%d/project%d' % (rnd.randrange(1000), i)
+        if projects and rnd.random() < 0.2:
+            files = dict(projects[rnd.choice(list(projects))])
+            files[rnd.choice(list(files))] = 'import lib%d\n' % rnd.randrange(vocabsize)
+        else:
+            files = random_files(rnd, rnd.randrange(vocabsize))
+        projects[project] = files
+        write_tarball(tarball_file(basedir, i, project, args), project, files)
+    return list(projects)
+
+
+#re-crawls a fraction of the projects: changed, removed, touched, and replaced by new ones
+def recrawl(basedir, projects, args, rnd):
+    counts = {'changed': 0, 'removed': 0, 'touched': 0, 'added': 0}
+    for i in rnd.sample(range(len(projects)), int(len(projects) * args.changed)):
+        filename = tarball_file(basedir, i, projects[i], args)
+        change = rnd.choice(list(counts))
+        counts[change] += 1
+        if change == 'changed':
+            write_tarball(filename, projects[i], random_files(rnd, rnd.randrange(vocabsize)))
+        elif change == 'touched':
+            os.utime(filename)
+        else:
+            os.remove(filename)
+            if change == 'added':
+                write_tarball(filename.replace('/project', '/new-project'), projects[i], random_files(rnd, rnd.randrange(vocabsize)))
+    return counts
+
+
+def run_stages(rootdir, args, incremental):
+    times = {}
+    os.makedirs(rootdir+'/work', exist_ok=True)
+    scriptdir = os.path.dirname(os.path.abspath(__file__))
+    for stage, command in stages:
+        command = [sys.executable, os.path.join(scriptdir, command[0])] + [arg.format(basedir=basedir_arg, jobs=args.jobs) for arg in command[1:]]
+        t0 = time.perf_counter()
+        subprocess.run(command + ['--incremental'] * incremental, cwd=rootdir+'/work', stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times[stage] = time.perf_counter() - t0
+    return times
+
+
+#the stage outputs of a dataset folder (relative paths)
+def outputs(basedir):
+    files = []
+    for dirpath, _, filenames in os.walk(basedir):
+        for filename in filenames:
+            path = os.path.relpath(os.path.join(dirpath, filename), basedir)
+            if path.endswith('.json') and path.startswith('dataset') or path.startswith('raw/') or \
+                    path.startswith('processed/') and '/dedup-keys/' not in '/' + path or path == 'dedup-clusters.json':
+                files.append(path)
+    return sorted(files)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        basedir = tmpdirname+'/incremental/dataset'
+        projects = create_dataset(basedir, args, rnd)
+        run_stages(tmpdirname+'/incremental', args, False)
+        counts = recrawl(basedir, projects, args, rnd)
+        print("%d projects, %d re-crawled: %s" % (args.projects, sum(counts.values()), counts))
+
+        #the reference: a full rebuild from the tarballs only
+        rebuilddir = tmpdirname+'/rebuild/dataset'
+        shutil.copytree(basedir, rebuilddir, ignore=shutil.ignore_patterns('*.json', 'raw', 'processed'))
+        rebuild = run_stages(tmpdirname+'/rebuild', args, False)
+        incremental = run_stages(tmpdirname+'/incremental', args, True)
+        for stage, _ in stages:
+            print("%-8s full rebuild %6.2fs, incremental %6.2fs (%.1fx)" % (stage, rebuild[stage], incremental[stage], rebuild[stage] / incremental[stage]))
+        print("%-8s full rebuild %6.2fs, incremental %6.2fs (%.1fx)" % ('total', sum(rebuild.values()), sum(incremental.values()),
+                                                                        sum(rebuild.values()) / sum(incremental.values())))
+
+        filenames = outputs(basedir)
+        same = filenames == outputs(rebuilddir) and all(filecmp.cmp(basedir+'/'+filename, rebuilddir+'/'+filename, shallow=False)
+                                                        for filename in filenames)
+        print("%d outputs, byte-identical to the full rebuild: %s" % (len(filenames), same))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Benchmark of intent-filtered searches (see intent_index.py) on a synthetic model whose intents
+# range from rare to common: for every intent, the latency and # results of filtering the num
+# nearest libraries after the search (as /searchByIntent did), and of searching within the
+# libraries of the intent; and the time to count the categories of the num nearest libraries
+# with collections.Counter and with the intent index.
+#
+# Usage: ./bench_intents.py [--libraries N] [--num N] [--queries N] [--modeldir DIR]
+
+import argparse
+import collections
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from query_server import LibraryModel, top_level
+from vector_store import vector_store_dir, write_vector_store
+
+
+parser = argparse.ArgumentParser(description='Benchmark of intent-filtered searches.')
+parser.add_argument('--libraries', type=int, default=100000, help='libraries of the synthetic model')
+parser.add_argument('--num', type=int, default=1000, help='nearest libraries per search')
+parser.add_argument('--queries', type=int, default=200, help='searches per intent')
+parser.add_argument('--modeldir', help='models folder with annotations (default = synthetic model)')
+parser.add_argument('--seed', type=int, default=42)
+
+# synthetic intents: fraction of the libraries with them
+densities = {'rare_0.1%': 0.001, 'rare_1%': 0.01, 'medium_5%': 0.05, 'common_20%': 0.2, 'common_50%': 0.5}
+
+
+def synthetic_model(modeldir, nlibraries, seed, dim=100, ntopics=50):
+    rng = np.random.RandomState(seed)
+    os.makedirs(modeldir)
+    names = ['lib%d' % i for i in range(nlibraries)]
+    topics = rng.randint(0, ntopics, nlibraries)
+    write_vector_store(vector_store_dir(modeldir, dim), names, rng.randn(ntopics, dim)[topics] + rng.randn(nlibraries, dim))
+    #a few topic categories per library, and the synthetic intents
+    annotations = {name: {'categories': ['topic%d' % topics[i]]} for i, name in enumerate(names)}
+    for intent, density in densities.items():
+        for i in rng.choice(nlibraries, int(density * nlibraries), replace=False):
+            annotations[names[i]]['categories'].append(intent)
+    with gzip.open(modeldir+'/annotations.json.gz', 'wt') as fd:
+        json.dump(annotations, fd)
+
+
+#the previous /searchByIntent: the num nearest libraries, filtered afterwards
+def post_filtered(model, context, intent, num):
+    names, _ = model.nearest(context, num)
+    return [name for name in names if intent in model.categories(top_level(name)) or intent in model.categories(name)]
+
+
+def timed(function, contexts):
+    t0 = time.perf_counter()
+    results = [function(context) for context in contexts]
+    return (time.perf_counter() - t0) / len(contexts) * 1000, results
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    tmpdir = None
+    modeldir = args.modeldir
+    if modeldir is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        modeldir = os.path.join(tmpdir.name, 'models')
+        print("Generating a synthetic model of %d libraries" % args.libraries)
+        synthetic_model(modeldir, args.libraries, args.seed)
+    model = LibraryModel(modeldir)
+    rnd = random.Random(args.seed)
+    contexts = [rnd.sample(model.names, rnd.randint(3, 15)) for _ in range(args.queries)]
+    intents = [intent for intent in densities if intent in model.intent_index] if args.modeldir is None else \
+        sorted(model.intents, key=model.intent_index.density)[::max(1, len(model.intents) // 5)]
+    #warm-up (BLAS initialization, page faults)
+    for context in contexts[:10]:
+        model.nearest(context, args.num)
+
+    print("%d libraries, num = %d, %d searches per intent" % (len(model.names), args.num, len(contexts)))
+    print("intent          density   post-filter(ms)  results   filtered(ms)  results  speed-up")
+    for intent in intents:
+        before, oldresults = timed(lambda context: post_filtered(model, context, intent, args.num), contexts)
+        after, newresults = timed(lambda context: model.nearest(context, args.num, intent)[0], contexts)
+        print("%-15s %6.2f%% %17.2f %8.1f %14.2f %8.1f %8.1fx" % (
+            intent, 100 * model.intent_index.density(intent), before, np.mean([len(r) for r in oldresults]),
+            after, np.mean([len(r) for r in newresults]), before / after))
+
+    neighbours = [model.nearest_rows(context, args.num)[0] for context in contexts]
+    t0 = time.perf_counter()
+    for rows in neighbours:
+        names = [model.names[r] for r in rows]
+        old = collections.Counter(cat for name in names for cat in model.categories(name)).most_common(50)
+    before = (time.perf_counter() - t0) / len(neighbours) * 1000
+    t0 = time.perf_counter()
+    for rows in neighbours:
+        new = model.category_counts(rows)
+    after = (time.perf_counter() - t0) / len(neighbours) * 1000
+    print("category counts of %d neighbours: Counter %.3fms, intent index %.3fms (%.1fx), same result: %s" % (
+        args.num, before, after, before / after, [list(c) for c in old] == new))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Benchmarks the single-pass JS/TS import scanner against the line-based regexes on synthetic
+# regular (multi-line) sources and on minified bundles of growing size.
+
+import random
+import sys
+import time
+
+from extract_imports import regex_javascript_imports
+from scan_js_imports import scan_js_imports
+
+
+seed = int(sys.argv[1]) if len(sys.argv) > 1 else 42
+bundlesizes = [int(x) for x in sys.argv[2:]] or [16*1024, 64*1024, 256*1024]
+
+MODULES = ['react', 'lodash', './util', '../lib/index', '@angular/core', 'express', 'fs', 'path', 'vue']
+
+
+def random_statements(rnd, minified):
+    sp = '' if minified else ' '
+    nl = '' if minified else '\n'
+    statements = []
+    for i in range(rnd.randint(20, 60)):
+        kind = rnd.random()
+        module = rnd.choice(MODULES)
+        if kind < 0.15:
+            statements.append('import{a%d,b%d as c%d}from"%s";' % (i, i, i, module) if minified else
+                              'import {\n  a%d,\n  b%d as c%d,\n} from \'%s\';\n' % (i, i, i, module))
+        elif kind < 0.3:
+            statements.append('var m%d%s=%srequire("%s");%s' % (i, sp, sp, module, nl))
+        elif kind < 0.35:
+            statements.append('import("%s").then(function(m){return m.default});%s' % (module, nl))
+        elif kind < 0.4:
+            statements.append('export*from"%s";' % module if minified else 'export * from "%s";\n' % module)
+        elif kind < 0.45:
+            statements.append('throw new Error("Failed to import "+n+" for "+e);%s' % nl)
+        elif kind < 0.6:
+            statements.append('var s%d%s=%s"a string mentioning import x and \\"quotes\\"";%s' % (i, sp, sp, nl))
+        elif kind < 0.7:
+            statements.append('var r%d%s=%s/ab+c\\/[/"]d/g.test(x)%s?%sn/2%s:%s`t ${v%d}`;%s' % (i, sp, sp, sp, sp, sp, sp, i, nl))
+        else:
+            statements.append('function f%d(n,e){if(n>e){return n.import||e}return n*e/%d}%s' % (i, i + 1, nl))
+    return ''.join(statements)
+
+
+def make_file(rnd, size, minified):
+    parts = []
+    total = 0
+    while total < size:
+        part = random_statements(rnd, minified)
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+
+def bench(func, text):
+    t0 = time.perf_counter()
+    imports = func(text)
+    return imports, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    rnd = random.Random(seed)
+
+    print("%-10s %10s %12s %12s %8s %10s %10s" % ('kind', 'size', 'regex [s]', 'scan [s]', 'speedup', '#regex', '#scan'))
+    for minified in [False, True]:
+        for size in bundlesizes:
+            text = make_file(rnd, size, minified)
+            oldimports, oldtime = bench(regex_javascript_imports, text)
+            newimports, newtime = bench(scan_js_imports, text)
+            print("%-10s %10d %12.4f %12.4f %7.1fx %10d %10d" % ('minified' if minified else 'regular', len(text),
+                  oldtime, newtime, oldtime / newtime, len(oldimports), len(newimports)))
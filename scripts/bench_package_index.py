@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Benchmark of the Java package index (see package_index.py) on a synthetic package hierarchy:
+# resolving all the class imports of a file to modules by probing a {package: module} dict with
+# every package prefix (as the query server did), and with batch lookups (per file, and of all the
+# files at once); and the time to load the mapping from package_modules.json.gz, and the index.
+#
+# Usage: ./bench_package_index.py [--packages N] [--files N] [--imports N]
+
+import argparse
+import gzip
+import json
+import random
+import tempfile
+import time
+
+from package_index import PackageIndex, write_package_index
+
+
+parser = argparse.ArgumentParser(description='Benchmark of the Java package index.')
+parser.add_argument('--packages', type=int, default=200000, help='indexed packages')
+parser.add_argument('--files', type=int, default=1000, help='files to resolve')
+parser.add_argument('--imports', type=int, default=300, help='imports per file')
+parser.add_argument('--seed', type=int, default=42)
+
+words = ['apache', 'commons', 'util', 'io', 'core', 'api', 'impl', 'internal', 'client', 'server', 'model', 'spi',
+         'http', 'json', 'xml', 'config', 'common', 'base', 'data', 'service', 'test', 'net', 'security', 'cache']
+
+
+#{package: module} of group packages, with sub-packages down to depth 8, and {package: frequency}
+def synthetic_packages(npackages, rnd):
+    package_modules, package_freqs = {}, {}
+    while len(package_freqs) < npackages:
+        group = '%s.%s%d.%s' % (rnd.choice(['org', 'com', 'io', 'net']), rnd.choice(words), rnd.randint(0, 10**6), rnd.choice(words))
+        module = group + ':' + rnd.choice(words)
+        package_modules[group] = module
+        package = group
+        for _ in range(rnd.randint(1, 5)):
+            package += '.' + rnd.choice(words)
+            package_freqs[package] = int(rnd.paretovariate(1.2))
+    return package_modules, package_freqs
+
+
+#the module of the longest package prefix in a dict
+def probe(package_modules, package):
+    segments = package.split('.')
+    for end in range(len(segments), 0, -1):
+        module = package_modules.get('.'.join(segments[:end]))
+        if module is not None:
+            return module
+    return None
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rnd = random.Random(args.seed)
+    package_modules, package_freqs = synthetic_packages(args.packages, rnd)
+    packages = list(package_freqs)
+    #class imports of (sub-packages of) known packages, and some unknown ones
+    files = [[rnd.choice(packages) + '.sub' * rnd.randint(0, 2) + '.Class%d' % i if rnd.random() < 0.9 else
+              'com.example%d.internal.Class%d' % (rnd.randint(0, 10**6), i) for i in range(args.imports)]
+             for _ in range(args.files)]
+    #files that only import unknown packages (e.g. only the JDK)
+    files += [['java.util.List', 'java.io.File'], ['zzz.unknown']]
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        t0 = time.perf_counter()
+        write_package_index(tmpdirname+'/package_index', package_freqs, package_modules)
+        print("Index of %d packages built in %.1fs" % (len(package_freqs) + len(package_modules), time.perf_counter() - t0))
+        with gzip.open(tmpdirname+'/package_modules.json.gz', 'wt') as fd:
+            json.dump(dict(package_modules, **{p: probe(package_modules, p) for p in packages}), fd)
+
+        t0 = time.perf_counter()
+        with gzip.open(tmpdirname+'/package_modules.json.gz', 'rt') as fd:
+            mapping = json.load(fd)
+        loadjson = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        index = PackageIndex(tmpdirname+'/package_index')
+        loadindex = time.perf_counter() - t0
+        print("load: package_modules.json.gz %.3fs, package index %.3fs (%.0fx)" % (loadjson, loadindex, loadjson / loadindex))
+
+        t0 = time.perf_counter()
+        probed = [[probe(mapping, imp) for imp in imports] for imports in files]
+        before = (time.perf_counter() - t0) / len(files) * 1000
+        t0 = time.perf_counter()
+        batched = [index.modules_for_packages(imports) for imports in files]
+        after = (time.perf_counter() - t0) / len(files) * 1000
+        print("%d imports per file: dict probing %.3fms, batch lookup %.3fms per file (%.1fx), same modules: %s" % (
+            args.imports, before, after, before / after, probed == batched))
+        t0 = time.perf_counter()
+        batched = index.modules_for_packages([imp for imports in files for imp in imports])
+        allfiles = (time.perf_counter() - t0) / len(files) * 1000
+        print("all the imports in one batch: %.3fms per file (%.1fx)" % (allfiles, before / allfiles))
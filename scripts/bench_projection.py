@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Time and quality of the library maps (see project_vectors.py) on synthetic clustered vectors (as
+# in bench_ann.py): the kNN graph, a layout from scratch, and after retraining (the vectors
+# perturbed, a few libraries dropped and new ones added), a warm-started layout against one from
+# scratch. The quality of a map is its neighbour preservation: the fraction of the exact k nearest
+# neighbours of a sample of libraries that are also among their k nearest neighbours on the map.
+# Also compares the size of the binary maps with the indent=2 JSON of the Visualization notebook.
+#
+# Usage: ./bench_projection.py [<#vectors> [<dim> [<epochs>]]]
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import project_vectors
+from ann_index import exact_search, top_k
+from bench_ann import synthetic_vectors
+from vector_store import VectorStore, unit_rows, write_vector_store
+
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+dim = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+epochs = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+k = 10
+nsample = 1000
+seed = 42
+
+
+def neighbour_preservation(vectors, points, sample):
+    expected = exact_search(vectors, vectors[sample], k + 1)[0][:, 1:]
+    #-|p - q|^2 up to the constant -|p|^2 of every row
+    found = top_k(2 * points[sample] @ points.T - (points * points).sum(axis=1), k + 1)[0][:, 1:]
+    return np.mean([len(np.intersect1d(f, e)) / k for f, e in zip(found, expected)])
+
+
+def directory_size(dirname):
+    return sum(os.path.getsize(dirname+'/'+f) for f in os.listdir(dirname))
+
+
+#(seconds, status, points in vector store order) of the 2D map of the store
+def timed_projection(store, modeldir, params, warm):
+    t0 = time.perf_counter()
+    modelhash = project_vectors.model_hash(store)
+    knnrows, knnscores = project_vectors.load_knn(store, modelhash, params['neighbours'])
+    edges = project_vectors.graph_edges(knnrows, knnscores)
+    tknn = time.perf_counter() - t0
+    names = store.names.tolist()
+    status = project_vectors.project(store, modeldir, 2, params, modelhash, names, np.zeros(len(names), dtype=np.int64),
+                                     edges, knnrows, warm=warm, force=True)
+    elapsed = time.perf_counter() - t0
+    mapnames, points, _ = project_vectors.read_map(project_vectors.map_dir(modeldir, 2, store.dim))
+    rows = np.argsort(store.indices(mapnames))
+    return tknn, elapsed - tknn, status, points[rows]
+
+
+if __name__ == '__main__':
+    vectors = synthetic_vectors(count, dim)
+    names = ['lib%d' % i for i in range(count)]
+    params = {'neighbours': 15, 'epochs': epochs, 'warm_epochs': epochs // 4, 'seed': 0}
+    sample = np.random.RandomState(seed).choice(count, min(nsample, count), replace=False)
+    with tempfile.TemporaryDirectory() as modeldir:
+        storedir = modeldir+'/vectors_dim%d' % dim
+        write_vector_store(storedir, names, vectors)
+        store = VectorStore(storedir)
+        tknn, tlayout, status, points = timed_projection(store, modeldir, params, False)
+        print("%d vectors: kNN graph %.1fs, layout %.1fs (%s)" % (count, tknn, tlayout, status))
+        print("neighbour preservation@%d: %.3f" % (k, neighbour_preservation(store.unit_vectors(), points, sample)))
+        binsize = directory_size(project_vectors.map_dir(modeldir, 2, dim))
+        jsonsize = len(json.dumps(dict(zip(names, points.tolist())), indent=2))
+        print("2D map: %.1f MB binary, %.1f MB indent=2 JSON (%.1fx)" % (binsize / 1e6, jsonsize / 1e6, jsonsize / binsize))
+
+        #retraining: the vectors move a bit, 2% of the libraries vanish and 2% are new
+        rng = np.random.RandomState(seed)
+        keep = rng.random_sample(count) >= 0.02
+        nnew = count - int(keep.sum())
+        retrained = unit_rows(np.vstack([vectors[keep] + rng.randn(int(keep.sum()), dim) * 0.05,
+                                         synthetic_vectors(count + nnew, dim)[count:]]))
+        retrainednames = [name for name, kept in zip(names, keep) if kept] + ['new%d' % i for i in range(nnew)]
+        write_vector_store(storedir, retrainednames, retrained)
+        store = VectorStore(storedir)
+        sample = sample[sample < len(retrained)]
+        for warm in (True, False):
+            tknn, tlayout, status, points = timed_projection(store, modeldir, params, warm)
+            print("retrained, %s: layout %.1fs, neighbour preservation@%d: %.3f" % (status, tlayout, k,
+                  neighbour_preservation(store.unit_vectors(), points, sample)))
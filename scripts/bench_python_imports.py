@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Benchmarks the import scanner against the dis-based reference extraction on a synthetic corpus
+# of Python modules, and checks that both agree on every file that compiles.
+
+import random
+import sys
+import time
+
+from extract_imports import dis_python_imports
+from scan_python_imports import scan_python_imports
+
+
+nfiles = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+seed = int(sys.argv[2]) if len(sys.argv) > 2 else 42
+
+MODULES = ['os', 'sys', 're', 'json', 'numpy', 'pandas', 'requests', 'django.db.models', 'flask',
+           'collections.abc', 'os.path', 'tqdm', 'scipy.sparse', 'sklearn.manifold', 'typing']
+NAMES = ['Model', 'path', 'join', 'defaultdict', 'array', 'DataFrame', 'get', 'Flask', 'tqdm', 'List']
+
+
+#star imports are only allowed at module level
+def random_import(rnd, indent=''):
+    kind = rnd.random() * (1.0 if indent == '' else 0.9)
+    if kind < 0.4:
+        return indent + 'import %s\n' % rnd.choice(MODULES)
+    if kind < 0.5:
+        return indent + 'import %s as m%d, %s\n' % (rnd.choice(MODULES), rnd.randint(0, 9), rnd.choice(MODULES))
+    if kind < 0.8:
+        return indent + 'from %s import %s\n' % (rnd.choice(MODULES), ', '.join(rnd.sample(NAMES, 3)))
+    if kind < 0.9:
+        return indent + 'from %s import (\n%s    %s,  # comment\n%s    %s as x,\n%s)\n' % (
+            rnd.choice(MODULES), indent, rnd.choice(NAMES), indent, rnd.choice(NAMES), indent)
+    return indent + 'from %s%s import *\n' % ('.' * rnd.randint(0, 2), rnd.choice(MODULES))
+
+
+def random_function(rnd, name, indent=''):
+    lines = [indent + 'def %s(a, b=None):\n' % name,
+             indent + '    """Docstring mentioning\nimport fake_module\n    on its own line."""\n']
+    for i in range(rnd.randint(5, 40)):
+        if rnd.random() < 0.05:
+            lines.append(random_import(rnd, indent + '    '))
+        lines.append(indent + '    x%d = a.call(%d, "str # not a comment", \'%s\')  # trailing comment\n' % (i, i, rnd.choice(NAMES)))
+    lines.append(indent + '    return x0\n\n')
+    return ''.join(lines)
+
+
+def random_module(rnd):
+    parts = ['#!/usr/bin/env python\n"""Module docstring.\n\nimport nothing_here\n"""\n']
+    parts.extend(random_import(rnd) for _ in range(rnd.randint(2, 20)))
+    parts.append('try:\n    import ujson as json\nexcept ImportError:\n    import json\n\n')
+    for i in range(rnd.randint(1, 15)):
+        if rnd.random() < 0.3:
+            parts.append('class C%d(object):\n    attr = 1\n\n' % i)
+            parts.append(random_function(rnd, 'method%d' % i, '    '))
+        else:
+            parts.append(random_function(rnd, 'func%d' % i))
+    if rnd.random() < 0.2:
+        parts.append('if __name__ == "__main__":\n    import argparse\n    func0(1)\n')
+    return ''.join(parts)
+
+
+def bench(func, corpus):
+    t0 = time.perf_counter()
+    results = []
+    for text in corpus:
+        try:
+            results.append(func(text))
+        except Exception:
+            results.append(None)
+    return results, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    rnd = random.Random(seed)
+    corpus = [random_module(rnd) for _ in range(nfiles)]
+    mb = sum(len(text) for text in corpus) / 1024 / 1024
+    print("Corpus: %d files, %.1f MB" % (nfiles, mb))
+
+    disresults, distime = bench(dis_python_imports, corpus)
+    scanresults, scantime = bench(scan_python_imports, corpus)
+
+    compiled = [(a, b) for a, b in zip(disresults, scanresults) if a is not None]
+    nequal = sum(1 for a, b in compiled if a == b)
+    print("dis:     %.2fs, %.1f MB/s" % (distime, mb / distime))
+    print("scanner: %.2fs, %.1f MB/s" % (scantime, mb / scantime))
+    print("Speedup: %.1fx" % (distime / scantime))
+    print("Identical output on %d/%d compiling files" % (nequal, len(compiled)))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Throughput of batched context queries (see query_engine.py) against one most_similar call per
+# context, as with gensim's KeyedVectors.most_similar (mean of the unit vectors, a scan of the
+# whole vocabulary, then the best topn + #context results without the context), on the vectors
+# of a vector store or on random vectors. Also checks that both return the same libraries.
+#
+# Usage: ./bench_query_engine.py [<vectorstoredir> | <#libraries>] [<#contexts> [<k>]]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from query_engine import QueryEngine, context_csr
+from vector_store import VectorStore, unit_rows
+
+
+source = sys.argv[1] if len(sys.argv) > 1 else '50000'
+ncontexts = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+seed = 42
+
+
+#the per-context loop of gensim's most_similar
+def most_similar(vectors, rows, topn):
+    mean = unit_rows(vectors[rows].mean(axis=0))
+    dists = vectors @ mean
+    best = np.argsort(-dists)[:topn + len(rows)]
+    return [r for r in best if r not in set(rows)][:topn]
+
+
+if __name__ == '__main__':
+    if os.path.isdir(source):
+        store = VectorStore(source)
+    else:
+        import tempfile
+        from vector_store import write_vector_store
+        tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.RandomState(seed)
+        write_vector_store(tmpdir.name+'/vectors', ['lib%d' % i for i in range(int(source))], rng.randn(int(source), 100))
+        store = VectorStore(tmpdir.name+'/vectors')
+    vectors = store.unit_vectors()
+    rng = np.random.RandomState(seed)
+    contexts = [[store.names[r] for r in rng.choice(len(store), rng.randint(1, 30), replace=False)] for _ in range(ncontexts)]
+    print("%d libraries (dim %d), %d contexts, k=%d" % (len(store), store.dim, ncontexts, k))
+
+    engine = QueryEngine(vectors)
+    #warm-up (BLAS initialization, page faults)
+    ids, offsets = context_csr(store, contexts[:100])
+    engine.search(ids, offsets, k)
+    most_similar(vectors, ids[offsets[0]:offsets[1]], k)
+
+    t0 = time.perf_counter()
+    ids, offsets = context_csr(store, contexts)
+    looped = [most_similar(vectors, ids[offsets[i]:offsets[i+1]], k) for i in range(ncontexts)]
+    looptime = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rows, _ = engine.search(*context_csr(store, contexts), k)
+    batchtime = time.perf_counter() - t0
+
+    same = np.mean([set(a) == set(b[b >= 0].tolist()) for a, b in zip(looped, rows)])
+    print("most_similar loop: %7.2fs, %8.0f contexts/s" % (looptime, ncontexts / looptime))
+    print("batched engine:    %7.2fs, %8.0f contexts/s (%.1fx)" % (batchtime, ncontexts / batchtime, looptime / batchtime))
+    print("identical results: %.3f" % same)
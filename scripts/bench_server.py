@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Load test for query_server.py: concurrent clients replay the requests of the VS Code plugin on
+# every editor save (for Java, /mapping/java/modulesForPackages first, then /nearestCategories
+# with 1000 neighbours and /searchByIntent), over keep-alive connections, and the latency
+# percentiles are reported per endpoint.
+#
+# Without a server URL, a synthetic model (with annotations) is generated for every language in a
+# temporary folder, and a server is started on it.
+#
+# Usage: ./bench_server.py [--url http://host:port] [--clients N] [--requests N] [--libraries N] [--workers N]
+
+import argparse
+import asyncio
+import collections
+import gzip
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import numpy as np
+
+from vector_store import vector_store_dir, write_vector_store
+
+
+parser = argparse.ArgumentParser(description='Load test for query_server.py.')
+parser.add_argument('--url', help='server to test (default = start one on a synthetic model)')
+parser.add_argument('--clients', type=int, default=32, help='concurrent clients')
+parser.add_argument('--requests', type=int, default=3000, help='total requests')
+parser.add_argument('--libraries', type=int, default=50000, help='libraries per synthetic model')
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='server worker processes')
+parser.add_argument('--num', type=int, default=1000, help='nearestCategories neighbours')
+parser.add_argument('--seed', type=int, default=42)
+
+categories = ['database', 'web', 'testing', 'logging', 'machine_learning', 'http', 'parsing', 'security',
+              'cli', 'crypto', 'image', 'cloud', 'orm', 'messaging', 'serialization', 'async']
+
+
+def synthetic_datasets(dirname, nlibraries, seed, dim=100):
+    rng = np.random.RandomState(seed)
+    for language in ['java', 'javascript', 'python']:
+        modeldir = os.path.join(dirname, language, 'models')
+        os.makedirs(modeldir)
+        if language == 'java':
+            names = ['org.lib%d:lib%d-module%d' % (i // 4, i // 4, i % 4) for i in range(nlibraries)]
+        else:
+            names = ['lib%d' % i for i in range(nlibraries)]
+        topics = rng.randint(0, len(categories), nlibraries)
+        centers = rng.randn(len(categories), dim)
+        write_vector_store(vector_store_dir(modeldir, dim), names, centers[topics] + rng.randn(nlibraries, dim), language)
+        annotations = {name: {'stars': int(rng.zipf(1.5)), 'usages': int(rng.zipf(1.5)), 'license': ['MIT'],
+                              'description': 'Synthetic library ' + name,
+                              'categories': [categories[topics[i]]] + rng.choice(categories, 2).tolist()}
+                       for i, name in enumerate(names)}
+        with gzip.open(modeldir+'/annotations.json.gz', 'wt') as fd:
+            json.dump(annotations, fd)
+        if language == 'java':
+            with gzip.open(modeldir+'/package_modules.json.gz', 'wt') as fd:
+                json.dump({name.split(':')[0]: name for name in names}, fd)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(host, port, proc, timeout=600):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        if proc.poll() is not None:
+            sys.exit("Server exited with status %d" % proc.returncode)
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    sys.exit("Server did not start")
+
+
+class Client:
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, data=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b'' if data is None else json.dumps(data).encode('utf-8')
+        self.writer.write(('%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % (
+            method, path, self.host, len(body))).encode('latin-1') + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            if key.lower() == 'content-length':
+                length = int(value)
+        payload = await self.reader.readexactly(length)
+        return status, json.loads(payload) if payload else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+#one client: plugin-like sessions until the shared request budget is used up
+async def run_client(host, port, libs, intents, args, budget, latencies, errors, rnd):
+    client = Client(host, port)
+    try:
+        while budget[0] > 0:
+            language = rnd.choice(sorted(libs))
+            context = rnd.sample(libs[language], rnd.randint(3, 15))
+            apilanguage = 'js' if language == 'javascript' else language
+            requests = []
+            if language == 'java':
+                requests.append(('/mapping/java/modulesForPackages', [lib.split(':')[0] + '.Class' for lib in context]))
+            requests.append(('/nearestCategories/%s/%d' % (apilanguage, args.num), context))
+            requests.append(('/searchByIntent/%s' % apilanguage, {'context': context, 'intent': rnd.choice(intents[language])}))
+            for path, data in requests:
+                budget[0] -= 1
+                t0 = time.perf_counter()
+                status, _ = await client.request('POST', path, data)
+                latencies[path.split('/')[1]].append(time.perf_counter() - t0)
+                if status != 200:
+                    errors[status] += 1
+    finally:
+        client.close()
+
+
+async def load_test(host, port, args):
+    client = Client(host, port)
+    libs, intents = {}, {}
+    for language, apilanguage in [('java', 'java'), ('javascript', 'js'), ('python', 'python')]:
+        status, names = await client.request('GET', '/libs/' + apilanguage)
+        if status == 200:
+            libs[language] = names
+            intents[language] = (await client.request('GET', '/intents/' + apilanguage))[1] or ['']
+    client.close()
+    if not libs:
+        sys.exit("The server has no models")
+
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    budget = [args.requests]
+    t0 = time.perf_counter()
+    await asyncio.gather(*[run_client(host, port, libs, intents, args, budget, latencies, errors, random.Random(args.seed + c))
+                           for c in range(args.clients)])
+    elapsed = time.perf_counter() - t0
+
+    total = sum(len(l) for l in latencies.values())
+    print("%d requests by %d clients in %.1fs: %.0f requests/s, %d errors %s" % (
+        total, args.clients, elapsed, total / elapsed, sum(errors.values()), dict(errors) if errors else ''))
+    print("endpoint             requests    p50(ms)    p90(ms)    p99(ms)    max(ms)")
+    for endpoint, values in sorted(latencies.items()):
+        ms = np.array(values) * 1000
+        print("%-20s %9d %10.1f %10.1f %10.1f %10.1f" % (
+            endpoint, len(ms), np.percentile(ms, 50), np.percentile(ms, 90), np.percentile(ms, 99), ms.max()))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    proc = None
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        print("Generating synthetic models of %d libraries" % args.libraries)
+        synthetic_datasets(tmpdir.name, args.libraries, args.seed)
+        host, port = '127.0.0.1', free_port()
+        proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_server.py'),
+                                 tmpdir.name, '--port', str(port), '--workers', str(args.workers)])
+    try:
+        if proc:
+            asyncio.run(wait_for_server(host, port, proc))
+        asyncio.run(load_test(host, port, args))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
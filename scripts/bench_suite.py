@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Offline benchmark suite of the pipeline on synthetic corpora (see synthetic_corpus.py), at several
+# scales (# projects per language):
+#
+#   extract-<language>        extract_tarballs.py, source files per second
+#   raw-<language>            create_import_dataset.py, projects per second
+#   filter-<language>         filter_import_dataset.py (MinHash dedup), projects per second
+#   vocab-<language>          build_corpus of train_vectors.py, projects per second
+#   cooccurrence-<language>   the co-occurrence index of the projects (see cooccurrence.py), projects per second
+#   pairs-<language>          one epoch of randomgrams (see randomgrams.py), pairs per second
+#
+# The pipeline stages run as scripts, and report through their metrics (see instrumentation.py);
+# the training steps run in a separate process per language (only python, java and javascript
+# have a library mapping in train_vectors.py). Every benchmark records its throughput, wall and CPU
+# time and peak RSS. The results are written as JSON, and compared with a baseline (a previous
+# results file): a benchmark regresses when its throughput drops, or its peak RSS grows, by more
+# than the tolerance, and the exit code is then 1, so that upgrades can be gated on it (benchmarks
+# that took less than --min-seconds in the baseline are only reported). Baselines depend on the
+# machine: store one with --update-baseline on the machine that runs the comparisons.
+#
+# Usage: ./bench_suite.py [--scales N,N] [--languages L,L] [--jobs N] [--output results.json]
+#                         [--baseline bench_baseline.json] [--update-baseline] [--tolerance F] [--min-seconds S]
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from instrumentation import peak_rss
+from synthetic_corpus import write_corpus
+
+
+parser = argparse.ArgumentParser(description='Offline benchmark suite of the pipeline on synthetic corpora.')
+parser.add_argument('--scales', default='200,1000', help='# projects per language, comma separated')
+parser.add_argument('--languages', default='python,javascript,java,csharp,php,ruby')
+parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='extraction worker processes')
+parser.add_argument('--per-dataset', type=int, default=1000, help='projects per dataset folder')
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--output', default='bench_results.json')
+parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json'))
+parser.add_argument('--update-baseline', action='store_true', help='store the results as the baseline')
+parser.add_argument('--tolerance', type=float, default=0.2, help='max relative throughput drop and peak RSS growth')
+parser.add_argument('--min-seconds', type=float, default=0.25, help='shorter benchmarks are too noisy to be gated on')
+#internal: runs the training benchmarks of a dataset folder, and prints their results
+parser.add_argument('--training', nargs=2, metavar=('BASEDIR', 'LANGUAGE'), help=argparse.SUPPRESS)
+
+format_version = 1
+training_languages = ['python', 'java', 'javascript']
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+
+
+def result(throughput, unit, wall, cpu, rss, **extra):
+    return dict({'throughput': throughput, 'unit': unit, 'wall_seconds': wall, 'cpu_seconds': cpu, 'peak_rss_bytes': rss}, **extra)
+
+
+#result of a stage script, from its metrics report
+def run_stage(basedir, command, reportname):
+    subprocess.run([sys.executable, os.path.join(scriptdir, command[0])] + command[1:], cwd=scriptdir,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    with open(basedir+'/metrics/'+reportname+'.json') as fd:
+        report = json.load(fd)
+    items, unit = report['items'], report['unit']
+    if report['stage'] == 'filter':
+        items, unit = report['counters']['projects'], 'projects'
+    return result(items / report['wall_seconds'], unit, report['wall_seconds'], report['cpu_seconds'], report['peak_rss_bytes'],
+                  items=items, bytes_per_second=report['bytes_per_second'], skipped=report['skipped'], failed=report['failed'])
+
+
+#{benchmark: result} of the training steps on a processed dataset folder (in this process)
+def training_benchmarks(basedir, language):
+    from cooccurrence import CooccurrenceIndex
+    from randomgrams import RandomgramGenerator, make_sampling_table
+    from train_vectors import build_corpus, config, load_projects
+
+    results = {}
+    projects = list(load_projects(basedir))
+    steps = []
+    def step(name):
+        steps.append((name, time.perf_counter(), time.process_time()))
+
+    step('vocab')
+    lib_dict, filesequences, projectsequences = build_corpus(projects, language, config)
+    step('cooccurrence')
+    cooccurrence = CooccurrenceIndex.build_csr(*projectsequences, vocab_size=len(lib_dict))
+    results['cooccurrence'] = {'pairs': len(cooccurrence)}
+    step('pairs')
+    pairs = RandomgramGenerator(filesequences, len(lib_dict), make_sampling_table(lib_dict, config['sampling_factor']),
+                                window_size=config['window_size'], negative_ratio=config['negative_sampling_ratio'],
+                                cooccurrence=cooccurrence, batch_size=config['batch_size'], seed=config['seed'])
+    npairs = sum(len(batch[0]) for batch in pairs.epoch(0))
+    step('end')
+
+    counts = {'vocab': (len(projects), 'projects'), 'cooccurrence': (len(projects), 'projects'), 'pairs': (npairs, 'pairs')}
+    for (name, wall0, cpu0), (_, wall1, cpu1) in zip(steps, steps[1:]):
+        count, unit = counts[name]
+        #the peak RSS of the process so far
+        results[name] = result(count / (wall1 - wall0), unit, wall1 - wall0, cpu1 - cpu0, peak_rss(), items=count, **results.get(name, {}))
+    results['vocab']['libraries'] = len(lib_dict)
+    return results
+
+
+def bench_language(rootdir, language, nprojects, args):
+    basedir = '%s/%s-%d' % (rootdir, language, nprojects)
+    t0 = time.perf_counter()
+    corpus = write_corpus(basedir, language, nprojects, args.per_dataset, args.seed)
+    print("%s, %d projects: %d files, %.1f MB generated in %.1fs" % (language, nprojects, corpus['files'], corpus['bytes'] / 1e6, time.perf_counter() - t0))
+
+    results = {}
+    results['extract-'+language] = run_stage(basedir, ['extract_tarballs.py', basedir, language, '--no-cache', '--jobs', str(args.jobs)], 'extract-'+language)
+    results['raw-'+language] = run_stage(basedir, ['create_import_dataset.py', basedir], 'raw')
+    results['filter-'+language] = run_stage(basedir, ['filter_import_dataset.py', basedir], 'filter')
+    if language in training_languages:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--training', basedir, language], cwd=scriptdir,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+        for name, training in json.loads(output.decode('utf-8').splitlines()[-1]).items():
+            results[name+'-'+language] = training
+    return results
+
+
+#[(benchmark, result, baseline result, throughput ratio, peak RSS ratio, regressed)]
+def compare(results, baseline, tolerance, minseconds):
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, current, None, None, None, False))
+            continue
+        speed = current['throughput'] / base['throughput'] if base['throughput'] else 1.0
+        memory = current['peak_rss_bytes'] / base['peak_rss_bytes'] if base['peak_rss_bytes'] else 1.0
+        gated = base['wall_seconds'] >= minseconds
+        rows.append((name, current, base, speed, memory, gated and (speed < 1 - tolerance or memory > 1 + tolerance)))
+    return rows
+
+
+def print_results(rows):
+    print("%-32s %14s %-10s %8s %8s %9s %8s" % ('benchmark', 'throughput', 'unit', 'wall [s]', 'RSS [MB]', 'vs base', 'RSS vs'))
+    for name, current, base, speed, memory, regressed in rows:
+        print("%-32s %14.1f %-10s %8.2f %8.0f %9s %8s%s" % (name, current['throughput'], current['unit'] + '/s', current['wall_seconds'],
+              current['peak_rss_bytes'] / 1e6, '%.2fx' % speed if base else 'new', '%.2fx' % memory if base else '',
+              '  REGRESSION' if regressed else ''))
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def write_json(filename, data):
+    with open(filename + '.tmp', 'w') as fd:
+        json.dump(data, fd, indent=2, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.training:
+        print(json.dumps(training_benchmarks(*args.training)))
+        sys.exit(0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        for nprojects in [int(scale) for scale in args.scales.split(',')]:
+            for language in args.languages.split(','):
+                for name, languageresult in bench_language(tmpdirname, language, nprojects, args).items():
+                    results['%d/%s' % (nprojects, name)] = languageresult
+    output = {'version': format_version, 'timestamp': time.time(), 'environment': environment(),
+              'config': {'scales': args.scales, 'jobs': args.jobs, 'per_dataset': args.per_dataset, 'seed': args.seed},
+              'results': results}
+    write_json(args.output, output)
+
+    baseline = {}
+    if os.path.isfile(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        if baseline.get('config') != output['config']:
+            print("Warning: the baseline was run with", baseline.get('config'))
+    rows = compare(results, baseline.get('results', {}), args.tolerance, args.min_seconds)
+    print_results(rows)
+    print("Results written to", args.output)
+    if args.update_baseline:
+        write_json(args.baseline, output)
+        print("Baseline written to", args.baseline)
+    elif baseline:
+        regressions = [row[0] for row in rows if row[5]]
+        print("%d of %d benchmarks regressed by more than %d%% against %s" % (len(regressions), len(rows), 100 * args.tolerance, args.baseline))
+        sys.exit(1 if regressions else 0)
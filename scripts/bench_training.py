@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Compares the training engines of train_vectors.py on a synthetic dataset with planted topics:
+# every project uses the libraries of one or two topics, so a library's nearest neighbours should
+# be libraries of its own topic. Reports pairs/second per engine, the neighbour precision@10
+# (the fraction of the 10 nearest neighbours in the same topic), and the overlap between the
+# neighbours of the engines. The keras engine is skipped when keras is not installed.
+#
+# Usage: ./bench_training.py [<#projects> [<epochs> [<#jobs>]]]
+
+import random
+import sys
+import time
+
+import numpy as np
+
+import train_vectors
+
+
+nprojects = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+epochs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+jobs = int(sys.argv[3]) if len(sys.argv) > 3 else train_vectors.config['jobs']
+ntopics = 40
+topicsize = 25
+seed = 42
+
+
+#Zipf-distributed libraries of a topic, with a small chance of an unrelated one
+def random_file(rnd, topic):
+    libs = ['lib%d_%d' % (topic, min(int(rnd.paretovariate(0.7)), topicsize) - 1) for _ in range(rnd.randint(1, 8))]
+    if rnd.random() < 0.1:
+        libs.append('lib%d_%d' % (rnd.randrange(ntopics), rnd.randrange(topicsize)))
+    return libs
+
+
+def random_projects(rnd):
+    for idx in range(nprojects):
+        topics = rnd.sample(range(ntopics), rnd.randint(1, 2))
+        yield 'project%d' % idx, {'f%d.py' % i: [l + '.x' for l in random_file(rnd, rnd.choice(topics))]
+                                  for i in range(rnd.randint(1, 10))}
+
+
+#indices of the k nearest (cosine) neighbours of every vector
+def neighbours(vectors, k=10):
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-8)
+    similarities = unit @ unit.T
+    np.fill_diagonal(similarities, -np.inf)
+    return np.argsort(-similarities, axis=1)[:, :k]
+
+
+def precision(nn, topics):
+    return (topics[nn] == topics[:, None]).mean()
+
+
+def overlap(nn1, nn2):
+    return np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(nn1.tolist(), nn2.tolist())])
+
+
+if __name__ == '__main__':
+    config = dict(train_vectors.config, epochs=epochs, vector_dim=32, window_size=20)
+    lib_dict, filesequences, projectsequences = train_vectors.build_corpus(random_projects(random.Random(seed)), 'python', config)
+    topics = np.array([int(name[3:].split('_')[0]) for name in lib_dict])
+    npairs = train_vectors.RandomgramGenerator(filesequences, len(lib_dict), window_size=config['window_size'],
+                                               negative_ratio=config['negative_sampling_ratio']).epoch_pairs() * epochs
+    print("%d libraries in %d topics, %d files, %d pairs in %d epochs" % (
+        len(lib_dict), ntopics, len(filesequences[1]) - 1, npairs, epochs))
+
+    engines = [('hogwild', 1), ('hogwild', jobs)] if jobs > 1 else [('hogwild', 1)]
+    try:
+        import keras
+        engines.append(('keras', 1))
+    except ImportError:
+        print("keras is not installed, skipping the keras engine")
+
+    results = {}
+    for engine, enginejobs in engines:
+        t0 = time.perf_counter()
+        vectors = train_vectors.train(lib_dict, filesequences, projectsequences, config, engine, enginejobs)
+        elapsed = time.perf_counter() - t0
+        results[engine, enginejobs] = (elapsed, neighbours(vectors))
+
+    print()
+    print("engine      jobs   time(s)      pairs/s  precision@10")
+    for (engine, enginejobs), (elapsed, nn) in results.items():
+        print("%-10s %5d %9.1f %12.0f %13.3f" % (engine, enginejobs, elapsed, npairs / elapsed, precision(nn, topics)))
+    if ('keras', 1) in results:
+        for (engine, enginejobs), (elapsed, nn) in results.items():
+            if engine != 'keras':
+                print("neighbour overlap %s(%d) / keras: %.3f" % (engine, enginejobs, overlap(nn, results['keras', 1][1])))
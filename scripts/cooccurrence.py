@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Sparse co-occurrence index of library pairs, replacing the dense vocab*(vocab-1)/2 bitarray used
+# for true negative sampling. Every observed pair (i, j), i < j, is packed into the 64-bit key
+# i << 32 | j, and the keys are kept in one sorted, deduplicated array, so memory is proportional
+# to the number of observed pairs. Membership queries are batched binary searches.
+#
+# Usage: ./cooccurrence.py <columnsdir>   (indexes the import co-occurrences per project of a
+#                                          columnar dataset, see import_columns.py)
+
+import sys
+import time
+
+import numpy as np
+
+
+# max # pair keys buffered before they are merged into the index
+merge_threshold = 1 << 24
+
+
+def pair_keys(i, j):
+    i = np.asarray(i, dtype=np.uint64)
+    j = np.asarray(j, dtype=np.uint64)
+    return (np.minimum(i, j) << np.uint64(32)) | np.maximum(i, j)
+
+
+#all within-row pairs of equally long rows (an (r, n) matrix), vectorized over the rows
+def matrix_pair_keys(rows):
+    rows = np.sort(rows, axis=1).astype(np.uint64)
+    i, j = np.triu_indices(rows.shape[1], 1)
+    first, second = rows[:, i].ravel(), rows[:, j].ravel()
+    #duplicate ids within a row do not make a pair
+    keep = first != second
+    return (first[keep] << np.uint64(32)) | second[keep]
+
+
+#sorts and deduplicates in place; stable (tim)sort merges the sorted runs of concatenated arrays in linear time
+def sorted_unique(keys):
+    keys.sort(kind='stable')
+    if len(keys) < 2:
+        return keys
+    keep = np.empty(len(keys), dtype=bool)
+    keep[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=keep[1:])
+    return keys[keep]
+
+
+class CooccurrenceIndex:
+
+    def __init__(self, keys=None, vocab_size=0):
+        self.keys = np.zeros(0, dtype=np.uint64) if keys is None else keys
+        self.vocab_size = max(vocab_size, self.max_id() + 1)
+
+    #sequences: iterable of id sequences (e.g. the lib_ids of every project)
+    @classmethod
+    def build(cls, sequences, vocab_size=0):
+        index = cls(vocab_size=vocab_size)
+        pending = {}
+        npending = 0
+        buffered = []
+        nbuffered = 0
+        for sequence in sequences:
+            if len(sequence) < 2:
+                continue
+            #rows are grouped by length, and each group is expanded in one go
+            group = pending.setdefault(len(sequence), [])
+            group.append(sequence)
+            npending += len(sequence) * (len(sequence) - 1) // 2
+            if npending >= merge_threshold:
+                buffered.extend(matrix_pair_keys(np.array(rows)) for rows in pending.values())
+                nbuffered += npending
+                pending = {}
+                npending = 0
+            if nbuffered >= merge_threshold:
+                index.merge(buffered)
+                buffered = []
+                nbuffered = 0
+        buffered.extend(matrix_pair_keys(np.array(rows)) for rows in pending.values())
+        index.merge(buffered)
+        return index
+
+    #CSR input: the ids of row r are ids[offsets[r]:offsets[r+1]]
+    @classmethod
+    def build_csr(cls, ids, offsets, vocab_size=0):
+        return cls.build((ids[offsets[r]:offsets[r+1]] for r in range(len(offsets) - 1)), vocab_size)
+
+    def merge(self, keyarrays):
+        if keyarrays:
+            self.keys = sorted_unique(np.concatenate([self.keys, sorted_unique(np.concatenate(keyarrays))]))
+        self.vocab_size = max(self.vocab_size, self.max_id() + 1)
+
+    #the larger id of a pair is in the low bits
+    def max_id(self):
+        return int((self.keys & np.uint64(0xFFFFFFFF)).max()) if len(self.keys) > 0 else -1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def nbytes(self):
+        return self.keys.nbytes
+
+    #batched membership: True where libraries i and j co-occur (a library never co-occurs with itself)
+    def contains(self, i, j):
+        queries = pair_keys(i, j)
+        if len(self.keys) == 0:
+            return np.zeros(queries.shape, dtype=bool)
+        pos = np.searchsorted(self.keys, queries)
+        found = self.keys[np.minimum(pos, len(self.keys) - 1)] == queries
+        return found & (np.asarray(i) != np.asarray(j))
+
+    def __contains__(self, pair):
+        return bool(self.contains(pair[0], pair[1]))
+
+    #redraws the negative samples that co-occur with their target until none do (or max_rounds)
+    #returns (negatives, # conflicts)
+    def resample_negatives(self, targets, negatives, rng, vocab_size=None, max_rounds=100):
+        vocab_size = vocab_size or self.vocab_size
+        negatives = np.array(negatives)
+        conflicts = 0
+        todo = np.nonzero(self.contains(targets, negatives))[0]
+        for _ in range(max_rounds):
+            if len(todo) == 0:
+                break
+            conflicts += len(todo)
+            negatives[todo] = rng.randint(0, vocab_size, size=len(todo))
+            todo = todo[self.contains(np.asarray(targets)[todo], negatives[todo])]
+        return negatives, conflicts
+
+    def save(self, filename):
+        np.save(filename, self.keys)
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        return cls(np.load(filename, mmap_mode='r' if mmap else None))
+
+
+if __name__ == '__main__':
+    from import_columns import ImportColumns
+
+    columns = ImportColumns(sys.argv[1])
+    vocab_size = len(columns.imports)
+
+    t0 = time.perf_counter()
+    index = CooccurrenceIndex.build((np.unique(ids) for _, ids in columns.iter_projects()), vocab_size)
+    t1 = time.perf_counter()
+
+    rng = np.random.RandomState(0)
+    i, j = rng.randint(0, vocab_size, size=(2, 1000000))
+    found = index.contains(i, j)
+    t2 = time.perf_counter()
+
+    print("%d libraries, %d co-occurring pairs: %.1f MB (dense bitarray: %.1f MB)" % (
+        vocab_size, len(index), index.nbytes()/1024/1024, vocab_size*(vocab_size-1)/2/8/1024/1024))
+    print("built in %.2fs, %.0f random pair queries/s (%.2f%% co-occurring)" % (
+        t1 - t0, len(i)/(t2 - t1), 100.0*found.mean()))
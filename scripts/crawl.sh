@@ -14,7 +14,7 @@ basedir=../datasets/$language
 mkdir -p $basedir
 
 if [ $usecache -eq 0 ] ; then
-	rm -rf $basedir/dataset*/
+	rm -rf $basedir/dataset*/ $basedir/gitGrab.checkpoint.jsonl $basedir/download_state.jsonl
 fi
 
 #check for gitGrab file
@@ -22,13 +22,5 @@ if [ $usecache -eq 0 -o ! -f $basedir/gitGrab.json ] ; then
 	./gitgrab.py $basedir $language fast $maxprojects $minstars $maxsize
 fi
 
-#check for download scripts
-if [ $usecache -eq 0 -o ! -f $basedir/crawl_dataset01.sh ] ; then
-	./create_crawl_scripts.py $basedir
-fi
-
-#download all
-cd $basedir
-for f in $(ls ./crawl_dataset*.sh) ; do
-	$f
-done
+#download all (resumes an interrupted download)
+./download_tarballs.py $basedir
@@ -4,45 +4,142 @@
 # Licensed under the BSD 3-Clause License
 
 
-import gzip
+# Collects the <project>.json import files of every datasetNN folder into a raw/raw-import-dsNN
+# shard, streaming one project per record (see import_dataset.py), with --jobs shards in parallel.
+#
+# The project files (and their hashes) of every shard are recorded in the manifest (see
+# manifest.py). With --incremental, the shards whose project files are unchanged are skipped, and
+# the unchanged blocks (see import_dataset.py) of the other shards are copied from the previous shards.
+#
+# Reports the throughput, the slowest project files and the unreadable ones to
+# <basedir>/metrics/raw.json (see instrumentation.py).
+
+import argparse
 import json
 import glob
+from multiprocessing import Pool
 from tqdm import tqdm
 import re
-import sys
 import os
+import time
+
+from instrumentation import StageMetrics
+from import_dataset import ShardWriter, project_line, raw_dataset_file, read_block, split_blocks
+from manifest import cached_sha1, digest, file_stat, load_manifest, save_manifest
+
+
+parser = argparse.ArgumentParser(description='Collect the extracted project imports into raw dataset shards.')
+parser.add_argument('basedir', nargs='?', default='../datasets/python')
+parser.add_argument('--jobs', type=int, default=1, help='number of shards to build in parallel (default = 1)')
+parser.add_argument('--incremental', action='store_true', help='only rebuild the shards with new or changed projects (see manifest.py)')
 
-basedir = sys.argv[1] if len(sys.argv) > 1 else '../datasets/python'
 
-os.makedirs(basedir+'/raw', exist_ok=True)
+def list_project_files(basedir, dsidx):
+    return sorted(glob.iglob(basedir+'/dataset%02d/**/*.json'%dsidx, recursive=True))
 
-def dump_ds(projectfileimports, dsidx):
-    with gzip.open(basedir+'/raw/raw-import-ds%02d.json.gz'%dsidx, 'w') as fd:
-        fd.write(json.dumps(projectfileimports, sort_keys=True, indent=2).encode('utf-8'))
 
+#metrics of the stage (or of a worker process, returned per shard)
+metrics = None
 
-def load_ds(dsidx):
-    projectfileimports = {}
-    for p in tqdm(glob.iglob(basedir+'/dataset%02d/**/*.json'%dsidx, recursive=True)):
+
+#yields the projects of a dataset folder, in sorted order, one at a time
+def load_ds(basedir, dsidx, progress=True, projectfiles=None):
+    projectfiles = list_project_files(basedir, dsidx) if projectfiles is None else projectfiles
+    for p in tqdm(projectfiles, disable=not progress):
         projectname = p[:-5]
+        t0 = time.perf_counter()
         try:
             with open(p, 'r') as fd:
-                projectfileimports[projectname] = json.loads(fd.read())
-        except:
+                text = fd.read()
+            fileimports = json.loads(text)
+        except (OSError, ValueError) as e:
             print('Problem with', p)
-    return projectfileimports
+            metrics.fail(type(e).__name__)
+            continue
+        metrics.item(p[len(basedir)+1:], len(text), time.perf_counter() - t0)
+        yield projectname, fileimports
+
+
+#(# projects, manifest entry) of a shard, rebuilt unless its project files are unchanged (incremental)
+#the blocks of unchanged project files are copied from the previous shard
+def dump_ds(basedir, dsidx, progress=True, incremental=False, oldentry=None, outputs={}):
+    rawfile = raw_dataset_file(basedir, dsidx)
+    projectfiles = list_project_files(basedir, dsidx)
+    #paths relative to basedir (as in the manifest), as the files are globbed below basedir/datasetNN/
+    names = ['dataset%02d/' % dsidx + p[len(basedir+'/dataset%02d/' % dsidx):] for p in projectfiles]
+    hashes = [cached_sha1(p, outputs.get(name)) for p, name in zip(projectfiles, names)]
+    ranges = split_blocks([p[:-5] for p in projectfiles])
+    digests = [digest(list(zip(names[start:end], hashes[start:end]))) for start, end in ranges]
+    entry = {'file': os.path.relpath(rawfile, basedir), 'digest': digest(digests), 'projects': len(projectfiles)}
+    previous = incremental and oldentry is not None and os.path.isfile(rawfile) and file_stat(rawfile) == oldentry['stat']
+    if previous and oldentry['digest'] == entry['digest']:
+        metrics.skip('unchanged', len(projectfiles))
+        return None, oldentry
+    oldblocks = {block[0]: block for block in oldentry['blocks']} if previous else {}
+
+    writer = ShardWriter(rawfile)
+    blocks = []
+    nprojects = 0
+    for (start, end), blockdigest in tqdm(list(zip(ranges, digests)), disable=not progress):
+        if blockdigest in oldblocks:
+            _, offset, length, count = oldblocks[blockdigest]
+            blocks.append([blockdigest] + writer.copy_block(read_block(rawfile, [offset, length])[0]) + [count])
+            metrics.skip('unchanged', count)
+            metrics.count('copied_blocks')
+        else:
+            count = 0
+            for project, fileimports in load_ds(basedir, dsidx, False, projectfiles[start:end]):
+                writer.write(project_line(project, fileimports))
+                count += 1
+            blocks.append([blockdigest] + writer.end_block() + [count])
+        nprojects += count
+    writer.close()
+    return nprojects, dict(entry, blocks=blocks, stat=file_stat(rawfile))
+
+
+#the stage metrics are passed to the workers also when they are spawned rather than forked
+def init_worker(stagemetrics):
+    global metrics
+    metrics = stagemetrics
+    metrics.init_worker()
+
+
+def dump_ds_task(task):
+    basedir, dsidx, incremental, oldentry, outputs = task
+    return (dsidx,) + dump_ds(basedir, dsidx, False, incremental, oldentry, outputs) + (metrics.partial(),)
+
 
+def list_datasets(basedir):
+    dsidx = 1
+    while os.path.isdir(basedir+"/dataset%02d/"%dsidx):
+        yield dsidx
+        dsidx += 1
 
-dsidx = 1
-while True:
-    if not os.path.isdir(basedir+"/dataset%02d/"%dsidx):
-        #print("Folder dataset%02d does not exist"%dsidx, file=sys.stderr)
-        sys.exit(0)
 
-    print("Loading ds",dsidx)
-    projectfileimports = load_ds(dsidx)
-    print("Dumping ds",dsidx)
-    dump_ds(projectfileimports, dsidx)
-    
-    dsidx += 1
+if __name__ == '__main__':
+    args = parser.parse_args()
+    os.makedirs(args.basedir+'/raw', exist_ok=True)
+    dslist = list(list_datasets(args.basedir))
+    manifest = load_manifest(args.basedir)
+    #recorded hashes of the extracted project files
+    outputs = {entry['output']['file']: entry['output'] for entry in manifest['projects'].values() if entry.get('output')}
+    metrics = StageMetrics('raw', 'projects')
 
+    if args.jobs > 1:
+        with Pool(min(args.jobs, max(1, len(dslist))), init_worker, (metrics,)) as pool:
+            tasks = [(args.basedir, dsidx, args.incremental, manifest['raw'].get('%02d'%dsidx), outputs) for dsidx in dslist]
+            for dsidx, nprojects, entry, partial in tqdm(pool.imap_unordered(dump_ds_task, tasks), total=len(tasks)):
+                metrics.merge(partial)
+                manifest['raw']['%02d'%dsidx] = entry
+                if nprojects is None:
+                    print("Skipped unchanged ds", dsidx)
+                else:
+                    print("Dumped ds", dsidx, "with", nprojects, "projects")
+    else:
+        for dsidx in dslist:
+            print("Dumping ds", dsidx)
+            nprojects, manifest['raw']['%02d'%dsidx] = dump_ds(args.basedir, dsidx, True, args.incremental,
+                                                               manifest['raw'].get('%02d'%dsidx), outputs)
+            print("unchanged" if nprojects is None else "%d projects" % nprojects)
+    save_manifest(args.basedir, manifest)
+    metrics.write(args.basedir)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Downloads the tarballs of the projects of gitGrab.json, most starred first, into
+# dataset<NN>/<owner>/<project>.tgz (10000 projects per dataset), with a pool of concurrent
+# workers sharing keep-alive connections. API requests wait for a token of a bucket driven by the
+# rate limit headers (see gitgrab.py), which is blocked until the reset time when the limit is
+# exceeded; other failures are retried with exponential backoff. Tarballs are streamed to a
+# .part file, checked to be complete gzip data while they arrive, and renamed when verified.
+#
+# The outcome of every project is appended to download_state.jsonl, so that a restarted download
+# skips the downloaded projects and those that failed permanently (unless --retry-errors); the
+# .tgz and .tgz.error files of earlier crawl scripts are honoured too.
+#
+# Usage: ./download_tarballs.py [<basedir>] [--jobs N] [--maxprojects N] [--api-url URL]
+#                               [--retry-errors] [--metrics <file.json>]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+import numpy as np
+from tqdm import tqdm
+
+from async_http import HTTPClient, split_url
+from gitgrab import TokenBucket
+
+
+parser = argparse.ArgumentParser(description='Download the tarballs of the projects of gitGrab.json.')
+parser.add_argument('basedir', nargs='?', default='../datasets/python')
+parser.add_argument('--jobs', type=int, default=16, help='concurrent downloads')
+parser.add_argument('--maxprojects', type=int, default=0, help='max # projects (default = 0: all)')
+parser.add_argument('--api-url', default='https://api.github.com')
+parser.add_argument('--retry-errors', action='store_true', help='retry the projects that failed permanently')
+parser.add_argument('--metrics', help='write the throughput metrics to a json file')
+
+# projects per dataset directory
+dataset_size = 10000
+# download attempts before a project fails
+max_attempts = 8
+# max backoff after a failure (seconds)
+max_backoff = 120
+max_redirects = 5
+
+
+class DownloadError(Exception):
+    pass
+
+
+#a failure that is not worth retrying (e.g. a deleted or blocked repository)
+class PermanentError(DownloadError):
+    pass
+
+
+#streams a response body to a .part file, checking that it is complete gzip data
+class TarballSink:
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.valid = True
+        self.size = 0
+        self.head = b''
+
+    def __call__(self, data):
+        self.file.write(data)
+        self.size += len(data)
+        if len(self.head) < 1024:
+            self.head += data[:1024]
+        if self.valid:
+            try:
+                #the output is only checked, in bounded pieces
+                self.decompressor.decompress(data, 1 << 16)
+                while self.decompressor.unconsumed_tail:
+                    self.decompressor.decompress(self.decompressor.unconsumed_tail, 1 << 16)
+            except zlib.error:
+                self.valid = False
+
+    def close(self):
+        self.file.close()
+        return self.valid and self.decompressor.eof
+
+
+class Metrics:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.counts = {'downloaded': 0, 'failed': 0, 'skipped': 0, 'retries': 0, 'rate_limited': 0, 'corrupt': 0}
+        self.bytes = 0
+        self.durations = []
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        durations = np.array(self.durations or [0])
+        return dict(self.counts, bytes=self.bytes, seconds=round(elapsed, 3),
+                    projects_per_second=round(self.counts['downloaded'] / elapsed, 3),
+                    megabytes_per_second=round(self.bytes / elapsed / 1e6, 3),
+                    download_seconds_p50=round(float(np.percentile(durations, 50)), 3),
+                    download_seconds_p95=round(float(np.percentile(durations, 95)), 3))
+
+
+class Downloader:
+
+    def __init__(self, basedir, args, apikey):
+        self.basedir = basedir
+        self.args = args
+        self.statefile = basedir+'/download_state.jsonl'
+        self.headers = {'User-Agent': 'code-compass-downloader'}
+        if apikey:
+            self.headers['Authorization'] = 'token ' + apikey
+        self.apiurl = args.api_url.rstrip('/')
+        self.clients = {}
+        self.bucket = TokenBucket(5000, 3600)
+        self.metrics = Metrics()
+
+    #connection pool of a server (only the API gets the API key)
+    def client(self, baseurl):
+        if baseurl not in self.clients:
+            headers = self.headers if baseurl == self.apiurl else {'User-Agent': self.headers['User-Agent']}
+            self.clients[baseurl] = HTTPClient(baseurl, headers, connections=self.args.jobs)
+        return self.clients[baseurl]
+
+    #downloads a tarball to a verified file, following redirects
+    async def fetch(self, project, filename):
+        url = '%s/repos/%s/tarball' % (self.apiurl, project)
+        for _ in range(max_redirects):
+            baseurl, target = split_url(url)
+            if baseurl == self.apiurl:
+                await self.bucket.acquire()
+            sink = TarballSink(filename + '.part')
+            try:
+                response = await self.client(baseurl).get(target, sink=sink)
+            finally:
+                valid = sink.close()
+            if baseurl == self.apiurl:
+                self.bucket.update(response.headers)
+            if response.status in (301, 302, 303, 307, 308):
+                url = response.headers['location']
+                if url.startswith('/'):
+                    url = baseurl + url
+                continue
+            if response.status == 200:
+                if not valid:
+                    self.metrics.counts['corrupt'] += 1
+                    raise DownloadError("incomplete or invalid gzip data")
+                os.replace(filename + '.part', filename)
+                return sink.size
+            os.remove(filename + '.part')
+            if response.status in (403, 429) and ('retry-after' in response.headers or
+                                                  response.headers.get('x-ratelimit-remaining') == '0'):
+                if 'retry-after' in response.headers:
+                    self.bucket.block(time.time() + int(response.headers['retry-after']))
+                self.metrics.counts['rate_limited'] += 1
+                return None
+            message = "HTTP %d %s" % (response.status, sink.head[:200].decode('utf-8', 'replace'))
+            if response.status in (403, 404, 410, 451):
+                raise PermanentError(message)
+            raise DownloadError(message)
+        raise PermanentError("too many redirects")
+
+    #(status, size or error message) of a project
+    async def download(self, project, filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        attempt = 0
+        while True:
+            try:
+                size = await self.fetch(project, filename)
+                if size is not None:
+                    return 'done', size
+                #rate limited requests are not failures
+                continue
+            except PermanentError as e:
+                return 'error', str(e)
+            except (DownloadError, OSError, EOFError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                error = str(e) or repr(e)
+            attempt += 1
+            if attempt == max_attempts:
+                if os.path.isfile(filename + '.part'):
+                    os.remove(filename + '.part')
+                return 'error', error
+            self.metrics.counts['retries'] += 1
+            await asyncio.sleep(min(max_backoff, 2 ** attempt) * random.uniform(0.5, 1))
+
+    def record(self, entry):
+        with open(self.statefile, 'a', encoding='utf-8') as fd:
+            fd.write(json.dumps(entry) + '\n')
+
+    async def worker(self, queue, progress):
+        while queue:
+            project, filename = queue.pop(0)
+            t0 = time.perf_counter()
+            status, result = await self.download(project, filename)
+            if status == 'done':
+                self.metrics.counts['downloaded'] += 1
+                self.metrics.bytes += result
+                self.metrics.durations.append(time.perf_counter() - t0)
+                self.record({'project': project, 'file': os.path.relpath(filename, self.basedir), 'status': status, 'bytes': result})
+            else:
+                self.metrics.counts['failed'] += 1
+                tqdm.write("Skipping project %s: %s" % (project, result))
+                self.record({'project': project, 'file': os.path.relpath(filename, self.basedir), 'status': status, 'error': result})
+            progress.update(1)
+            progress.set_postfix(MBps='%.2f' % (self.metrics.bytes / (time.perf_counter() - self.metrics.start) / 1e6),
+                                 failed=self.metrics.counts['failed'])
+
+    async def run(self, projects):
+        failed = read_state(self.statefile)
+        queue = []
+        for project, filename in projects:
+            #tarballs are only renamed into place when verified
+            if os.path.isfile(filename):
+                self.metrics.counts['skipped'] += 1
+            elif (project in failed or os.path.isfile(filename + '.error')) and not self.args.retry_errors:
+                self.metrics.counts['skipped'] += 1
+            else:
+                queue.append((project, filename))
+        with tqdm(total=len(queue)) as progress:
+            await asyncio.gather(*[self.worker(queue, progress) for _ in range(self.args.jobs)])
+        for client in self.clients.values():
+            client.close()
+
+
+#the projects that failed permanently, according to a state log (the last entry of a project wins)
+def read_state(filename):
+    states = {}
+    if os.path.isfile(filename):
+        with open(filename, encoding='utf-8') as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    #a line cut by a crash
+                    continue
+                states[entry['project']] = entry['status']
+    return set(p for p, status in states.items() if status == 'error')
+
+
+#[(project, tarball file)] of the projects of gitGrab.json, most starred first
+def tarball_files(basedir, maxprojects=0):
+    with open(basedir+'/gitGrab.json', 'rt') as fd:
+        gitgrabs = sorted(json.loads(fd.read()), key=lambda x: -x['stars'])
+    if maxprojects:
+        gitgrabs = gitgrabs[:maxprojects]
+    return [(gitgrab['full_name'], '%s/dataset%02d/%s.tgz' % (basedir, 1 + i // dataset_size, gitgrab['full_name']))
+            for i, gitgrab in enumerate(gitgrabs)]
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    APIKEY = ''
+    if os.path.isfile('apikey.txt'):
+        with open('apikey.txt', 'r') as fd:
+            APIKEY = fd.read().rstrip()
+    #a mock API needs no key
+    if not APIKEY and args.api_url == parser.get_default('api_url'):
+        print("Please first paste your API key in file apikey.txt!")
+        sys.exit(1)
+
+    downloader = Downloader(args.basedir, args, APIKEY)
+    try:
+        asyncio.run(downloader.run(tarball_files(args.basedir, args.maxprojects)))
+    finally:
+        metrics = downloader.metrics.report()
+        print("%(downloaded)d downloaded, %(failed)d failed, %(skipped)d skipped in %(seconds).1fs: "
+              "%(projects_per_second).1f projects/s, %(megabytes_per_second).2f MB/s, "
+              "%(retries)d retries, %(rate_limited)d rate limited" % metrics)
+        if args.metrics:
+            with open(args.metrics, 'w') as fd:
+                json.dump(metrics, fd, indent=2)
@@ -5,19 +5,28 @@
 
 
 import dis
+import functools
+import io
 import sys
 from pprint import pprint
 import glob
 import json
 from tqdm import tqdm
 import re
+import os
+import fnmatch
+import subprocess
+import tarfile
+import zipfile
+from scan_python_imports import scan_python_imports
+from scan_js_imports import scan_js_imports, scan_stats
+from extraction_cache import ExtractionCache
 
 
-folder = sys.argv[1] if len(sys.argv) > 1 else '.'
-language = sys.argv[2] if len(sys.argv) > 2 else 'python'
-
 ###################
 
+COMMENT_OR_STRING = r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"'
+
 # Note: method to remove comments in lightweight fashion was copied from:
 # ChunMinChang/remove_c_style_comments.py See https://gist.github.com/ChunMinChang/88bfa5842396c1fbbc5b
 def commentRemover(text):
@@ -28,7 +37,7 @@ def commentRemover(text):
         else:
             return s
     pattern = re.compile(
-        r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"',
+        COMMENT_OR_STRING,
         re.DOTALL | re.MULTILINE
     )
     return re.sub(pattern, replacer, text)
@@ -36,22 +45,285 @@ def commentRemover(text):
 
 ##############
 
+# All extractors take their sources as an iterable of (path, data) pairs, with data either bytes
+# or str: e.g. tar members, zip entries, git blobs or an in-memory dict's items(). Data can also be
+# a binary file object, which is only valid until the next pair is requested (folders are walked
+# like this, so that header scanning does not need to read files in full). For backwards
+# compatibility, a folder name is still accepted too and is then walked on disk.
+
+#matches a (relative) source path against an extension pattern the way glob '**/'+ext does:
+#case-sensitive, and skipping hidden files and folders
+def match_source_path(path, ext):
+    parts = path.split('/')
+    if any(part.startswith('.') for part in parts if part not in ('', '.', '..')):
+        return False
+    return fnmatch.fnmatchcase(parts[-1], ext)
+
+
+def match_source_patterns(path, patterns):
+    return any(match_source_path(path, ext) for ext in patterns)
+
+
+#mimics open(fname, 'r', errors='ignore'), including universal newlines
+def decode_source(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='ignore')
+    return data.replace('\r\n', '\n').replace('\r', '\n')
+
+
+#skipped (unreadable or unparsable) source files per reason
+skip_stats = {}
+
+
+def skip_file(fname, reason):
+    reason = reason if isinstance(reason, str) else type(reason).__name__
+    skip_stats[reason] = skip_stats.get(reason, 0) + 1
+    #print("Skipping problematic file", fname, reason, file=sys.stderr)
+
+
+def strip_root(name, strip=1):
+    if name.startswith('./'):
+        name = name[2:]
+    return "/".join(name.split("/")[strip:])
+
+
+#generator helper functions yielding (path, bytes) pairs
+
+def iter_folder_sources(folder, patterns):
+    for ext in patterns:
+        for fname in glob.iglob(folder+'/**/'+ext, recursive=True):
+            try:
+                with open(fname, 'rb') as fd:
+                    yield (strip_path_prefix(fname), fd)
+            except OSError as e:
+                skip_file(fname, e)
+                continue
+
+
+#strip=1 drops the <owner>-<project>-<sha> root folder of GitHub tarballs and zipballs
+def iter_tarball_sources(tarname, patterns=None, strip=1):
+    with tarfile.open(tarname, 'r|*') as tar:
+        for member in tar:
+            name = strip_root(member.name, strip)
+            if member.isfile() and (patterns is None or match_source_patterns(name, patterns)):
+                yield (name, tar.extractfile(member).read())
+
+
+def iter_zip_sources(zipname, patterns=None, strip=1):
+    with zipfile.ZipFile(zipname) as zf:
+        for info in zf.infolist():
+            name = strip_root(info.filename, strip)
+            if not info.is_dir() and (patterns is None or match_source_patterns(name, patterns)):
+                yield (name, zf.read(info))
+
+
+#reads the blobs of a git tree through a single 'git cat-file --batch' process
+def iter_git_sources(repodir, patterns=None, rev='HEAD'):
+    tree = subprocess.run(['git', '-C', repodir, 'ls-tree', '-r', '-z', rev],
+                          stdout=subprocess.PIPE, check=True).stdout.decode('utf-8', errors='ignore')
+    blobs = []
+    for entry in tree.split('\0'):
+        if not entry:
+            continue
+        info, name = entry.split('\t', 1)
+        mode, objtype, sha = info.split()
+        if objtype == 'blob' and mode != '120000' and (patterns is None or match_source_patterns(name, patterns)):
+            blobs.append((name, sha))
+    if not blobs:
+        return
+
+    with subprocess.Popen(['git', '-C', repodir, 'cat-file', '--batch'],
+                          stdin=subprocess.PIPE, stdout=subprocess.PIPE) as proc:
+        for name, sha in blobs:
+            proc.stdin.write(sha.encode() + b'\n')
+            proc.stdin.flush()
+            size = int(proc.stdout.readline().split()[2])
+            data = proc.stdout.read(size)
+            proc.stdout.read(1)
+            yield (name, data)
+        proc.stdin.close()
+
+
+#opens a folder, tarball, zip archive or git repository as a source iterable
+def open_sources(path, language):
+    patterns = source_patterns.get(language, [])
+    if os.path.isdir(path + '/.git') or path.endswith('.git'):
+        return iter_git_sources(path, patterns)
+    if os.path.isdir(path):
+        return iter_folder_sources(path, patterns)
+    if zipfile.is_zipfile(path):
+        return iter_zip_sources(path, patterns)
+    return iter_tarball_sources(path, patterns)
+
+
+#generator helper function
+def read_sources(sources, ext):
+    if isinstance(sources, str):
+        sources = iter_folder_sources(sources, [ext])
+    for fname, data in sources:
+        if match_source_path(fname, ext):
+            yield (fname, decode_source(data.read() if hasattr(data, 'read') else data))
+
+
+#like read_sources, but yields (filename, text file object, size in bytes) for incremental reading
+def open_source_files(sources, ext):
+    if isinstance(sources, str):
+        sources = iter_folder_sources(sources, [ext])
+    for fname, data in sources:
+        if match_source_path(fname, ext):
+            if isinstance(data, str):
+                yield (fname, io.StringIO(data.replace('\r\n', '\n').replace('\r', '\n')), len(data))
+            else:
+                fd = data if hasattr(data, 'read') else io.BytesIO(data)
+                size = len(data) if isinstance(data, bytes) else os.fstat(fd.fileno()).st_size
+                yield (fname, io.TextIOWrapper(fd, encoding='utf-8', errors='ignore'), size)
+
+
 #generator helper function
-def read_uncomment_lines(folder, ext, split=True, removecomments = True):
+def read_uncomment_lines(sources, ext, split=True, removecomments = True):
     comment_remover = commentRemover if removecomments else (lambda x:x)
-    for fname in glob.iglob(folder+'/**/'+ext, recursive=True):
+    for fname, text in read_sources(sources, ext):
         try:
-            with open(fname, 'r', errors='ignore') as fd:
-                if split:
-                    lines = comment_remover(fd.read()).splitlines()
-                else:
-                    lines = [comment_remover(fd.read())]
-                yield (fname, lines)
-        except:
-            #print("Skipping problematic file", fname, file=sys.stderr)
+            if split:
+                lines = comment_remover(text).splitlines()
+            else:
+                lines = [comment_remover(text)]
+            yield (fname, lines)
+        except Exception as e:
+            skip_file(fname, e)
             continue
 
 
+#Header scanning: imports can only appear before the first type declaration, so for Java, C# and
+#PHP the file is read in chunks, and only up to that declaration. The stop keyword is searched with
+#the same comment/string tokenization as commentRemover, so the uncommented header is exactly the
+#prefix of the uncommented file. If a language's imports may also follow the first declaration
+#(C# and PHP: namespace blocks, PHP: trait use), the raw remainder is checked for anything the full
+#extraction could match, and the file is then processed in full after all.
+
+header_chunk_size = 64*1024
+header_stats = {'files': 0, 'cut': 0, 'bytes': 0, 'bytes_skipped': 0}
+
+# same tokens as commentRemover, but also matching unterminated ones, up to the end of the buffer
+PARTIAL_COMMENT_OR_STRING = r'//[^\n]*|/\*.*?(?:\*/|\Z)|\'(?:\\.|[^\\\'])*(?:\'|\Z)|"(?:\\.|[^\\"])*(?:"|\Z)'
+# max length of a stop keyword match, i.e. how far back to rescan after reading the next chunk
+max_stop_length = 32
+
+
+def header_regexes(stop):
+    return (re.compile(COMMENT_OR_STRING + '|(?P<stop>' + stop + ')', re.DOTALL | re.MULTILINE),
+            re.compile(PARTIAL_COMMENT_OR_STRING + '|(?P<stop>' + stop + ')', re.DOTALL | re.MULTILINE))
+
+
+#reads fd up to the first stop match outside comments and strings
+#returns (header, the part of the last chunk after the header, cut)
+def read_header(fd, regexes):
+    complete_regex, partial_regex = regexes
+    text = ''
+    pos = 0
+    while True:
+        chunk = fd.read(header_chunk_size)
+        eof = len(chunk) < header_chunk_size
+        text += chunk
+        needmore = False
+        for m in (complete_regex if eof else partial_regex).finditer(text, pos):
+            if m.group('stop') is not None:
+                return text[:m.start()], text[m.start():], True
+            if not eof and m.end() == len(text):
+                #token might continue in the next chunk
+                pos = m.start()
+                needmore = True
+                break
+            pos = m.end()
+        if eof:
+            return text, '', False
+        if not needmore:
+            pos = max(pos, len(text) - max_stop_length)
+
+
+#generator helper function: read_uncomment_lines, restricted to the import header
+def read_uncomment_header_lines(sources, ext, regexes, tail_match=None, split=True):
+    for fname, fd, size in open_source_files(sources, ext):
+        try:
+            text, rest, cut = read_header(fd, regexes)
+            headersize = len(text.encode('utf-8'))
+            if cut and tail_match is not None:
+                tail = rest + fd.read()
+                if tail_match(tail):
+                    text, cut, headersize = text + tail, False, size
+            text = commentRemover(text)
+        except Exception as e:
+            skip_file(fname, e)
+            continue
+
+        header_stats['files'] += 1
+        header_stats['bytes'] += size
+        if cut:
+            header_stats['cut'] += 1
+            header_stats['bytes_skipped'] += max(0, size - headersize)
+        yield (fname, text.splitlines() if split else [text])
+
+
+#Extraction cache: when enabled, every extract_*_imports call first looks each source file up by
+#the hash of its content, and only runs the extractor on the misses. Entries are keyed on content
+#only, so decisions based on the path (source patterns, node_modules) are taken before the lookup.
+#Calls with explicit extractor options (header=, scanner=) bypass the cache.
+
+extraction_cache = None
+#files whose imports may be incomplete (JavaScript scans cut off at max_file_seconds), which are not cached
+incomplete_files = set()
+
+
+def enable_cache(filename):
+    global extraction_cache
+    extraction_cache = ExtractionCache(filename) if filename else None
+
+
+def skip_source_path(fname, language):
+    #skip dependent module listings
+    return language == 'javascript' and '/node_modules/' in '/'+fname
+
+
+def cached_extraction(language):
+    def decorator(extract):
+        @functools.wraps(extract)
+        def extract_cached(sources, **options):
+            if extraction_cache is None or options:
+                return extract(sources, **options)
+            patterns = source_patterns[language]
+            if isinstance(sources, str):
+                sources = iter_folder_sources(sources, patterns)
+
+            fileimports = {}
+            for fname, data in sources:
+                if not match_source_patterns(fname, patterns) or skip_source_path(fname, language):
+                    continue
+                try:
+                    if hasattr(data, 'read'):
+                        data = data.read()
+                    raw = data.encode('utf-8', errors='ignore') if isinstance(data, str) else data
+                except Exception as e:
+                    skip_file(fname, e)
+                    continue
+                key = extraction_cache.key(language, extractor_versions[language], raw)
+                hit, imports = extraction_cache.get(key, len(raw))
+                if not hit:
+                    #None marks files the extractor skips
+                    imports = extract([(fname, data)]).get(fname)
+                    if fname in incomplete_files:
+                        incomplete_files.discard(fname)
+                    else:
+                        extraction_cache.put(key, imports)
+                if imports is not None:
+                    fileimports[fname] = imports
+                elif hit:
+                    skip_file(fname, 'cached skip')
+            extraction_cache.commit()
+            return fileimports
+        return extract_cached
+    return decorator
+
+
 # TODO: remove imports that are very unlikely actual imports
 def filter_pretty_imports(imports):
     return imports
@@ -68,42 +340,48 @@ def strip_path_prefix(fname, strip=4):
 ##############
 
 
-def extract_python_imports(folder):
+#reference implementation: compiles the module and collects its IMPORT_* opcodes
+#(raises on files that do not compile on the running interpreter)
+def dis_python_imports(statements):
+    instructions = dis.get_instructions(statements)
+    importinstrs = [__ for __ in instructions if 'IMPORT' in __.opname]
+
+    imports = []
+    lastimp = None
+    popped = False #remove IMPORT_NAME if followed by IMPORT_STAR or IMPORT_FROM
+    for instr in importinstrs:
+        if instr.opname == 'IMPORT_NAME': 
+            lastimp = instr.argval
+            impname = lastimp
+            popped = False
+        elif instr.opname == 'IMPORT_STAR':
+            if not popped:
+                imports.pop()
+                popped = True
+            impname = lastimp + ':*'
+        else:
+            if not popped:
+                imports.pop()
+                popped = True
+            impname = lastimp + ':'+instr.argval
+    
+        imports.append(impname)
+    return imports
+
+
+@cached_extraction('python')
+def extract_python_imports(sources, scanner=scan_python_imports):
     fileimports = {}
 
-    for fname in glob.iglob(folder+'/**/*.py', recursive=True):
+    for fname, statements in read_sources(sources, '*.py'):
         #print(fname, file=sys.stderr)
         try:
-            with open(fname, 'r', errors='ignore') as fd:
-                statements = fd.read()
-            instructions = dis.get_instructions(statements)
-        except:
-            #print("Skipping problematic file", fname, file=sys.stderr)
+            imports = scanner(statements)
+        except Exception as e:
+            skip_file(fname, e)
             continue
-        importinstrs = [__ for __ in instructions if 'IMPORT' in __.opname]
-    
-        imports = []
-        lastimp = None
-        popped = False #remove IMPORT_NAME if followed by IMPORT_STAR or IMPORT_FROM
-        for instr in importinstrs:
-            if instr.opname == 'IMPORT_NAME': 
-                lastimp = instr.argval
-                impname = lastimp
-                popped = False
-            elif instr.opname == 'IMPORT_STAR':
-                if not popped:
-                    imports.pop()
-                    popped = True
-                impname = lastimp + ':*'
-            else:
-                if not popped:
-                    imports.pop()
-                    popped = True
-                impname = lastimp + ':'+instr.argval
-        
-            imports.append(impname)
     
-        fileimports[strip_path_prefix(fname)] = imports
+        fileimports[fname] = imports
     return fileimports
     
 
@@ -114,30 +392,44 @@ def extract_python_imports(folder):
 regex_js_require = re.compile(r'require\(["\']([^"\']+)["\']\)')
 regex_js_import = re.compile(r'import\s+{?((?!\s+from).)+}?\s+from\s+["\']([^"\']+)["\']')
 
-def extract_javascript_imports(folder):
+#reference implementation: line-based regexes on the uncommented source
+#(misses multi-line and dynamic imports, and backtracks badly on long minified lines)
+def regex_javascript_imports(text):
+    imports = []
+
+    for line in commentRemover(text).splitlines():
+        if 'require' in line:
+            newimports = regex_js_require.findall(line)
+            #print(fname, newimports, file=sys.stderr)
+            imports.extend(newimports)
+        #for the imports, we currently only capture the modules, not the individual from-items    
+        if 'import' in line:
+            newimports = get_elems_idx(regex_js_import.findall(line), 1)
+            #print(fname, newimports, file=sys.stderr)
+            imports.extend(newimports)
+
+    return imports
+
+
+@cached_extraction('javascript')
+def extract_javascript_imports(sources, scanner=scan_js_imports):
     fileimports = {}
-    for fname, lines in read_uncomment_lines(folder, '*.[jt]s'):
+    for fname, text in read_sources(sources, '*.[jt]s'):
         #print(fname, file=sys.stderr)
 
-        #skip dependent module listings
-        if '/node_modules/' in fname:
+        if skip_source_path(fname, 'javascript'):
             continue
 
-        imports = []
-
-        for line in lines:
-            if 'require' in line:
-                newimports = regex_js_require.findall(line)
-                #print(fname, newimports, file=sys.stderr)
-                imports.extend(newimports)
-            #for the imports, we currently only capture the modules, not the individual from-items    
-            if 'import' in line:
-                newimports = get_elems_idx(regex_js_import.findall(line), 1)
-                #print(fname, newimports, file=sys.stderr)
-                imports.extend(newimports)
-
+        try:
+            cutoffs = scan_stats['cut_off']
+            imports = scanner(text)
+        except Exception as e:
+            skip_file(fname, e)
+            continue
+        if scan_stats['cut_off'] > cutoffs:
+            incomplete_files.add(fname)
 
-        fileimports[strip_path_prefix(fname)] = filter_pretty_imports(imports)
+        fileimports[fname] = filter_pretty_imports(imports)
 
     return fileimports
 
@@ -147,10 +439,16 @@ def extract_javascript_imports(folder):
 ###################
 
 regex_java_import = re.compile(r'(?:^|;)\s*import\s+([^;\s]+)\s*(?=;)')
+regex_java_header = header_regexes(r'(?<![\w$.])(?:class|interface|enum)(?=\s)')
 
-def extract_java_imports(folder):
+@cached_extraction('java')
+def extract_java_imports(sources, header=True):
     fileimports = {}
-    for fname, lines in read_uncomment_lines(folder, '*.java'):
+    if header:
+        lines_iter = read_uncomment_header_lines(sources, '*.java', regex_java_header)
+    else:
+        lines_iter = read_uncomment_lines(sources, '*.java')
+    for fname, lines in lines_iter:
         #print(fname, file=sys.stderr)
 
         imports = []
@@ -162,7 +460,7 @@ def extract_java_imports(folder):
                 imports.extend(newimports)
 
 
-        fileimports[strip_path_prefix(fname)] = filter_pretty_imports(imports)
+        fileimports[fname] = filter_pretty_imports(imports)
 
     return fileimports
 
@@ -173,10 +471,31 @@ def extract_java_imports(folder):
 
 regex_csharp_using = re.compile(r'(?:^|;)\s*using\s+(?!static\s+)([^;\s]+)\s*(?=;)')
 regex_csharp_using_static = re.compile(r'(?:^|;)\s*using\s+static\s+([^;\s]+)\s*(?=;)')
-
-def extract_csharp_imports(folder):
+#not at namespace: usings are often declared inside the namespace block
+regex_csharp_header = header_regexes(r'(?<![\w@.])(?:class|interface|struct|enum|delegate)(?=\s)')
+#anything after the header that the using-regexes could still match once comments are removed
+#(usings of later namespace blocks), but not using statements and declarations in method bodies
+CSHARP_BLANK = r'(?:[^\S\n]|/\*.*?\*/)'
+regex_csharp_tail = re.compile(r'using' + CSHARP_BLANK + r'+(?:static' + CSHARP_BLANK + r'+)?[^;\s]+' + CSHARP_BLANK + r'*;', re.DOTALL)
+
+#the using-regexes also need the line start or a ';' before the using (a comment might hide one)
+def csharp_tail_match(tail):
+    for m in regex_csharp_tail.finditer(tail):
+        start = m.start()
+        while start > 0 and tail[start-1] in ' \t\r\f\v':
+            start -= 1
+        if start == 0 or tail[start-1] in '\n;' or tail.endswith('*/', 0, start):
+            return True
+    return False
+
+@cached_extraction('csharp')
+def extract_csharp_imports(sources, header=True):
     fileimports = {}
-    for fname, lines in read_uncomment_lines(folder, '*.cs'):
+    if header:
+        lines_iter = read_uncomment_header_lines(sources, '*.cs', regex_csharp_header, csharp_tail_match)
+    else:
+        lines_iter = read_uncomment_lines(sources, '*.cs')
+    for fname, lines in lines_iter:
         #print(fname, file=sys.stderr)
 
         imports = []
@@ -189,7 +508,7 @@ def extract_csharp_imports(folder):
                 imports.extend(newimports)
 
 
-        fileimports[strip_path_prefix(fname)] = filter_pretty_imports(imports)
+        fileimports[fname] = filter_pretty_imports(imports)
 
     return fileimports
 
@@ -202,6 +521,11 @@ regex_php_use = re.compile(r'(?:^|;)\s*use\s+(?!const|function)([^;]+)(?=;)')
 
 regex_php_use_group_split = re.compile(r'^([^{\s]+)\s*{([^}]+)}')
 
+regex_php_header = header_regexes(r'(?<![\w$\\>:])(?:class|interface|trait)(?=\s)')
+#anything after the header that the use-regexes could still match once comments are removed
+#(use statements in later namespaces, trait use in class bodies)
+regex_php_tail = re.compile(r';(?:\s|//[^\n]*|/\*.*?\*/)*use(?:\s|/[/*])', re.DOTALL)
+
 
 
 def extract_php_imports_line(regexfunc, line, appendix):
@@ -222,9 +546,14 @@ def extract_php_imports_line(regexfunc, line, appendix):
                 imports.append(impname.replace('\\', '/')+appendix)
     return imports
 
-def extract_php_imports(folder):
+@cached_extraction('php')
+def extract_php_imports(sources, header=True):
     fileimports = {}
-    for fname, lines in read_uncomment_lines(folder, '*.php', split=False):
+    if header:
+        lines_iter = read_uncomment_header_lines(sources, '*.php', regex_php_header, regex_php_tail.search, split=False)
+    else:
+        lines_iter = read_uncomment_lines(sources, '*.php', split=False)
+    for fname, lines in lines_iter:
         #print(fname, file=sys.stderr)
 
         imports = []
@@ -236,7 +565,7 @@ def extract_php_imports(folder):
                 imports.extend(extract_php_imports_line(regex_php_use, line, ''))
 
 
-        fileimports[strip_path_prefix(fname)] = filter_pretty_imports(imports)
+        fileimports[fname] = filter_pretty_imports(imports)
 
     return fileimports
 
@@ -248,9 +577,10 @@ def extract_php_imports(folder):
 regex_ruby_require = re.compile(r'require\s+["\']([^"\']+)["\']')
 regex_ruby_require_relative = re.compile(r'require_relative\s+["\']([^"\']+)["\']')
 
-def extract_ruby_imports(folder):
+@cached_extraction('ruby')
+def extract_ruby_imports(sources):
     fileimports = {}
-    for fname, lines in read_uncomment_lines(folder, '*.rb', removecomments=False):
+    for fname, lines in read_uncomment_lines(sources, '*.rb', removecomments=False):
         #print(fname, file=sys.stderr)
 
         imports = []
@@ -273,7 +603,7 @@ def extract_ruby_imports(folder):
                     imports.extend(list(map(lambda x: "./"+x, impnames)))
 
 
-        fileimports[strip_path_prefix(fname)] = filter_pretty_imports(imports)
+        fileimports[fname] = filter_pretty_imports(imports)
 
     return fileimports
 
@@ -289,12 +619,43 @@ extraction_functions = {
         'ruby':         extract_ruby_imports,
 }
 
+#bump a language's version whenever its extractor output changes, to invalidate its cache entries
+extractor_versions = {
+        'python':       1,
+        'javascript':   2,
+        'java':         1,
+        'csharp':       2,
+        'php':          1,
+        'ruby':         1,
+}
+
+#source file patterns per language, as used when unpacking the project tarballs
+source_patterns = {
+        'python':       ['*.py'],
+        'javascript':   ['*.[jt]s'],
+        'java':         ['*.java'],
+        'csharp':       ['*.cs'],
+        'php':          ['*.php'],
+        'ruby':         ['*.rb'],
+}
+
+
+def extract_imports_from_sources(sources, language):
+    return extraction_functions.get(language, lambda s:{})(sources)
+
 
-fileimports = extraction_functions.get(language, lambda f:[])(folder)
+#folder (or tarball, zip archive, git repository) based entry point
+def extract_imports(folder, language):
+    return extract_imports_from_sources(open_sources(folder, language), language)
 
 
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else '.'
+    language = sys.argv[2] if len(sys.argv) > 2 else 'python'
+    enable_cache(sys.argv[3] if len(sys.argv) > 3 else None)
 
+    fileimports = extract_imports(folder, language)
 
-if len(fileimports) > 0:
-    #print(json.dumps(imports, sort_keys=False, indent=2).encode('utf-8')))
-    print(json.dumps(fileimports))
+    if len(fileimports) > 0:
+        #print(json.dumps(imports, sort_keys=False, indent=2).encode('utf-8')))
+        print(json.dumps(fileimports))
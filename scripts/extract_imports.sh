@@ -14,7 +14,7 @@ cwd=$PWD
 
 cd $basedir
 
-# Note: you can also run this in parallel per dataset to speed up
+# Note: you can also run this in parallel per dataset to speed up, or use extract_tarballs.py instead
 
 dslist=$*
 if [ -z "$dslist" ] ; then
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# In-process replacement for extract_imports.sh: the source files are streamed straight out of
+# every project tarball (no temporary folders, no tar/python process per project), and the
+# projects are spread over a pool of worker processes. Extraction results are cached per file
+# content (see extraction_cache.py), so forks and re-crawled projects mostly only cost hashing.
+#
+# Every extracted project is recorded in the manifest (see manifest.py). By default, projects that
+# have a <project>.json are skipped; with --incremental, the projects whose tarball (by hash) and
+# extractor version are unchanged are skipped instead, and the outputs of vanished tarballs removed.
+#
+# Reports the throughput, the slowest source files and the skipped files and failed tarballs per
+# reason of the language's extractor to <basedir>/metrics/extract-<language>.json (see instrumentation.py).
+
+import argparse
+import fnmatch
+import glob
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zlib
+from multiprocessing import Pool
+from tqdm import tqdm
+
+import extract_imports
+from extraction_cache import format_stats
+from instrumentation import StageMetrics
+from manifest import file_sha1, file_stat, load_manifest, save_manifest
+
+
+parser = argparse.ArgumentParser(description='Extract the imports of all project tarballs in a dataset folder.')
+parser.add_argument('basedir', nargs='?', default='../datasets/python')
+parser.add_argument('language', nargs='?', default='python')
+parser.add_argument('datasets', nargs='*', type=int, help='dataset indices (default = all)')
+parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of worker processes (default = #cpus)')
+parser.add_argument('--srctar', action='store_true', help='also repack the source files into <project>.src.tgz')
+parser.add_argument('--cache', help='extraction cache file (default = <basedir>/extraction-cache.sqlite)')
+parser.add_argument('--no-cache', action='store_true', help='do not use the extraction cache')
+parser.add_argument('--incremental', action='store_true', help='only extract new and changed projects (see manifest.py)')
+
+###################
+
+
+#tar --wildcards --ignore-case semantics: '*' also matches '/'
+def is_source_member(name, patterns):
+    lname = name.lower()
+    return any(fnmatch.fnmatchcase(lname, pattern) for pattern in patterns)
+
+
+def read_tarball_sources(tgzfile, patterns):
+    sources = []
+    with tarfile.open(tgzfile, 'r|gz') as tar:
+        for member in tar:
+            if member.isfile() and is_source_member(member.name, patterns):
+                sources.append((member, tar.extractfile(member).read()))
+    return sources
+
+
+def write_atomic(filename, mode, writer):
+    tmpfilename = filename + '.tmp'
+    with open(tmpfilename, mode) as fd:
+        writer(fd)
+    os.replace(tmpfilename, filename)
+
+
+def write_source_tarball(srcfile, sources):
+    def writer(fd):
+        with tarfile.open(fileobj=fd, mode='w:gz') as tar:
+            for member, data in sources:
+                tar.addfile(member, io.BytesIO(data))
+    write_atomic(srcfile, 'wb', writer)
+
+
+#per-project deltas of the extraction counters
+def extraction_counters():
+    counters = {'bytes_skipped': extract_imports.header_stats['bytes_skipped']}
+    counters.update(('skipped:' + reason, count) for reason, count in extract_imports.skip_stats.items())
+    if extract_imports.extraction_cache is not None:
+        counters.update(extract_imports.extraction_cache.stats)
+    return counters
+
+
+#metrics of the worker processes, returned per project
+metrics = None
+
+
+def init_worker(cachefile, stagemetrics):
+    global metrics
+    extract_imports.enable_cache(cachefile)
+    metrics = stagemetrics
+    metrics.init_worker()
+
+
+#yields the sources of a tarball, recording the time the extractor spends on every file (until it asks for the next one)
+def timed_sources(tgzfile, sources):
+    for member, data in sources:
+        t0 = time.perf_counter()
+        yield extract_imports.strip_root(member.name), data
+        metrics.item(os.path.basename(tgzfile) + ':' + member.name, len(data), time.perf_counter() - t0)
+
+
+def extractor_version(language):
+    return '%s:%d' % (language, extract_imports.extractor_versions[language])
+
+
+#(tarball, status, counters, manifest entry, metrics) of a project; oldsha1: the tarball hash it was extracted from
+def process_project(task):
+    tgzfile, language, srctar, oldsha1 = task
+    jsonfile = tgzfile[:-len('.tgz')] + '.json'
+    entry = {'tarball': {'stat': file_stat(tgzfile), 'sha1': file_sha1(tgzfile)}, 'extractor': extractor_version(language)}
+    if entry['tarball']['sha1'] == oldsha1:
+        metrics.skip('unchanged tarball')
+        return tgzfile, 'unchanged', {}, entry, metrics.partial()
+    try:
+        sources = read_tarball_sources(tgzfile, extract_imports.source_patterns[language])
+    except (tarfile.TarError, EOFError, OSError, zlib.error) as e:
+        metrics.fail('tarball ' + type(e).__name__)
+        remove_output(jsonfile)
+        return tgzfile, 'failed', {}, dict(entry, status='failed', output=None), metrics.partial()
+
+    before = extraction_counters()
+    fileimports = extract_imports.extract_imports_from_sources(timed_sources(tgzfile, sources), language)
+    counters = {key: value - before.get(key, 0) for key, value in extraction_counters().items()}
+    for key, count in counters.items():
+        if key.startswith('skipped:') and count > 0:
+            metrics.skip(key[len('skipped:'):], count)
+    metrics.count('tarballs')
+    metrics.count('tarball_bytes', entry['tarball']['stat'][0])
+    if len(fileimports) > 0:
+        write_atomic(jsonfile, 'w', lambda fd: fd.write(json.dumps(fileimports) + '\n'))
+        entry.update(status='extracted', output={'file': jsonfile, 'stat': file_stat(jsonfile), 'sha1': file_sha1(jsonfile)})
+    else:
+        #a re-crawled project may have lost its imports
+        remove_output(jsonfile)
+        entry.update(status='empty', output=None)
+
+    if srctar:
+        write_source_tarball(tgzfile[:-len('.tgz')] + '.src.tgz', sources)
+    return tgzfile, entry['status'], counters, entry, metrics.partial()
+
+
+def remove_output(jsonfile):
+    if os.path.isfile(jsonfile):
+        os.remove(jsonfile)
+
+
+def list_datasets(basedir):
+    return sorted(int(d.rstrip('/').split('dataset')[-1]) for d in glob.glob(basedir+'/dataset[0-9]*/'))
+
+
+def list_tarballs(basedir, dsidx):
+    return [f for f in glob.iglob(basedir+'/dataset%02d/**/*.tgz'%dsidx, recursive=True) if not f.endswith('.src.tgz')]
+
+
+def list_pending_projects(basedir, dsidx):
+    tgzfiles = list_tarballs(basedir, dsidx)
+    pending = [f for f in tgzfiles if not os.path.isfile(f[:-len('.tgz')] + '.json')]
+    return pending, len(tgzfiles) - len(pending)
+
+
+#whether the output recorded in a manifest entry is still in place
+def output_unchanged(basedir, entry):
+    output = entry.get('output')
+    return output is None or (os.path.isfile(basedir+'/'+output['file']) and file_stat(basedir+'/'+output['file']) == output['stat'])
+
+
+#([(tarball, sha1 it was extracted from, or None)] of the new and changed projects, # unchanged)
+#removes the outputs and manifest entries of the projects whose tarballs are gone
+def list_changed_projects(basedir, dsidx, language, projects):
+    tgzfiles = list_tarballs(basedir, dsidx)
+    keys = set(os.path.relpath(f, basedir) for f in tgzfiles)
+    prefix = 'dataset%02d%s' % (dsidx, os.sep)
+    for key in [key for key in projects if key.startswith(prefix) and key not in keys]:
+        if projects[key]['output'] is not None:
+            remove_output(basedir+'/'+projects[key]['output']['file'])
+        del projects[key]
+    pending = []
+    for tgzfile in tgzfiles:
+        entry = projects.get(os.path.relpath(tgzfile, basedir))
+        if entry is None or entry['extractor'] != extractor_version(language) or not output_unchanged(basedir, entry):
+            pending.append((tgzfile, None))
+        elif file_stat(tgzfile) != entry['tarball']['stat']:
+            #the tarball was re-crawled: extracted again only if its content changed
+            pending.append((tgzfile, entry['tarball']['sha1']))
+    return pending, len(tgzfiles) - len(pending)
+
+
+###################
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.language not in extract_imports.extraction_functions:
+        print("Unsupported language", args.language)
+        sys.exit(1)
+
+    dslist = args.datasets or list_datasets(args.basedir)
+
+    cachefile = None if args.no_cache else (args.cache or os.path.join(args.basedir, 'extraction-cache.sqlite'))
+    manifest = load_manifest(args.basedir)
+
+    stagemetrics = StageMetrics('extract', 'files', {'language': args.language})
+
+    with Pool(args.jobs, init_worker, (cachefile, stagemetrics)) as pool:
+        for dsidx in dslist:
+            print("[Dataset %02d]"%dsidx)
+            if args.incremental:
+                pending, nskipped = list_changed_projects(args.basedir, dsidx, args.language, manifest['projects'])
+            else:
+                pending, nskipped = list_pending_projects(args.basedir, dsidx)
+                pending = [(tgzfile, None) for tgzfile in pending]
+            if nskipped > 0:
+                print("Skipping", nskipped, "already extracted projects", file=sys.stderr)
+                stagemetrics.skip('already extracted', nskipped)
+
+            tasks = [(tgzfile, args.language, args.srctar, oldsha1) for tgzfile, oldsha1 in pending]
+            stats = {}
+            counters = {}
+            for tgzfile, status, projectcounters, entry, partial in tqdm(pool.imap_unordered(process_project, tasks), total=len(tasks)):
+                stagemetrics.merge(partial)
+                stats[status] = stats.get(status, 0) + 1
+                for key, value in projectcounters.items():
+                    counters[key] = counters.get(key, 0) + value
+                key = os.path.relpath(tgzfile, args.basedir)
+                if entry.get('output'):
+                    entry['output']['file'] = os.path.relpath(entry['output']['file'], args.basedir)
+                if status == 'unchanged':
+                    manifest['projects'][key].update(entry)
+                else:
+                    manifest['projects'][key] = entry
+            save_manifest(args.basedir, manifest)
+            print(stats)
+            if counters.get('bytes_skipped', 0) > 0:
+                print("Skipped %.1f MB of sources after the import headers" % (counters['bytes_skipped']/1024/1024))
+            if counters.get('lookups', 0) > 0:
+                print("Extraction", format_stats(counters))
+                stagemetrics.count('cache_hits', counters.get('hits', 0))
+                stagemetrics.count('cache_misses', counters['lookups'] - counters.get('hits', 0))
+
+    stagemetrics.write(args.basedir)
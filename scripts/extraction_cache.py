@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Persistent, content-addressed cache of extracted imports: maps the hash of a source file's
+# content (plus language and extractor version) to its import list, in an SQLite database. As
+# forks and vendored copies make the same file appear many times across projects and re-crawls,
+# most files then only need to be hashed.
+#
+# Usage: ./extraction_cache.py <cachefile>   (prints the cache size)
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+
+# commit after this many new entries (and whenever commit() is called)
+commit_interval = 1000
+
+
+class ExtractionCache:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = None
+        self.pid = None
+        self.pending = 0
+        self.stats = {'lookups': 0, 'hits': 0, 'bytes': 0, 'bytes_saved': 0}
+
+    #(re)connect lazily, so that every worker process gets its own connection
+    def connection(self):
+        if self.db is None or self.pid != os.getpid():
+            self.db = sqlite3.connect(self.filename, timeout=600)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS imports (key BLOB PRIMARY KEY, imports TEXT) WITHOUT ROWID')
+            self.pid = os.getpid()
+            self.pending = 0
+        return self.db
+
+    @staticmethod
+    def key(language, version, data):
+        m = hashlib.sha1()
+        m.update(('%s:%s:' % (language, version)).encode())
+        m.update(data)
+        return m.digest()
+
+    #returns (True, imports) on a hit (imports is None for files the extractor skips), else (False, None)
+    def get(self, key, size=0):
+        self.stats['lookups'] += 1
+        self.stats['bytes'] += size
+        row = self.connection().execute('SELECT imports FROM imports WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return False, None
+        self.stats['hits'] += 1
+        self.stats['bytes_saved'] += size
+        return True, json.loads(row[0])
+
+    def put(self, key, imports):
+        self.connection().execute('INSERT OR REPLACE INTO imports VALUES (?, ?)', (key, json.dumps(imports)))
+        self.pending += 1
+        if self.pending >= commit_interval:
+            self.commit()
+
+    def commit(self):
+        if self.db is not None and self.pid == os.getpid() and self.pending > 0:
+            self.db.commit()
+            self.pending = 0
+
+    def __len__(self):
+        return self.connection().execute('SELECT COUNT(*) FROM imports').fetchone()[0]
+
+
+def format_stats(stats):
+    hitrate = 100.0 * stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+    return "cache hit rate %.1f%% (%d/%d files), %.1f of %.1f MB not re-extracted" % (
+        hitrate, stats['hits'], stats['lookups'], stats['bytes_saved']/1024/1024, stats['bytes']/1024/1024)
+
+
+if __name__ == '__main__':
+    cache = ExtractionCache(sys.argv[1])
+    print(len(cache), "cached files in", sys.argv[1])
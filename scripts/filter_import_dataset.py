@@ -4,14 +4,20 @@
 # Licensed under the BSD 3-Clause License
 
 
-import gzip
 import json
-import glob
 from tqdm import tqdm
-import re
 import sys
 import os
 import hashlib
+import time
+
+import numpy as np
+
+from import_dataset import ShardWriter, block_projects, iter_projects, list_raw_dataset_files, project_entry, read_block
+import minhash_dedup
+from import_columns import ColumnsWriter, ImportColumns, columns_dir
+from instrumentation import StageMetrics
+from manifest import digest, file_sha1, file_stat, load_manifest, save_manifest
 
 
 # minimum # imports per source file
@@ -20,66 +26,247 @@ minsrcfileimports = 1
 minsrcfiles = 1
 #filter import-duplicates?
 filterduplicates = True
+#'minhash': near-duplicates with an estimated Jaccard similarity of their import multisets >= dedupthreshold
+#'exact': only projects with identical imports
+dedupmethod = 'minhash'
+dedupthreshold = 0.9
+minhashperms = 64
+#also store the processed dataset in the memory-mappable columnar format (see import_columns.py)
+storecolumns = True
 
 ##########
 
-basedir = sys.argv[1] if len(sys.argv) > 1 else '../datasets/python'
+#--incremental: only rewrite the outputs of new and changed raw shards (see manifest.py)
+incremental = '--incremental' in sys.argv
+argv = [arg for arg in sys.argv if arg != '--incremental']
+basedir = argv[1] if len(argv) > 1 else '../datasets/python'
+dedupthreshold = float(argv[2]) if len(argv) > 2 else dedupthreshold
 
 os.makedirs(basedir+'/processed', exist_ok=True)
 
 
-def load_json_gz(filename):
-    with gzip.open(filename, 'r') as fd:
-        return json.loads(fd.read())
-        
-def store_json_gz(filename, data, sort=False):
-    with gzip.open(filename, 'w') as fd:
-        fd.write(json.dumps(data, sort_keys=sort, indent=2).encode('utf-8'))
-
 def create_hash(fileimports):
     fileimportstring = "|".join(sorted(["|".join(sorted(imports)) for imports in fileimports.values()]))
     m = hashlib.md5()
     m.update(fileimportstring.encode())
     return m.hexdigest()
 
-def dedup_projects(dedupprojectfileimports, projectfileimports):
-    newprojectfileimports = {}
-    refhashes = set(dedupprojectfileimports.values())
-        
-    for project, fileimports in projectfileimports.items():
-        projecthash = create_hash(fileimports)
-        if projecthash not in refhashes:
-            dedupprojectfileimports[project] = projecthash
-            refhashes.update(projecthash)
-            newprojectfileimports[project] = fileimports
-              
-    return newprojectfileimports
-    
+#generator: filters out srcfiles with too few imports, and then projects with too few srcfiles
+def filter_projects(projectfileimports, counts):
+    for projectname, fileimports in projectfileimports:
+        fileimports = {filename:imports for filename, imports in fileimports.items() if len(imports) >= minsrcfileimports}
+        if len(fileimports) >= minsrcfiles:
+            counts['raw'] += 1
+            yield projectname, fileimports
+        else:
+            counts['filtered'] = counts.get('filtered', 0) + 1
+
+#(names, dedup keys) of filtered projects: MinHash signatures, or import signature hashes
+def project_keys(projectfileimports):
+    names, keys = [], []
+    minhasher = minhash_dedup.MinHasher(minhashperms)
+    for project, fileimports in projectfileimports:
+        names.append(project)
+        if keymethod == 'minhash':
+            minhasher.add(minhash_dedup.project_import_counts(fileimports))
+        elif keymethod == 'exact':
+            keys.append(create_hash(fileimports))
+    if keymethod == 'minhash':
+        return names, minhasher.matrix()
+    return names, np.array(keys if keymethod else [''] * len(names), dtype='S32')
+
+
+#[[digest, offset, length]] of the blocks of a raw shard (see import_dataset.py), as recorded by
+#create_import_dataset.py while the shard is unchanged, or else the whole shard as a single block
+def raw_blocks(dsidx, rawfname):
+    entry = manifest['raw'].get('%02d' % dsidx)
+    if entry is not None and entry.get('stat') == file_stat(rawfname) and 'blocks' in entry:
+        return [block[:3] for block in entry['blocks']]
+    return [[file_sha1(rawfname), None, None]]
+
+
+#the projects of a block of a raw shard
+def raw_block_projects(rawfname, block):
+    if block[1] is None:
+        return iter_projects(rawfname)
+    return block_projects(read_block(rawfname, block[1:])[1])
+
+
+def keys_dir(basedir):
+    return basedir+'/processed/dedup-keys'
+
+
+#(names, keys, # filtered projects per block) of a raw shard; with --incremental, the keys of the
+#unchanged blocks come from the cache of the previous run
+def load_project_keys(dsidx, rawfname, blocks):
+    cachefile = keys_dir(basedir)+'/ds%02d' % dsidx
+    cacheentry = manifest['processed'].get('keys', {}).get('%02d' % dsidx)
+    cached = {}
+    if incremental and cacheentry is not None and cacheentry['config'] == digest(keyconfig) and os.path.isfile(cachefile+'.npy'):
+        with open(cachefile+'.names.json') as fd:
+            oldnames = json.load(fd)
+        oldkeys = np.load(cachefile+'.npy')
+        start = 0
+        for blockdigest, count in cacheentry['blocks']:
+            cached[blockdigest] = (oldnames[start:start+count], oldkeys[start:start+count])
+            start += count
+    names, keys, counts = [], [], []
+    for block in blocks:
+        if block[0] in cached:
+            blocknames, blockkeys = cached[block[0]]
+            metrics.count('cached_key_blocks')
+        else:
+            blocknames, blockkeys = project_keys(filter_projects(raw_block_projects(rawfname, block), filtercounts))
+        names += blocknames
+        keys.append(blockkeys)
+        counts.append(len(blocknames))
+    keys = np.concatenate(keys) if keys else np.zeros((0, minhashperms), dtype=np.uint32)
+    os.makedirs(keys_dir(basedir), exist_ok=True)
+    with open(cachefile+'.names.json', 'w') as fd:
+        json.dump(names, fd)
+    np.save(cachefile+'.npy', keys)
+    manifest['processed'].setdefault('keys', {})['%02d' % dsidx] = {'config': digest(keyconfig),
+                                                                    'blocks': [[block[0], count] for block, count in zip(blocks, counts)]}
+    return names, keys, counts
+
+
+#whether every project is kept (is the canonical project of its near-duplicate cluster), and the cluster roots
+def dedup_mask(keys):
+    if filterduplicates and dedupmethod == 'minhash':
+        bands, rows = minhash_dedup.lsh_params(dedupthreshold, minhashperms)
+        roots, ncandidates = minhash_dedup.cluster_signatures(keys, dedupthreshold, bands, rows)
+        print("MinHash LSH: %d bands x %d rows, %d candidate pairs checked" % (bands, rows, ncandidates))
+        return roots == np.arange(len(roots)), roots
+    keep = np.zeros(len(keys), dtype=bool)
+    #the first project with an import signature
+    keep[np.unique(keys, return_index=True)[1] if filterduplicates else slice(None)] = True
+    return keep, None
+
+
+#the kept projects of a block of a single-JSON-object processed shard
+def processed_block_projects(text):
+    return json.loads('{' + text.lstrip(',') + '}').items()
 
 
-dedupprojectfileimports = {}
-nrawprojects = 0
-ndedupprojects = 0
+#items: the rebuilt blocks of the processed shards (see instrumentation.py)
+metrics = StageMetrics('filter', 'blocks')
+#projects that pass the filters, or not (among the parsed raw blocks)
+filtercounts = {'raw': 0, 'filtered': 0}
 
+#outputs: processed/projectfileimports.NN.json.gz (written in blocks that match those of the raw
+#shards), the columnar dataset and dedup-clusters.json; with --incremental, the blocks of the
+#processed shards whose raw block and kept projects are unchanged are copied (compressed) from the
+#previous shards, and their columns from the previous columnar dataset
+manifest = load_manifest(basedir)
+config = {'minsrcfileimports': minsrcfileimports, 'minsrcfiles': minsrcfiles, 'filterduplicates': filterduplicates,
+          'dedupmethod': dedupmethod, 'dedupthreshold': dedupthreshold, 'minhashperms': minhashperms}
+keymethod = dedupmethod if filterduplicates else None
+keyconfig = {'minsrcfileimports': minsrcfileimports, 'minsrcfiles': minsrcfiles, 'keys': keymethod, 'minhashperms': minhashperms}
 
+rawfiles = list_raw_dataset_files(basedir)
+shards = []
+with metrics.phase('keys'):
+    for dsidx, rawfname in tqdm(rawfiles):
+        blocks = raw_blocks(dsidx, rawfname)
+        names, keys, counts = load_project_keys(dsidx, rawfname, blocks)
+        shards.append((dsidx, rawfname, blocks, names, keys, counts))
+names = [name for shard in shards for name in shard[3]]
+with metrics.phase('dedup'):
+    keep, roots = dedup_mask(np.concatenate([shard[4] for shard in shards]) if shards else
+                             np.zeros((0, minhashperms), dtype=np.uint32) if keymethod == 'minhash' else np.zeros(0, dtype='S32'))
 
-for rawfname in tqdm(glob.glob(basedir+'/raw/raw-import-ds*.json.gz')):
-    projectfileimports = load_json_gz(rawfname)
-    #print(len(projectfileimports), "projects in raw dataset", rawfname.split(' /')[-1])
+#the previous blocks: {digest: (shard file, [offset, length], project range in the previous columns)}
+oldblocks = {}
+if incremental:
+    oldcolumns = None
+    if storecolumns and os.path.isfile(columns_dir(basedir)+'/meta.json') and \
+            manifest['processed'].get('columns') == file_stat(columns_dir(basedir)+'/meta.json'):
+        oldcolumns = ImportColumns(columns_dir(basedir))
+    start = 0
+    for shard, shardentry in manifest['processed'].get('shards', []):
+        unchanged = os.path.isfile(basedir+'/'+shardentry['file']) and file_stat(basedir+'/'+shardentry['file']) == shardentry['stat']
+        for blockdigest, offset, length, count in shardentry['blocks']:
+            if unchanged:
+                oldblocks[blockdigest] = (basedir+'/'+shardentry['file'], [offset, length], (start, start + count))
+            start += count
+    if oldcolumns is not None and start != len(oldcolumns):
+        oldcolumns = None
 
-    #filter out srcfiles with too few imports
-    projectfileimports = {projectname:{filename:imports for filename, imports in fileimports.items() if len(imports) >= minsrcfileimports} for projectname, fileimports in projectfileimports.items()}
+columnswriter = ColumnsWriter(columns_dir(basedir)) if storecolumns else None
+processed = []
+start = 0
+ncopied = nblocks = 0
+with metrics.phase('write'):
+    for dsidx, rawfname, rawblocks, shardnames, _, counts in tqdm(shards):
+        outfname = basedir+'/processed/projectfileimports.%02d.json.gz' % dsidx
+        #the first block holds the opening brace
+        writer = ShardWriter(outfname + '.new')
+        writer.write('{')
+        writer.end_block()
+        blocks = []
+        first = True
+        for rawblock, count in zip(rawblocks, counts):
+            blockkeep = keep[start:start+count]
+            start += count
+            blockdigest = digest([rawblock[0], config, np.packbits(blockkeep).tobytes().hex(), count, first])
+            nblocks += 1
+            if blockdigest in oldblocks:
+                oldfname, oldblock, oldrange = oldblocks[blockdigest]
+                data, text = read_block(oldfname, oldblock) if oldcolumns is None else (read_block(oldfname, oldblock)[0], None)
+                blocks.append([blockdigest] + writer.copy_block(data) + [int(blockkeep.sum())])
+                if oldcolumns is not None:
+                    columnswriter.add_columns(oldcolumns, *oldrange)
+                elif columnswriter is not None:
+                    for project, fileimports in processed_block_projects(text):
+                        columnswriter.add(project, fileimports)
+                ncopied += 1
+                metrics.skip('unchanged', int(blockkeep.sum()))
+            else:
+                t0 = time.perf_counter()
+                projectfileimports = ((project, fileimports) for (project, fileimports), kept in
+                                      zip(filter_projects(raw_block_projects(rawfname, rawblock), {'raw': 0}), blockkeep) if kept)
+                if columnswriter is not None:
+                    projectfileimports = columnswriter.tee(projectfileimports)
+                for i, (project, fileimports) in enumerate(projectfileimports):
+                    writer.write(project_entry(project, fileimports, first and i == 0))
+                blocks.append([blockdigest] + writer.end_block() + [int(blockkeep.sum())])
+                metrics.item('ds%02d block %d' % (dsidx, len(blocks) - 1), rawblock[2] or os.path.getsize(rawfname), time.perf_counter() - t0)
+            first = first and not blockkeep.any()
+        writer.write('\n}\n')
+        writer.close()
+        processed.append(['%02d' % dsidx, {'file': os.path.relpath(outfname, basedir), 'blocks': blocks,
+                                           'projects': sum(block[3] for block in blocks), 'digest': digest([block[0] for block in blocks])}])
 
-    #filter out empty projects
-    projectfileimports = {projectname:fileimports for projectname, fileimports in projectfileimports.items() if len(fileimports) >= minsrcfiles}
+#the new shards replace the previous ones (which the copied blocks were read from) at the end
+for shard, shardentry in processed:
+    os.replace(basedir+'/'+shardentry['file'] + '.new', basedir+'/'+shardentry['file'])
+    shardentry['stat'] = file_stat(basedir+'/'+shardentry['file'])
+#processed shards without a raw shard
+for shard, shardentry in manifest['processed'].get('shards', []):
+    if shard not in dict(processed) and os.path.isfile(basedir+'/'+shardentry['file']):
+        os.remove(basedir+'/'+shardentry['file'])
 
-    nrawprojects += len(projectfileimports)
-    #filter import-duplicate projects
-    if filterduplicates:
-        projectfileimports = dedup_projects(dedupprojectfileimports, projectfileimports)
-    ndedupprojects += len(projectfileimports)
+print("Import deduplication:", len(keep), "->", int(keep.sum()), "projects (%d of %d blocks copied)" % (ncopied, nblocks))
+metrics.skip('too few imports', filtercounts['filtered'])
+metrics.skip('duplicate', len(keep) - int(keep.sum()))
+metrics.count('projects', len(keep))
+metrics.count('kept_projects', int(keep.sum()))
+metrics.count('copied_blocks', ncopied)
 
-    #print(len(projectfileimports), "projects after filtering")
-    store_json_gz(basedir+'/processed/projectfileimports.'+rawfname.split('-')[-1][2:], projectfileimports)
+manifest['processed']['shards'] = processed
+if columnswriter is not None:
+    columnswriter.close()
+    manifest['processed']['columns'] = file_stat(columns_dir(basedir)+'/meta.json')
+save_manifest(basedir, manifest)
+metrics.write(basedir)
 
-print("Import deduplication:", nrawprojects, "->", ndedupprojects, "projects")
+if filterduplicates and dedupmethod == 'minhash':
+    #canonical project -> its near-duplicates, largest clusters first
+    clusters = {}
+    for name, root in zip(names, roots.tolist()):
+        clusters.setdefault(root, []).append(name)
+    clusters = sorted((members for members in clusters.values() if len(members) > 1), key=len, reverse=True)
+    with open(basedir+'/dedup-clusters.json', 'w') as fd:
+        json.dump({members[0]: members[1:] for members in clusters}, fd, indent=2)
+    print(len(clusters), "near-duplicate clusters (Jaccard >= %.2f), largest:" % dedupthreshold,
+          ", ".join("%s (%d)" % (members[0].split('/')[-1], len(members)) for members in clusters[:5]))
@@ -4,199 +4,303 @@
 # Licensed under the BSD 3-Clause License
 
 
+# Crawls the metadata of the GitHub repositories of a language into gitGrab.json (gitGrabFull.json
+# in full mode, which also fetches the languages of every repository). The search API returns at
+# most 1000 results per query, so the repositories are searched per creation day, and the star
+# range of a day is split (geometrically) until every partition has fewer results.
+#
+# Days are crawled concurrently, most recent first. Every request waits for a token of its API
+# resource (search or core); a resource's token bucket refills at the rate that spends the
+# remaining requests of its rate limit window (X-RateLimit-Remaining) by the reset time
+# (X-RateLimit-Reset), and is blocked until then when the limit is exceeded. Other failures are
+# retried with exponential backoff. Every finished partition is appended to a checkpoint log
+# (<output>.checkpoint.jsonl), so that a restarted crawl skips the finished days and partitions.
+# See mock_github.py for a local mock of the API. The requests (throughput, slowest, failures per
+# reason) are reported to <basedir>/metrics/gitgrab-<language>.json (see instrumentation.py).
+#
+# Usage: ./gitgrab.py [<basedir> [<language> [fast|full [<maxprojects> [<minstars> [<maxsize>]]]]]]
+#                     [--jobs N] [--api-url URL] [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+
+import argparse
+import asyncio
+import datetime
 import json
-from github import Github
-from tqdm import tqdm
-from datetime import date
-import pandas as pd
-import time
-#import traceback
+import math
+import os
+import random
 import sys
+import time
+import urllib.parse
 
+from tqdm import tqdm
 
-basedir = sys.argv[1] if len(sys.argv) > 1 else '.'
-language = sys.argv[2] if len(sys.argv) > 2 else 'python'
-full = True if len(sys.argv) > 3 and sys.argv[3].lower() == 'full' else False
-maxprojects = int(sys.argv[4]) if len(sys.argv) > 4 else 0
-minstars = int(sys.argv[5]) if len(sys.argv) > 5 else 2
-# maxsize (in kb)
-maxsize = int(sys.argv[6]) if len(sys.argv) > 6 else 0
-maxstars = 1000000
+from async_http import HTTPClient
+from instrumentation import StageMetrics
 
 
-basequery = 'language:'+language 
-
-if language == 'all':
-    basequery = ''
-elif language == 'javascript':
-    basequery = basequery + ' language:typescript'
-
-gitgrab = []
-
-daterange = pd.date_range(date(2008, 1,1), date.today())
-
-outfilename = basedir+('/gitGrabFull.json' if full else '/gitGrab.json')
-
-###################
-    
-
-
-with open('apikey.txt', 'r') as fd:
-    APIKEY = fd.read().rstrip()
-
-
-if not APIKEY:
-    print("Please first paste your API key in file apikey.txt!")
-    sys.exit(1)
-
-#print("APIKEY =", APIKEY)
-# Access by token
-g = Github(APIKEY, per_page=100)
-
-###################
-
-
-def cooldown(g):
-    first = True
-    remainingthreshold = 100 if full else 50
-    while True:
-        try:
-            core = g.get_rate_limit().core
-            search = g.get_rate_limit().search
-            if core.remaining >= remainingthreshold and search.remaining >= 5: return
-            #TODO: check with resettime
-            if first:
-                print("Cooling down until:", core.reset.isoformat(), 'UTC', core, search)
-            first = False
-            time.sleep(60)
-        except:
-            #traceback.print_exc()
-            time.sleep(5)
-
-def search_repos(g, query):
-    repos = None
-    cooldown(g)
-    while repos == None:
-        try:
-            repos = g.search_repositories(query=query)
-        except:
-            print("RETRYING REPOS")
-            time.sleep(30)
-    return repos
-
-def count_repos(g, query):
-    repos = search_repos(g, query)
-    count = None
-    while count == None:
-        try:
-            count = repos.totalCount
-        except:
-            print("COUNT ISSUE")
-            time.sleep(30)
-    return count
-
-def fetch_repos(g, gitgrab, query):
-    repos = search_repos(g, query)
-
-    #cut off
-    maxnewprojects = maxprojects - len(gitgrab) if maxprojects else 0
-    if maxnewprojects < 0:
-        return 0
-
-    newgitgrab = None
-    while newgitgrab == None:
-        try:
-            newgitgrab = []
-            for idx, repo in tqdm(enumerate(repos)):
-                cooldown(g)
-
-                if maxsize and repo.size > maxsize:
-                    print("Skipping oversized project", repo.full_name, ":", repo.size, "kb")
-                    continue
+parser = argparse.ArgumentParser(description='Crawl the metadata of the GitHub repositories of a language.')
+parser.add_argument('basedir', nargs='?', default='.')
+parser.add_argument('language', nargs='?', default='python')
+parser.add_argument('mode', nargs='?', default='fast', help='full: also fetch the languages of every repository')
+parser.add_argument('maxprojects', nargs='?', type=int, default=0, help='max # repositories (default = 0: all)')
+parser.add_argument('minstars', nargs='?', type=int, default=2)
+parser.add_argument('maxsize', nargs='?', type=int, default=0, help='max repository size in kb (default = 0: any)')
+parser.add_argument('--jobs', type=int, default=8, help='days crawled concurrently')
+parser.add_argument('--api-url', default='https://api.github.com')
+parser.add_argument('--since', default='2008-01-01', help='first creation day')
+parser.add_argument('--until', default=datetime.date.today().isoformat(), help='last creation day')
 
-                license = ""
-                try:
-                    if full: license = repo.get_license().license.key
-                except: 
-                    pass
-                topics = []
-                try:
-                    if full: topics = repo.get_topics()
-                except:
-                    pass
-                languages = [repo.language]
-                try:
-                    if full: languages = repo.get_languages()
-                except:
-                    pass
-        
-                newgitgrab.append({
-                    'full_name':repo.full_name,
-                    'description': repo.description,
-                    'topics': topics,
-                    'git_url': repo.git_url,
-                    'stars': repo.stargazers_count,
-                    'watchers': repo.watchers_count,
-                    'forks': repo.forks,
-                    'created': repo.created_at.isoformat()+'Z',
-                    'size': repo.size,
-                    'license': license,
-                    'language': repo.language,
-                    'languages': languages,
-                    'last_updated': repo.updated_at.isoformat()+'Z',
-                })
-                if maxnewprojects and len(newgitgrab) >= maxnewprojects:
-                    break;
-            gitgrab.extend(newgitgrab)
-        except:
-            print("Retrying BLOCK")
-            newgitgrab = None
-            time.sleep(30)
-    return len(newgitgrab)
-
-def print_rate_limit(g, d, count):
-    try:
-        print(d, count, "repos", g.get_rate_limit())
-    except:
-        print(d, count, "repos")
-
-
-for idx, d in enumerate(reversed(daterange)):
-    query = '%s stars:%d..%d created:%s' % (basequery, minstars, maxstars, d.strftime("%Y-%m-%d"))
-    count = count_repos(g, query)
-    newcount = 0
-    if count < 1000:
-        print_rate_limit(g, d, count)
-        newcount += fetch_repos(g, gitgrab, query)
-    else:
-        curminstars = minstars
-        curmaxstars = 4
-        while curminstars < maxstars:
-            query = '%s stars:%d..%d created:%s' % (basequery, curminstars, curmaxstars, d.strftime("%Y-%m-%d"))
-            count = count_repos(g, query)
-            print("Splitting [%d..%d]: %d"%(curminstars, curmaxstars, count))
-            if count >= 1000 and curmaxstars > curminstars:
-                curmaxstars -= max(1, (curmaxstars - curminstars)//2)
+maxstars = 1000000
+# max # search results (GitHub's limit), and per page
+max_results = 1000
+per_page = 100
+# tokens a bucket can save up
+burst = 4
+# request attempts before a partition fails
+max_attempts = 10
+# max backoff after a failure (seconds)
+max_backoff = 60
+
+
+class CrawlError(Exception):
+    pass
+
+
+#token bucket of an API resource, driven by the rate limit headers of its responses
+class TokenBucket:
+
+    def __init__(self, limit, window):
+        self.rate = limit / window
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            wait = self.blocked_until - time.time()
+            if wait <= 0:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def update(self, headers):
+        if 'x-ratelimit-remaining' not in headers:
+            return
+        remaining = int(headers['x-ratelimit-remaining'])
+        reset = int(headers.get('x-ratelimit-reset', time.time() + 60))
+        self.refill()
+        self.rate = max(remaining, 1) / max(1, reset - time.time())
+        if remaining == 0:
+            self.block(reset + 1)
+
+    #no requests until a time (e.g. the reset of an exhausted window)
+    def block(self, until):
+        if until > self.blocked_until:
+            self.blocked_until = until
+            self.tokens = 0
+            self.rate = max(self.rate, 1 / max(1, until - time.time()))
+
+
+class Crawler:
+
+    def __init__(self, args, apikey, checkpointfile):
+        headers = {'Accept': 'application/vnd.github.v3+json', 'User-Agent': 'code-compass-gitgrab'}
+        if apikey:
+            headers['Authorization'] = 'token ' + apikey
+        self.args = args
+        self.full = args.mode.lower() == 'full'
+        self.client = HTTPClient(args.api_url, headers, connections=2 * args.jobs)
+        self.buckets = {'search': TokenBucket(30, 60), 'core': TokenBucket(5000, 3600)}
+        self.basequery = '' if args.language == 'all' else 'language:' + args.language
+        if args.language == 'javascript':
+            self.basequery += ' language:typescript'
+        self.checkpointfile = checkpointfile
+        self.partitions, self.days = read_checkpoint(checkpointfile)
+        self.count = sum(len(repos) for repos in self.partitions.values())
+        self.requests = 0
+        self.metrics = StageMetrics('gitgrab', 'requests', {'language': args.language})
+
+    def enough(self):
+        return self.args.maxprojects and self.count >= self.args.maxprojects
+
+    #decoded response of a GET request, retried until it succeeds
+    async def api(self, resource, target):
+        bucket = self.buckets[resource]
+        for attempt in range(max_attempts):
+            await bucket.acquire()
+            self.requests += 1
+            t0 = time.perf_counter()
+            try:
+                response = await self.client.get(target)
+            except (OSError, EOFError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                error = repr(e)
+                self.metrics.fail(type(e).__name__)
+            else:
+                self.metrics.item(target, len(response.body), time.perf_counter() - t0)
+                bucket.update(response.headers)
+                if response.status == 200:
+                    return json.loads(response.body)
+                if response.status in (403, 429) and ('retry-after' in response.headers or
+                                                      response.headers.get('x-ratelimit-remaining') == '0'):
+                    if 'retry-after' in response.headers:
+                        bucket.block(time.time() + int(response.headers['retry-after']))
+                    #rate limited requests are not failures
+                    self.metrics.count('rate_limited')
+                    continue
+                error = "HTTP %d" % response.status
+                self.metrics.fail(error)
+                if response.status in (404, 422):
+                    raise CrawlError("%d %s: %s" % (response.status, target, response.body[:200]))
+            await asyncio.sleep(min(max_backoff, 2 ** attempt) * random.uniform(0.5, 1))
+        raise CrawlError("%s failed %d times, last: %s" % (target, max_attempts, error))
+
+    async def search(self, query, page):
+        return await self.api('search', '/search/repositories?' + urllib.parse.urlencode(
+            {'q': query, 'per_page': per_page, 'page': page}))
+
+    async def record(self, repo):
+        languages = [repo['language']]
+        if self.full:
+            languages = await self.api('core', '/repos/%s/languages' % repo['full_name'])
+        return {
+            'full_name': repo['full_name'],
+            'description': repo['description'],
+            'topics': repo.get('topics', []) if self.full else [],
+            'git_url': repo['git_url'],
+            'stars': repo['stargazers_count'],
+            'watchers': repo['watchers_count'],
+            'forks': repo['forks'],
+            'created': repo['created_at'],
+            'size': repo['size'],
+            'license': ((repo.get('license') or {}).get('key') or '') if self.full else '',
+            'language': repo['language'],
+            'languages': languages,
+            'last_updated': repo['updated_at'],
+        }
+
+    #records of a partition, or None if it has too many results and can be split
+    async def crawl_partition(self, day, low, high):
+        query = '%s stars:%d..%d created:%s' % (self.basequery, low, high, day)
+        first = await self.search(query, 1)
+        count = first['total_count']
+        if count > max_results and high > low:
+            return None
+        if count > max_results:
+            tqdm.write("%s stars:%d..%d: only the first %d of %d repositories are available" % (day, low, high, max_results, count))
+        pages = [first] + list(await asyncio.gather(*[
+            self.search(query, page) for page in range(2, math.ceil(min(count, max_results) / per_page) + 1)]))
+        repos = [repo for page in pages for repo in page['items']
+                 if not (self.args.maxsize and repo['size'] > self.args.maxsize)]
+        return list(await asyncio.gather(*[self.record(repo) for repo in repos]))
+
+    async def crawl_day(self, day):
+        ranges = [(self.args.minstars, maxstars)]
+        while ranges:
+            if self.enough():
+                return
+            low, high = ranges.pop()
+            key = partition_key(day, low, high)
+            if key in self.partitions:
                 continue
-            print_rate_limit(g, d, count)
-            newcount += fetch_repos(g, gitgrab, query)
-            curminstars = curmaxstars + 1
-            curmaxstars = maxstars 
- 
-    #cut off
-    if maxprojects and len(gitgrab) >= maxprojects:
-        gitgrab = gitgrab[:maxprojects]
-        break
-
-    # dump every 7 days 
-    if idx % 7 == 6:            
-        print(f"DUMPING {len(gitgrab)}, {newcount} NEW")
-        with open(outfilename, 'wt') as fd:
-            fd.write(json.dumps(gitgrab))
-
-        
-# Write final results        
-with open(outfilename, 'wt') as fd:
-    fd.write(json.dumps(gitgrab))
-
-
+            records = await self.crawl_partition(day, low, high)
+            if records is None:
+                middle = min(high - 1, max(low, int(math.sqrt(max(low, 1) * high))))
+                ranges.extend([(middle + 1, high), (low, middle)])
+                continue
+            self.partitions[key] = records
+            self.count += len(records)
+            self.checkpoint({'day': day, 'stars': [low, high], 'repos': records})
+        self.days.add(day)
+        self.checkpoint({'day': day, 'done': True})
+
+    def checkpoint(self, entry):
+        with open(self.checkpointfile, 'a', encoding='utf-8') as fd:
+            fd.write(json.dumps(entry) + '\n')
+
+    async def worker(self, days, progress):
+        while days and not self.enough():
+            day = days.pop(0)
+            try:
+                await self.crawl_day(day)
+            except CrawlError as e:
+                tqdm.write("Skipping %s: %s" % (day, e))
+                self.metrics.skip('failed day')
+            progress.update(1)
+            progress.set_postfix(repos=self.count, requests=self.requests)
+
+    async def run(self, days):
+        pending = [day for day in days if day not in self.days]
+        self.metrics.skip('checkpointed day', len(days) - len(pending))
+        days = pending
+        with tqdm(total=len(days)) as progress:
+            await asyncio.gather(*[self.worker(days, progress) for _ in range(self.args.jobs)])
+        self.client.close()
+
+
+def partition_key(day, low, high):
+    return '%s %d..%d' % (day, low, high)
+
+
+#({partition key: records}, finished days) of a checkpoint log
+def read_checkpoint(filename):
+    partitions, days = {}, set()
+    if os.path.isfile(filename):
+        with open(filename, encoding='utf-8') as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    #a line cut by a crash
+                    continue
+                if entry.get('done'):
+                    days.add(entry['day'])
+                else:
+                    partitions[partition_key(entry['day'], *entry['stars'])] = entry['repos']
+    return partitions, days
+
+
+#the distinct repositories of the partitions, most recent days first
+def collect(partitions, maxprojects=0):
+    gitgrab, seen = [], set()
+    for key in sorted(partitions, key=lambda key: key.split()[0], reverse=True):
+        for record in partitions[key]:
+            if record['full_name'] not in seen:
+                seen.add(record['full_name'])
+                gitgrab.append(record)
+    return gitgrab[:maxprojects] if maxprojects else gitgrab
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    outfilename = args.basedir+('/gitGrabFull.json' if args.mode.lower() == 'full' else '/gitGrab.json')
+
+    APIKEY = ''
+    if os.path.isfile('apikey.txt'):
+        with open('apikey.txt', 'r') as fd:
+            APIKEY = fd.read().rstrip()
+    #a mock API needs no key
+    if not APIKEY and args.api_url == parser.get_default('api_url'):
+        print("Please first paste your API key in file apikey.txt!")
+        sys.exit(1)
+
+    since, until = datetime.date.fromisoformat(args.since), datetime.date.fromisoformat(args.until)
+    days = [(until - datetime.timedelta(days=i)).isoformat() for i in range((until - since).days + 1)]
+    crawler = Crawler(args, APIKEY, outfilename.replace('.json', '.checkpoint.jsonl'))
+    t0 = time.perf_counter()
+    asyncio.run(crawler.run(days))
+
+    gitgrab = collect(crawler.partitions, args.maxprojects)
+    with open(outfilename + '.tmp', 'wt') as fd:
+        fd.write(json.dumps(gitgrab))
+    os.replace(outfilename + '.tmp', outfilename)
+    print("%d repositories written to %s, %d requests in %.0fs" % (len(gitgrab), outfilename, crawler.requests, time.perf_counter() - t0))
+    crawler.metrics.count('repositories', len(gitgrab))
+    crawler.metrics.write(args.basedir)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Binary columnar format for the processed import dataset, loadable with numpy.memmap:
+#
+#   import_ids.bin       int32   import id of every import, grouped per file, files grouped per project
+#   file_offsets.bin     int64   (#files+1) file i has the imports import_ids[file_offsets[i]:file_offsets[i+1]]
+#   project_offsets.bin  int64   (#projects+1) project p has the files project_offsets[p]:project_offsets[p+1]
+#   <table>.bin, <table>_offsets.bin   uint8/int64   utf-8 string tables for imports, files and projects
+#   meta.json            counts and dtypes
+#
+# Import names are interned: each one is stored once, and referenced by its id everywhere else.
+# As the files of a project are contiguous, so are its imports.
+#
+# Usage: ./import_columns.py <basedir>     (converts processed/*.json.gz into processed/columns)
+#        ./import_columns.py <columnsdir>  (prints the size of a columnar dataset and its load time)
+
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from import_dataset import iter_projects
+
+
+format_version = 1
+
+ARRAYS = {
+        'import_ids':       np.int32,
+        'file_offsets':     np.int64,
+        'project_offsets':  np.int64,
+        'imports':          np.uint8,
+        'imports_offsets':  np.int64,
+        'files':            np.uint8,
+        'files_offsets':    np.int64,
+        'projects':         np.uint8,
+        'projects_offsets': np.int64,
+}
+
+
+def columns_dir(basedir):
+    return basedir+'/processed/columns'
+
+
+class StringTableWriter:
+
+    def __init__(self, dirname, name):
+        self.fd = open(dirname+'/'+name+'.bin', 'wb')
+        self.offsetsfd = open(dirname+'/'+name+'_offsets.bin', 'wb')
+        self.offset = 0
+        self.offsetsfd.write(np.int64(0).tobytes())
+
+    def add(self, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        self.fd.write(b''.join(encoded))
+        lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+        self.offsetsfd.write((self.offset + np.cumsum(lengths)).tobytes())
+        self.offset += int(lengths.sum())
+
+    #adds strings already encoded as a byte array and their lengths
+    def add_encoded(self, data, lengths):
+        self.fd.write(np.asarray(data).tobytes())
+        self.offsetsfd.write((self.offset + np.cumsum(lengths, dtype=np.int64)).tobytes())
+        self.offset += int(np.sum(lengths))
+
+    def close(self):
+        self.fd.close()
+        self.offsetsfd.close()
+
+
+#streams (project, fileimports) pairs to disk; only the import name -> id table stays in memory
+class ColumnsWriter:
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.tmpdirname = dirname + '.tmp'
+        shutil.rmtree(self.tmpdirname, ignore_errors=True)
+        os.makedirs(self.tmpdirname)
+        self.importids = {}
+        self.importnames = []
+        self.idsfd = open(self.tmpdirname+'/import_ids.bin', 'wb')
+        self.fileoffsetsfd = open(self.tmpdirname+'/file_offsets.bin', 'wb')
+        self.projectoffsetsfd = open(self.tmpdirname+'/project_offsets.bin', 'wb')
+        self.files = StringTableWriter(self.tmpdirname, 'files')
+        self.projects = StringTableWriter(self.tmpdirname, 'projects')
+        self.nimports = 0
+        self.nfiles = 0
+        self.nprojects = 0
+        self.fileoffsetsfd.write(np.int64(0).tobytes())
+        self.projectoffsetsfd.write(np.int64(0).tobytes())
+
+    def intern(self, imp):
+        importid = self.importids.get(imp)
+        if importid is None:
+            importid = self.importids[imp] = len(self.importnames)
+            self.importnames.append(imp)
+        return importid
+
+    def add(self, project, fileimports):
+        ids = [self.intern(imp) for imports in fileimports.values() for imp in imports]
+        self.idsfd.write(np.array(ids, dtype=np.int32).tobytes())
+        lengths = np.fromiter((len(imports) for imports in fileimports.values()), dtype=np.int64, count=len(fileimports))
+        self.fileoffsetsfd.write((self.nimports + np.cumsum(lengths)).tobytes())
+        self.nimports += len(ids)
+        self.nfiles += len(fileimports)
+        self.nprojects += 1
+        self.projectoffsetsfd.write(np.int64(self.nfiles).tobytes())
+        self.files.add(fileimports.keys())
+        self.projects.add([project])
+
+    #copies the projects start:end of another columnar dataset, as if they were added one by one
+    #(their import ids are interned in order of first appearance)
+    def add_columns(self, columns, start, end):
+        f0, f1 = int(columns.project_offsets[start]), int(columns.project_offsets[end])
+        ids = np.asarray(columns.import_ids[columns.file_offsets[f0]:columns.file_offsets[f1]])
+        distinct, first = np.unique(ids, return_index=True)
+        distinct = distinct[np.argsort(first)]
+        remap = np.zeros(len(columns.imports), dtype=np.int32)
+        remap[distinct] = [self.intern(columns.imports[i]) for i in distinct.tolist()]
+        self.idsfd.write(remap[ids].tobytes())
+        self.fileoffsetsfd.write((self.nimports + np.cumsum(np.diff(columns.file_offsets[f0:f1+1]))).astype(np.int64).tobytes())
+        self.nimports += len(ids)
+        self.projectoffsetsfd.write((self.nfiles + np.asarray(columns.project_offsets[start+1:end+1]) - f0).astype(np.int64).tobytes())
+        self.nfiles += f1 - f0
+        self.nprojects += end - start
+        for table, writer, i0, i1 in [(columns.files, self.files, f0, f1), (columns.projects, self.projects, start, end)]:
+            writer.add_encoded(table.data[table.offsets[i0]:table.offsets[i1]], np.diff(table.offsets[i0:i1+1]))
+
+    #generator: passes on the (project, fileimports) pairs it stores
+    def tee(self, projectfileimports):
+        for project, fileimports in projectfileimports:
+            self.add(project, fileimports)
+            yield project, fileimports
+
+    def close(self):
+        imports = StringTableWriter(self.tmpdirname, 'imports')
+        imports.add(self.importnames)
+        for fd in [imports, self.files, self.projects, self.idsfd, self.fileoffsetsfd, self.projectoffsetsfd]:
+            fd.close()
+        meta = {'version': format_version, 'nimports': self.nimports, 'nfiles': self.nfiles,
+                'nprojects': self.nprojects, 'nimportnames': len(self.importnames),
+                'dtypes': {name: np.dtype(dtype).name for name, dtype in ARRAYS.items()}}
+        with open(self.tmpdirname+'/meta.json', 'w') as fd:
+            json.dump(meta, fd, indent=2)
+        shutil.rmtree(self.dirname, ignore_errors=True)
+        os.replace(self.tmpdirname, self.dirname)
+
+
+class StringTable:
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i+1]]).decode('utf-8')
+
+    def tolist(self):
+        data = bytes(self.data)
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i+1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+#memory-mapped, read-only view of a columnar dataset; all import lists are numpy views of import ids
+class ImportColumns:
+
+    def __init__(self, dirname):
+        with open(dirname+'/meta.json') as fd:
+            self.meta = json.load(fd)
+        if self.meta['version'] != format_version:
+            raise ValueError("Unsupported columnar dataset version %s in %s" % (self.meta['version'], dirname))
+        arrays = {}
+        for name, dtype in self.meta['dtypes'].items():
+            fname = dirname+'/'+name+'.bin'
+            #numpy cannot memory-map empty files
+            arrays[name] = np.memmap(fname, dtype=dtype, mode='r') if os.path.getsize(fname) > 0 else np.zeros(0, dtype=dtype)
+        self.import_ids = arrays['import_ids']
+        self.file_offsets = arrays['file_offsets']
+        self.project_offsets = arrays['project_offsets']
+        self.imports = StringTable(arrays['imports'], arrays['imports_offsets'])
+        self.files = StringTable(arrays['files'], arrays['files_offsets'])
+        self.projects = StringTable(arrays['projects'], arrays['projects_offsets'])
+
+    def __len__(self):
+        return len(self.project_offsets) - 1
+
+    def nfiles(self):
+        return len(self.file_offsets) - 1
+
+    def file_imports(self, f):
+        return self.import_ids[self.file_offsets[f]:self.file_offsets[f+1]]
+
+    def project_file_range(self, p):
+        return range(self.project_offsets[p], self.project_offsets[p+1])
+
+    #all imports of a project, i.e. of its files concatenated
+    def project_imports(self, p):
+        return self.import_ids[self.file_offsets[self.project_offsets[p]]:self.file_offsets[self.project_offsets[p+1]]]
+
+    #generator of (file index, import ids)
+    def iter_files(self):
+        offsets = self.file_offsets
+        for f in range(len(offsets) - 1):
+            yield f, self.import_ids[offsets[f]:offsets[f+1]]
+
+    #generator of (project index, import ids)
+    def iter_projects(self):
+        offsets = self.file_offsets[self.project_offsets]
+        for p in range(len(offsets) - 1):
+            yield p, self.import_ids[offsets[p]:offsets[p+1]]
+
+    #project index of every file
+    def file_projects(self):
+        return np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.project_offsets))
+
+    #number of imports of every import id
+    def import_counts(self):
+        return np.bincount(self.import_ids, minlength=len(self.imports))
+
+    #materializes the {project: {file: [import]}} dict of the json datasets
+    def to_dict(self):
+        importnames = self.imports.tolist()
+        files = self.files.tolist()
+        projects = self.projects.tolist()
+        projectfileimports = {}
+        for p, project in enumerate(projects):
+            projectfileimports[project] = {files[f]: [importnames[i] for i in self.file_imports(f)]
+                                           for f in self.project_file_range(p)}
+        return projectfileimports
+
+
+def convert_processed(basedir):
+    writer = ColumnsWriter(columns_dir(basedir))
+    for fname in sorted(glob.glob(basedir+'/processed/projectfileimports.*.json.gz')):
+        for project, fileimports in iter_projects(fname):
+            writer.add(project, fileimports)
+    writer.close()
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else '../datasets/python'
+    if not os.path.isfile(path+'/meta.json'):
+        convert_processed(path)
+        path = columns_dir(path)
+
+    t0 = time.perf_counter()
+    columns = ImportColumns(path)
+    counts = columns.import_counts()
+    print("%d projects, %d files, %d imports, %d distinct imports, loaded in %.2fs" % (
+        len(columns), columns.nfiles(), len(columns.import_ids), np.count_nonzero(counts), time.perf_counter() - t0))
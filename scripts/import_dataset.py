@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Streaming reader/writer for the import datasets: one project per line of a gzipped JSON Lines
+# file, as {"project": <name>, "fileimports": {<file>: [<import>, ...]}}. Neither side ever holds
+# more than one project in memory. The reader also accepts the former single-JSON-object shards.
+# Shards are written as a sequence of gzip members (with zero timestamps), each holding a block of
+# projects that ends at a project whose name hashes to 0 modulo block_size: the blocks only depend
+# on the projects around them, so that a shard can be patched by copying its unchanged members
+# (compressed), and the result is byte-identical to rewriting the whole shard.
+#
+# Usage: ./import_dataset.py <shard>   (prints the number of projects and files in a shard)
+
+import gzip
+import io
+import json
+import os
+import sys
+import zlib
+
+
+# mean # projects per block (gzip member) of a shard
+block_size = 8
+
+
+def raw_dataset_file(basedir, dsidx):
+    return basedir+'/raw/raw-import-ds%02d.jsonl.gz'%dsidx
+
+
+#raw shards of a dataset folder, ordered by index, preferring the JSON Lines shard over a legacy one
+def list_raw_dataset_files(basedir):
+    shards = {}
+    for fname in sorted(os.listdir(basedir+'/raw')) if os.path.isdir(basedir+'/raw') else []:
+        for ext in ['.jsonl.gz', '.json.gz']:
+            if fname.startswith('raw-import-ds') and fname.endswith(ext):
+                dsidx = fname[len('raw-import-ds'):-len(ext)]
+                if dsidx.isdigit() and (int(dsidx) not in shards or ext == '.jsonl.gz'):
+                    shards[int(dsidx)] = basedir+'/raw/'+fname
+    return [(dsidx, shards[dsidx]) for dsidx in sorted(shards)]
+
+
+#yields (project, fileimports) pairs
+def iter_projects(filename):
+    with gzip.open(filename, 'rt', encoding='utf-8') as fd:
+        if not filename.endswith('.jsonl.gz'):
+            yield from json.loads(fd.read()).items()
+            return
+        for line in fd:
+            if line.strip():
+                record = json.loads(line)
+                yield record['project'], record['fileimports']
+
+
+#whether a project is the last of its block
+def block_end(project):
+    return zlib.crc32(project.encode('utf-8')) % block_size == 0
+
+
+#[(start, end)] of the blocks of a list of project names
+def split_blocks(projects):
+    ends = [i + 1 for i, project in enumerate(projects) if block_end(project)]
+    if projects and (not ends or ends[-1] != len(projects)):
+        ends.append(len(projects))
+    return list(zip([0] + ends[:-1], ends))
+
+
+#writes a shard atomically, as gzip members of text blocks, or copies of compressed blocks
+class ShardWriter:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = open(filename + '.tmp', 'wb')
+        self.member = None
+        self.offset = 0
+
+    def write(self, text):
+        if self.member is None:
+            self.member = gzip.GzipFile('', 'wb', fileobj=self.fd, mtime=0)
+        self.member.write(text.encode('utf-8'))
+
+    #[offset, length] of the block written since the previous one (empty if nothing was written)
+    def end_block(self):
+        if self.member is not None:
+            self.member.close()
+            self.member = None
+        return self.block()
+
+    def copy_block(self, data):
+        self.fd.write(data)
+        return self.block()
+
+    def block(self):
+        offset, self.offset = self.offset, self.fd.tell()
+        return [offset, self.offset - offset]
+
+    def close(self):
+        self.end_block()
+        self.fd.close()
+        os.replace(self.filename + '.tmp', self.filename)
+
+
+#(compressed data, text) of a block [offset, length] of a shard
+def read_block(filename, block):
+    with open(filename, 'rb') as fd:
+        fd.seek(block[0])
+        data = fd.read(block[1])
+    return data, gzip.decompress(data).decode('utf-8')
+
+
+def project_line(project, fileimports):
+    return json.dumps({'project': project, 'fileimports': fileimports}, sort_keys=True) + '\n'
+
+
+#(project, fileimports) pairs of the text of a block of a JSON Lines shard
+def block_projects(text):
+    for line in text.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            yield record['project'], record['fileimports']
+
+
+#streams (project, fileimports) pairs into a shard, written atomically; returns the # projects
+def write_projects(filename, projects):
+    writer = ShardWriter(filename)
+    nprojects = 0
+    for project, fileimports in projects:
+        writer.write(project_line(project, fileimports))
+        if block_end(project):
+            writer.end_block()
+        nprojects += 1
+    writer.close()
+    return nprojects
+
+
+#an entry of a single-JSON-object shard
+def project_entry(project, fileimports, first):
+    return ('\n' if first else ',\n') + json.dumps(project) + ': ' + json.dumps(fileimports)
+
+
+#streams (project, fileimports) pairs into a single gzipped JSON object {project: fileimports},
+#the format the training notebook loads
+def write_projects_json(filename, projects):
+    writer = ShardWriter(filename)
+    writer.write('{')
+    writer.end_block()
+    nprojects = 0
+    for project, fileimports in projects:
+        writer.write(project_entry(project, fileimports, nprojects == 0))
+        if block_end(project):
+            writer.end_block()
+        nprojects += 1
+    writer.end_block()
+    writer.write('\n}\n')
+    writer.close()
+    return nprojects
+
+
+if __name__ == '__main__':
+    for filename in sys.argv[1:]:
+        nprojects = nfiles = 0
+        for project, fileimports in iter_projects(filename):
+            nprojects += 1
+            nfiles += len(fileimports)
+        print(filename, nprojects, "projects", nfiles, "files")
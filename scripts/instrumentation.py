@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Instrumentation of the pipeline stages (gitgrab.py, extract_tarballs.py, create_import_dataset.py
+# and filter_import_dataset.py). Every stage records in a StageMetrics its processed items (API
+# requests, source files, projects or blocks) with their size and time, the skipped and failed
+# items per reason, the time of its phases, and its wall and CPU time and peak RSS (including its
+# worker processes). At the end, a stage writes <metricsdir>/<stage>.json and a Prometheus textfile
+# <metricsdir>/<stage>.prom (for the textfile collector of node_exporter), with <metricsdir> =
+# $CODECOMPASS_METRICS, or else <basedir>/metrics.
+#
+# Setting CODECOMPASS_PROFILE=<hz> enables a sampling profiler: the stack of the main thread is
+# sampled <hz> times per CPU second (SIGPROF), in every worker process too. The report then lists
+# the functions with the most samples, and all sampled stacks are written in the folded format of
+# flamegraph.pl and speedscope to <metricsdir>/<stage>.folded. (Samples that fall in a long call
+# into C code are attributed to its Python caller, and coalesce into one.)
+#
+# Usage: ./instrumentation.py [<basedir>|<metricsdir>]   (prints a summary of the stage reports)
+
+import glob
+import heapq
+import json
+import os
+import resource
+import signal
+import sys
+import time
+from contextlib import contextmanager
+
+
+# slowest items kept per stage
+slowest_items = 10
+# functions listed in the profile of a report
+profile_top = 20
+
+
+def metrics_dir(basedir):
+    return os.environ.get('CODECOMPASS_METRICS') or basedir+'/metrics'
+
+
+#peak RSS in bytes of this process and of its terminated child processes
+def peak_rss():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return scale * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def write_atomic(filename, text):
+    tmpfilename = filename + '.tmp'
+    with open(tmpfilename, 'w') as fd:
+        fd.write(text)
+    os.replace(tmpfilename, filename)
+
+
+#SIGPROF-driven sampler of the stacks of the main thread, as {'file:function;...': # samples}
+class SamplingProfiler:
+
+    def __init__(self, hz):
+        self.hz = hz
+        self.samples = {}
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append('%s:%s' % (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+            frame = frame.f_back
+        key = ';'.join(reversed(stack))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    #(re)starts sampling, e.g. in a forked worker process, which does not inherit the timer
+    def start(self):
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, 1 / self.hz, 1 / self.hz)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+    def drain(self):
+        samples, self.samples = self.samples, {}
+        return samples
+
+
+def profiler_from_env():
+    hz = float(os.environ.get('CODECOMPASS_PROFILE') or 0)
+    return SamplingProfiler(hz) if hz > 0 else None
+
+
+def merge_counts(counts, other):
+    for key, value in other.items():
+        counts[key] = counts.get(key, 0) + value
+
+
+#[[function, self samples, total samples]] of the functions with the most samples
+def profile_functions(samples, top=profile_top):
+    selfcounts, totalcounts = {}, {}
+    for stack, count in samples.items():
+        frames = stack.split(';')
+        selfcounts[frames[-1]] = selfcounts.get(frames[-1], 0) + count
+        for function in set(frames):
+            totalcounts[function] = totalcounts.get(function, 0) + count
+    functions = sorted(totalcounts, key=lambda function: (-selfcounts.get(function, 0), -totalcounts[function], function))
+    return [[function, selfcounts.get(function, 0), totalcounts[function]] for function in functions[:top]]
+
+
+class StageMetrics:
+
+    #unit: what the items are; labels: e.g. {'language': 'python'}, also part of the report name
+    def __init__(self, stage, unit='files', labels={}):
+        self.stage = stage
+        self.unit = unit
+        self.labels = dict(labels)
+        self.start = time.perf_counter()
+        self.profiler = profiler_from_env()
+        self.reset()
+        if self.profiler is not None:
+            self.profiler.start()
+
+    #clears the recorded items, e.g. in a forked worker process
+    def reset(self):
+        self.items = 0
+        self.bytes = 0
+        self.slowest = []
+        self.skipped = {}
+        self.failed = {}
+        self.counters = {}
+        self.phases = {}
+        self.samples = {}
+        self.cpu = time.process_time()
+        self.worker_cpu = 0
+        self.worker_rss = 0
+
+    #Pool initializer of the worker processes: their records are returned with partial()
+    def init_worker(self):
+        self.reset()
+        if self.profiler is not None:
+            self.profiler.drain()
+            self.profiler.start()
+
+    def item(self, name, nbytes, seconds):
+        self.items += 1
+        self.bytes += nbytes
+        if len(self.slowest) < slowest_items:
+            heapq.heappush(self.slowest, (seconds, name, nbytes))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, name, nbytes))
+
+    def skip(self, reason, count=1):
+        self.skipped[reason] = self.skipped.get(reason, 0) + count
+
+    def fail(self, reason, count=1):
+        self.failed[reason] = self.failed.get(reason, 0) + count
+
+    def count(self, key, value=1):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - t0
+
+    #the records of a worker process since its last partial(), to merge() into the stage metrics
+    def partial(self):
+        cpu = time.process_time()
+        partial = {'items': self.items, 'bytes': self.bytes, 'slowest': self.slowest, 'skipped': self.skipped,
+                   'failed': self.failed, 'counters': self.counters, 'cpu': cpu - self.cpu, 'rss': peak_rss(),
+                   'samples': self.profiler.drain() if self.profiler is not None else {}}
+        self.reset()
+        self.cpu = cpu
+        return partial
+
+    def merge(self, partial):
+        self.items += partial['items']
+        self.bytes += partial['bytes']
+        self.slowest = heapq.nlargest(slowest_items, self.slowest + [tuple(item) for item in partial['slowest']])
+        heapq.heapify(self.slowest)
+        merge_counts(self.skipped, partial['skipped'])
+        merge_counts(self.failed, partial['failed'])
+        merge_counts(self.counters, partial['counters'])
+        merge_counts(self.samples, partial['samples'])
+        self.worker_cpu += partial['cpu']
+        self.worker_rss = max(self.worker_rss, partial['rss'])
+
+    def name(self):
+        return '-'.join([self.stage] + [str(value) for value in self.labels.values()])
+
+    def report(self):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu + self.worker_cpu
+        report = {
+            'stage': self.stage, 'labels': self.labels, 'unit': self.unit, 'timestamp': time.time(),
+            'items': self.items, 'bytes': self.bytes, 'wall_seconds': wall, 'cpu_seconds': cpu,
+            'items_per_second': self.items / wall if wall > 0 else 0, 'bytes_per_second': self.bytes / wall if wall > 0 else 0,
+            'peak_rss_bytes': max(peak_rss(), self.worker_rss),
+            'slowest': [[name, seconds, nbytes] for seconds, name, nbytes in sorted(self.slowest, reverse=True)],
+            'skipped': self.skipped, 'failed': self.failed, 'counters': self.counters, 'phases': self.phases,
+        }
+        if self.profiler is not None:
+            samples = self.all_samples()
+            report['profile'] = {'hz': self.profiler.hz, 'samples': sum(samples.values()), 'functions': profile_functions(samples)}
+        return report
+
+    def all_samples(self):
+        samples = dict(self.samples)
+        if self.profiler is not None:
+            merge_counts(samples, self.profiler.samples)
+        return samples
+
+    #writes the json report, the Prometheus textfile and the folded profile; returns the report
+    def write(self, basedir):
+        if self.profiler is not None:
+            self.profiler.stop()
+        report = self.report()
+        outdir = metrics_dir(basedir)
+        os.makedirs(outdir, exist_ok=True)
+        write_atomic(outdir+'/'+self.name()+'.json', json.dumps(report, indent=2) + '\n')
+        write_atomic(outdir+'/'+self.name()+'.prom', prometheus_text(report))
+        if self.profiler is not None:
+            write_atomic(outdir+'/'+self.name()+'.folded', ''.join('%s %d\n' % sample for sample in sorted(self.all_samples().items())))
+        print(summary(report))
+        return report
+
+
+def prometheus_labels(labels):
+    return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for key, value in labels.items()) + '}'
+
+
+#Prometheus text exposition format of a report
+def prometheus_text(report):
+    labels = dict(report['labels'], stage=report['stage'])
+    metrics = [
+        ('items_total', 'counter', 'Items processed by the stage', [({'unit': report['unit']}, report['items'])]),
+        ('bytes_total', 'counter', 'Bytes processed by the stage', [({}, report['bytes'])]),
+        ('items_per_second', 'gauge', 'Items processed per wall second', [({'unit': report['unit']}, report['items_per_second'])]),
+        ('bytes_per_second', 'gauge', 'Bytes processed per wall second', [({}, report['bytes_per_second'])]),
+        ('wall_seconds', 'gauge', 'Wall time of the stage', [({}, report['wall_seconds'])]),
+        ('cpu_seconds', 'gauge', 'CPU time of the stage, including its worker processes', [({}, report['cpu_seconds'])]),
+        ('peak_rss_bytes', 'gauge', 'Peak resident set size of the stage processes', [({}, report['peak_rss_bytes'])]),
+        ('skipped_total', 'counter', 'Items skipped by the stage', [({'reason': reason}, count) for reason, count in sorted(report['skipped'].items())]),
+        ('failed_total', 'counter', 'Items failed in the stage', [({'reason': reason}, count) for reason, count in sorted(report['failed'].items())]),
+        ('counter', 'gauge', 'Stage specific counters', [({'name': key}, value) for key, value in sorted(report['counters'].items())]),
+        ('phase_seconds', 'gauge', 'Wall time of the phases of the stage', [({'phase': phase}, seconds) for phase, seconds in sorted(report['phases'].items())]),
+        ('last_run_timestamp_seconds', 'gauge', 'End time of the last run of the stage', [({}, report['timestamp'])]),
+    ]
+    lines = []
+    for name, metrictype, description, samples in metrics:
+        if not samples:
+            continue
+        lines.append('# HELP codecompass_stage_%s %s' % (name, description))
+        lines.append('# TYPE codecompass_stage_%s %s' % (name, metrictype))
+        for extralabels, value in samples:
+            lines.append('codecompass_stage_%s%s %s' % (name, prometheus_labels(dict(labels, **extralabels)), repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+def summary(report):
+    return ("[%s] %d %s, %.1f MB in %.1fs (%.1f %s/s, %.2f MB/s), cpu %.1fs, peak RSS %.0f MB, skipped %s, failed %s" %
+            ('-'.join([report['stage']] + [str(value) for value in report['labels'].values()]), report['items'], report['unit'],
+             report['bytes'] / 1e6, report['wall_seconds'], report['items_per_second'], report['unit'], report['bytes_per_second'] / 1e6,
+             report['cpu_seconds'], report['peak_rss_bytes'] / 1e6, report['skipped'] or 0, report['failed'] or 0))
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else '../datasets/python'
+    outdir = path if glob.glob(path+'/*.prom') else metrics_dir(path)
+    for filename in sorted(glob.glob(outdir+'/*.json')):
+        with open(filename) as fd:
+            report = json.load(fd)
+        print(summary(report))
+        if report['phases']:
+            print("  phases:", ", ".join("%s %.2fs" % phase for phase in report['phases'].items()))
+        for name, seconds, nbytes in report['slowest'][:5]:
+            print("  slowest: %-60s %8.3fs %10d bytes" % (name[-60:], seconds, nbytes))
+        for function, selfcount, totalcount in report.get('profile', {}).get('functions', [])[:10]:
+            print("  profile: %-60s %6d self %6d total" % (function[-60:], selfcount, totalcount))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Intent (category/tag) index of a vector store, built from the annotations of its libraries: the
+# sorted rows of the libraries of every intent (those annotated with it, or whose top-level library
+# is), and the categories of every library row, as CSR arrays aligned with the rows of the vector
+# store (see vector_store.py). Searches by intent score only the libraries of the intent, or mask
+# out the others while scoring (see query_engine.py), instead of filtering the nearest libraries
+# afterwards, and the categories of the nearest libraries are counted with a few array operations.
+#
+# The index is saved next to the vectors of the vector store:
+#
+#   intents.bin, intents_offsets.bin   uint8/int64  utf-8 string table of the intents, sorted
+#   intent_rows.bin                    int32    library rows, grouped per intent and sorted
+#   intent_offsets.bin                 int64    (intents+1) intent i has the rows intent_rows[intent_offsets[i]:intent_offsets[i+1]]
+#   library_intents.bin                int32    intent ids of the categories of every library, in annotation order
+#   library_offsets.bin                int64    (count+1)
+#   intents.json                       version, count and # intents
+#
+# Usage: ./intent_index.py <modeldir> [<dim>]   (builds the index from <modeldir>/annotations.json.gz)
+
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from import_columns import StringTable, StringTableWriter
+from vector_store import VectorStore, memmap, vector_store_dir
+
+
+format_version = 1
+# # intent masks kept in memory
+mask_cache_size = 64
+
+
+#the sub-libraries of a top-level library (e.g. Java group:artifact modules) are collapsed onto it
+def top_level(name):
+    return name.split(':')[0]
+
+
+#concatenation of the CSR lists of rows, with one fancy indexing operation
+def gather_csr(values, offsets, rows):
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return values[shifts + np.arange(len(shifts))]
+
+
+def write_intent_index(dirname, names, annotations):
+    intents = sorted(set(cat for a in annotations.values() for cat in a.get('categories', [])))
+    intentids = {intent: i for i, intent in enumerate(intents)}
+    libraryintents, libraryoffsets = [], [0]
+    memberrows, memberintents = [], []
+    for row, name in enumerate(names):
+        own = annotations.get(name, {}).get('categories', [])
+        libraryintents.extend(intentids[cat] for cat in own)
+        libraryoffsets.append(len(libraryintents))
+        parent = annotations.get(top_level(name), {}).get('categories', []) if top_level(name) != name else []
+        members = set(intentids[cat] for cat in own) | set(intentids[cat] for cat in parent)
+        memberrows.extend([row] * len(members))
+        memberintents.extend(members)
+    #rows grouped per intent, sorted within every intent
+    memberrows = np.array(memberrows, dtype=np.int32)
+    memberintents = np.array(memberintents, dtype=np.int32)
+    order = np.lexsort((memberrows, memberintents))
+    memberrows[order].tofile(dirname+'/intent_rows.bin')
+    np.concatenate([[0], np.cumsum(np.bincount(memberintents, minlength=len(intents)))]).astype(np.int64).tofile(dirname+'/intent_offsets.bin')
+    np.array(libraryintents, dtype=np.int32).tofile(dirname+'/library_intents.bin')
+    np.array(libraryoffsets, dtype=np.int64).tofile(dirname+'/library_offsets.bin')
+    table = StringTableWriter(dirname, 'intents')
+    table.add(intents)
+    table.close()
+    #written last: an index without it is incomplete
+    with open(dirname+'/intents.json', 'w') as fd:
+        json.dump({'version': format_version, 'count': len(names), 'intents': len(intents)}, fd, indent=2)
+
+
+#read-only, memory-mapped intent index
+class IntentIndex:
+
+    def __init__(self, dirname):
+        with open(dirname+'/intents.json') as fd:
+            self.meta = json.load(fd)
+        if self.meta['version'] != format_version:
+            raise ValueError("Unsupported intent index version %s in %s" % (self.meta['version'], dirname))
+        self.count = self.meta['count']
+        self.intents = StringTable(np.asarray(memmap(dirname+'/intents.bin', np.uint8)),
+                                   np.asarray(memmap(dirname+'/intents_offsets.bin', np.int64))).tolist()
+        self.intentids = {intent: i for i, intent in enumerate(self.intents)}
+        self.intent_rows = np.asarray(memmap(dirname+'/intent_rows.bin', np.int32))
+        self.intent_offsets = np.asarray(memmap(dirname+'/intent_offsets.bin', np.int64))
+        self.library_intents = np.asarray(memmap(dirname+'/library_intents.bin', np.int32))
+        self.library_offsets = np.asarray(memmap(dirname+'/library_offsets.bin', np.int64))
+        self.masks = {}
+
+    def __len__(self):
+        return len(self.intents)
+
+    def __contains__(self, intent):
+        return intent in self.intentids
+
+    #sorted library rows of an intent (none for unknown intents)
+    def rows(self, intent):
+        i = self.intentids.get(intent)
+        if i is None:
+            return self.intent_rows[:0]
+        return self.intent_rows[self.intent_offsets[i]:self.intent_offsets[i+1]]
+
+    #fraction of the libraries with an intent
+    def density(self, intent):
+        return len(self.rows(intent)) / max(1, self.count)
+
+    #boolean (count,) mask of the libraries of an intent, e.g. a QueryEngine.search() filter
+    def mask(self, intent):
+        mask = self.masks.pop(intent, None)
+        if mask is None:
+            mask = np.zeros(self.count, dtype=bool)
+            mask[self.rows(intent)] = True
+            if len(self.masks) >= mask_cache_size:
+                del self.masks[next(iter(self.masks))]
+        #most recently used last
+        self.masks[intent] = mask
+        return mask
+
+    def categories(self, row):
+        ids = self.library_intents[self.library_offsets[row]:self.library_offsets[row+1]]
+        return [self.intents[i] for i in ids]
+
+    #[[category, # libraries of rows with that category], ...], most frequent first, ties in order
+    #of first occurrence (as collections.Counter.most_common)
+    def category_counts(self, rows, limit=None):
+        ids = gather_csr(self.library_intents, self.library_offsets, np.asarray(rows, dtype=np.int64))
+        ids, first, counts = np.unique(ids, return_index=True, return_counts=True)
+        order = np.lexsort((first, -counts))[:limit]
+        return [[self.intents[i], count] for i, count in zip(ids[order].tolist(), counts[order].tolist())]
+
+
+#index of a vector store, (re)built on first use, and when it is outdated
+def load_intent_index(store, annotationsfile, annotations=None):
+    metafile = store.dirname+'/intents.json'
+    stale = not os.path.isfile(metafile)
+    if not stale:
+        with open(metafile) as fd:
+            meta = json.load(fd)
+        stale = (meta['version'] != format_version or meta['count'] != len(store) or
+                 (os.path.isfile(annotationsfile) and os.path.getmtime(annotationsfile) > os.path.getmtime(metafile)))
+    if stale:
+        if annotations is None:
+            annotations = {}
+            if os.path.isfile(annotationsfile):
+                with gzip.open(annotationsfile, 'rt', encoding='utf-8') as fd:
+                    annotations = json.load(fd)
+        write_intent_index(store.dirname, store.names.tolist(), annotations)
+    return IntentIndex(store.dirname)
+
+
+if __name__ == '__main__':
+    modeldir = sys.argv[1] if len(sys.argv) > 1 else '../datasets/python/models'
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    store = VectorStore(vector_store_dir(modeldir, dim))
+
+    t0 = time.perf_counter()
+    with gzip.open(modeldir+'/annotations.json.gz', 'rt', encoding='utf-8') as fd:
+        annotations = json.load(fd)
+    write_intent_index(store.dirname, store.names.tolist(), annotations)
+    index = IntentIndex(store.dirname)
+    print("Intent index of %d intents over %d libraries built in %.1fs" % (len(index), index.count, time.perf_counter() - t0))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Preprocessing manifest of a dataset folder (<basedir>/manifest.json), for incremental rebuilds.
+# Every stage records the inputs its outputs were built from, and with --incremental only
+# rebuilds the outputs whose inputs changed:
+#
+#   projects   extract_tarballs.py: per project tarball (relative to basedir), its size, mtime
+#              and sha1, the extractor version, and the status, stat and sha1 of its <project>.json
+#   raw        create_import_dataset.py: per raw shard, the digest of the (project file, sha1)
+#              pairs of every block (see import_dataset.py) with its offset, length and # projects,
+#              their digest, and the stat of the shard
+#   processed  filter_import_dataset.py: per raw shard, the configuration and raw block digests its
+#              cached dedup keys (processed/dedup-keys) were computed from; per processed shard the
+#              digest (raw block, configuration and kept projects), offset, length and # projects of
+#              every block, and its stat; and the stat of the columnar dataset
+#
+# A file is assumed unchanged while its size and mtime are; otherwise it is hashed.
+#
+# Usage: ./manifest.py [<basedir>]   (prints a summary of the manifest)
+
+import hashlib
+import json
+import os
+import sys
+
+
+format_version = 1
+
+
+def manifest_file(basedir):
+    return basedir+'/manifest.json'
+
+
+def load_manifest(basedir):
+    if os.path.isfile(manifest_file(basedir)):
+        with open(manifest_file(basedir)) as fd:
+            manifest = json.load(fd)
+        if manifest.get('version') == format_version:
+            return manifest
+    return {'version': format_version, 'projects': {}, 'raw': {}, 'processed': {}}
+
+
+def save_manifest(basedir, manifest):
+    tmpfilename = manifest_file(basedir) + '.tmp'
+    with open(tmpfilename, 'w') as fd:
+        json.dump(manifest, fd, sort_keys=True)
+    os.replace(tmpfilename, manifest_file(basedir))
+
+
+#[size, mtime in ns] of a file
+def file_stat(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_sha1(filename):
+    m = hashlib.sha1()
+    with open(filename, 'rb') as fd:
+        for block in iter(lambda: fd.read(1 << 20), b''):
+            m.update(block)
+    return m.hexdigest()
+
+
+#sha1 of a file, reusing a recorded one (entry['stat'], entry['sha1']) while the file is unchanged
+def cached_sha1(filename, entry):
+    if entry and entry.get('stat') == file_stat(filename) and entry.get('sha1'):
+        return entry['sha1']
+    return file_sha1(filename)
+
+
+#digest of a json-serializable value
+def digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+if __name__ == '__main__':
+    basedir = sys.argv[1] if len(sys.argv) > 1 else '../datasets/python'
+    manifest = load_manifest(basedir)
+    statuses = {}
+    for entry in manifest['projects'].values():
+        statuses[entry['status']] = statuses.get(entry['status'], 0) + 1
+    print(len(manifest['projects']), "projects", statuses)
+    for shard, entry in sorted(manifest['raw'].items()):
+        print("raw shard %s: %d projects in %d blocks, digest %s" % (shard, entry['projects'], len(entry['blocks']), entry['digest'][:12]))
+    for shard, entry in manifest['processed'].get('shards', []):
+        print("processed shard %s: %d projects in %d blocks, digest %s" % (shard, entry['projects'], len(entry['blocks']), entry['digest'][:12]))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Near-duplicate project detection: MinHash signatures over each project's import multiset, and
+# locality-sensitive hashing (LSH) bands to find candidate pairs, whose estimated Jaccard
+# similarity is then checked against a threshold. Candidates are only compared with the first
+# project in their band bucket, so the work stays linear in the number of projects (apart from
+# sorting the band keys). Clusters are the connected components of the accepted pairs, and the
+# first project of a cluster (in dataset order) is its canonical project.
+
+import zlib
+from collections import Counter
+
+import numpy as np
+
+
+# max # tokens hashed in one vectorized batch
+batch_tokens = 1 << 20
+
+
+#an import that occurs k times in a project contributes k distinct tokens
+def project_import_counts(fileimports):
+    return Counter(imp for imports in fileimports.values() for imp in imports)
+
+
+#(bands, rows) minimizing the weighted false positive and false negative probability mass
+def lsh_params(threshold, num_perm, fp_weight=0.5, fn_weight=0.5):
+    xs = (np.arange(1000) + 0.5) / 1000
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            p = 1 - (1 - xs ** rows) ** bands
+            fp = p[xs < threshold].sum() / len(xs)
+            fn = (1 - p[xs >= threshold]).sum() / len(xs)
+            error = fp_weight * fp + fn_weight * fn
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+
+    #multiply-shift hashing: h(x) = (a*x + b mod 2^64) >> 32, with random odd 64-bit a
+    def __init__(self, num_perm=64, seed=1):
+        rng = np.random.RandomState(seed)
+        words = rng.randint(0, 1 << 32, size=(4, num_perm), dtype=np.uint64)
+        self.a = (words[0] << np.uint64(32)) | words[1] | np.uint64(1)
+        self.b = (words[2] << np.uint64(32)) | words[3]
+        self.num_perm = num_perm
+        self.blocks = []
+        self.importhashes = {}
+        #added projects are buffered as their distinct imports with counts
+        self.keyhashes = []
+        self.keycounts = []
+        self.offsets = [0]
+        self.ntokens = 0
+
+    def __len__(self):
+        return sum(len(block) for block in self.blocks) + len(self.offsets) - 1
+
+    def import_hash(self, imp):
+        h = self.importhashes.get(imp)
+        if h is None:
+            h = self.importhashes[imp] = zlib.crc32(imp.encode('utf-8'))
+        return h
+
+    #buffers a project's tokens (given as {import: count}); signatures are computed per batch
+    def add(self, importcounts):
+        if importcounts:
+            self.keyhashes.extend(self.import_hash(imp) for imp in importcounts)
+            self.keycounts.extend(importcounts.values())
+        else:
+            #empty projects all get the same signature
+            self.keyhashes.append(0)
+            self.keycounts.append(1)
+        self.offsets.append(len(self.keyhashes))
+        self.ntokens += sum(importcounts.values())
+        if self.ntokens >= batch_tokens:
+            self.flush()
+
+    def flush(self):
+        if len(self.offsets) > 1:
+            counts = np.array(self.keycounts, dtype=np.int64)
+            #the k-th occurrence of an import gets the token hash h(import) + k*c mod 2^32
+            tokenhashes = np.repeat(np.array(self.keyhashes, dtype=np.uint64), counts)
+            ends = np.cumsum(counts)
+            ranks = np.arange(len(tokenhashes)) - np.repeat(ends - counts, counts)
+            tokenhashes = (tokenhashes + ranks.astype(np.uint64) * np.uint64(0x9E3779B1)) & np.uint64(0xFFFFFFFF)
+            offsets = np.concatenate([[0], ends])[self.offsets]
+            self.blocks.append(self.signatures(tokenhashes, offsets))
+        self.keyhashes = []
+        self.keycounts = []
+        self.offsets = [0]
+        self.ntokens = 0
+
+    #CSR input: the tokens of project i are tokenhashes[offsets[i]:offsets[i+1]]
+    def signatures(self, tokenhashes, offsets):
+        signatures = np.empty((len(offsets) - 1, self.num_perm), dtype=np.uint32)
+        hv = np.empty_like(tokenhashes)
+        for k in range(self.num_perm):
+            np.multiply(tokenhashes, self.a[k], out=hv)
+            hv += self.b[k]
+            hv >>= np.uint64(32)
+            signatures[:, k] = np.minimum.reduceat(hv, offsets[:-1])
+        return signatures
+
+    #(#projects, num_perm) uint32 signature matrix of all added projects
+    def matrix(self):
+        self.flush()
+        if not self.blocks:
+            return np.empty((0, self.num_perm), dtype=np.uint32)
+        if len(self.blocks) > 1:
+            self.blocks = [np.vstack(self.blocks)]
+        return self.blocks[0]
+
+
+#resolves every project to the root of its cluster; roots are always the lowest index
+def find_roots(parent):
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+#returns (root index per project, # candidate pairs checked)
+def cluster_signatures(signatures, threshold, bands, rows):
+    n = len(signatures)
+    parent = np.arange(n)
+    ncandidates = 0
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        keys = np.ascontiguousarray(signatures[:, band*rows:(band+1)*rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        rep = first[inverse.ravel()]
+        candidates = np.nonzero(rep != np.arange(n))[0]
+        if len(candidates) == 0:
+            continue
+        # skip the pairs that an earlier band already merged
+        candidates = candidates[find_roots(parent)[candidates] != find_roots(parent)[rep[candidates]]]
+        ncandidates += len(candidates)
+        similarity = (signatures[candidates] == signatures[rep[candidates]]).mean(axis=1)
+        for i in candidates[similarity >= threshold]:
+            ri, rj = find(i), find(rep[i])
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+
+    return find_roots(parent), ncandidates
+
+
+#returns {root: cluster size} for the clusters with duplicates
+def cluster_sizes(roots):
+    sizes = np.bincount(roots, minlength=len(roots))
+    return {int(root): int(sizes[root]) for root in np.nonzero(sizes > 1)[0]}
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Local mock of the GitHub REST API parts used by the crawlers, over deterministic synthetic
+# repositories, with GitHub's rate limiting (per resource, X-RateLimit-* headers, 403 when
+# exceeded) and optional injected server errors:
+#
+#   GET /search/repositories?q=language:L stars:A..B created:YYYY-MM-DD&per_page=N&page=P   (search)
+#   GET /repos/{owner}/{repo}/languages                                                      (core)
+#   GET /repos/{owner}/{repo}/tarball          302 redirect to the tarball download          (core)
+#   GET /_codeload/{owner}/{repo}/tar.gz       chunked synthetic tarball (not rate limited, optionally corrupt)
+#   GET /_stats                                               request counters (not rate limited)
+#
+# Only the first 1000 results of a search are available, as on GitHub. The repositories of a day
+# depend only on the seed and the day (see synthetic_repos), so tests can check crawls against them.
+#
+# Usage: ./mock_github.py [--port N] [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--repos-per-day N]
+#                         [--search-limit N] [--core-limit N] [--window S] [--error-rate P] [--latency S]
+#                         [--tarball-kb N] [--corrupt-rate P]
+
+import argparse
+import asyncio
+import collections
+import datetime
+import gzip
+import io
+import json
+import math
+import random
+import re
+import tarfile
+import time
+import urllib.parse
+
+
+parser = argparse.ArgumentParser(description='Local mock of the GitHub API.')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8081)
+parser.add_argument('--since', default='2019-01-01', help='first day with repositories')
+parser.add_argument('--until', default='2019-01-31', help='last day with repositories')
+parser.add_argument('--repos-per-day', type=int, default=300, help='mean # repositories created per day')
+parser.add_argument('--search-limit', type=int, default=30, help='search requests per window')
+parser.add_argument('--core-limit', type=int, default=5000, help='core requests per window')
+parser.add_argument('--window', type=float, default=60, help='rate limit window (seconds)')
+parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failing with 502')
+parser.add_argument('--latency', type=float, default=0, help='response delay (seconds)')
+parser.add_argument('--tarball-kb', type=int, default=64, help='mean tarball size (kb)')
+parser.add_argument('--corrupt-rate', type=float, default=0, help='fraction of truncated tarballs')
+parser.add_argument('--seed', type=int, default=42)
+
+HTTP_STATUS = {200: 'OK', 302: 'Found', 403: 'Forbidden', 404: 'Not Found', 422: 'Unprocessable Entity', 502: 'Bad Gateway'}
+
+# max # results of a search
+max_results = 1000
+
+# bytes per chunk of a tarball response
+chunk_size = 1 << 14
+
+licenses = [None, 'mit', 'apache-2.0', 'gpl-3.0', 'bsd-3-clause']
+topics = ['web', 'cli', 'database', 'machine-learning', 'testing', 'api', 'parser', 'security']
+
+
+#the repositories created on a day, most starred first; every 7th day is busy (more than 1000 repositories)
+def synthetic_repos(day, seed, perday, language='python'):
+    rnd = random.Random('%d %s' % (seed, day))
+    count = rnd.randint(perday // 2, perday * 3 // 2) * (12 if day.toordinal() % 7 == 0 else 1)
+    repos = []
+    for i in range(count):
+        created = datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(seconds=rnd.randrange(86400))
+        name = 'user%d/repo-%s-%d' % (rnd.randrange(10**6), day.isoformat(), i)
+        license = rnd.choice(licenses)
+        repos.append({
+            'full_name': name,
+            'description': 'Synthetic repository %d of %s' % (i, day.isoformat()),
+            'topics': rnd.sample(topics, rnd.randint(0, 3)),
+            'git_url': 'git://github.com/%s.git' % name,
+            'stargazers_count': int(rnd.paretovariate(0.8)) - 1,
+            'watchers_count': rnd.randrange(50),
+            'forks': rnd.randrange(20),
+            'created_at': created.isoformat() + 'Z',
+            'size': int(rnd.paretovariate(0.7) * 50),
+            'license': {'key': license} if license else None,
+            'language': language,
+            'updated_at': (created + datetime.timedelta(days=rnd.randrange(400))).isoformat() + 'Z',
+        })
+    repos.sort(key=lambda repo: (-repo['stargazers_count'], repo['full_name']))
+    return repos
+
+
+#deterministic gzipped tarball of a repository: a python module and (incompressible) data
+def synthetic_tarball(name, meankb):
+    rnd = random.Random(name)
+    root = '%s-%07x' % (name.replace('/', '-'), rnd.randrange(1 << 28))
+    files = {root+'/setup.py': b'from setuptools import setup\n',
+             root+'/src/main.py': ''.join('import %s\n' % m for m in rnd.sample(['os', 'sys', 'json', 'numpy', 'requests', 'flask', 'django'], 3)).encode(),
+             root+'/data.bin': rnd.randbytes(int(rnd.expovariate(1 / meankb) * 1024))}
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as gz, tarfile.open(fileobj=gz, mode='w') as tar:
+        for filename, data in files.items():
+            info = tarfile.TarInfo(filename)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class MockGitHub:
+
+    def __init__(self, args):
+        self.args = args
+        self.since = datetime.date.fromisoformat(args.since)
+        self.until = datetime.date.fromisoformat(args.until)
+        self.limits = {'search': args.search_limit, 'core': args.core_limit}
+        self.used = collections.Counter()
+        self.stats = collections.Counter()
+        self.rnd = random.Random(args.seed)
+        self.days = {}
+
+    def repos(self, day, language):
+        if not self.since <= day <= self.until:
+            return []
+        if (day, language) not in self.days:
+            self.days[day, language] = synthetic_repos(day, self.args.seed, self.args.repos_per_day, language)
+        return self.days[day, language]
+
+    #(allowed, rate limit headers) of a request to a resource
+    def rate_limit(self, resource):
+        now = time.time()
+        window = math.floor(now / self.args.window)
+        reset = (window + 1) * self.args.window
+        self.used[resource, window] += 1
+        remaining = self.limits[resource] - self.used[resource, window]
+        headers = {'X-RateLimit-Limit': self.limits[resource], 'X-RateLimit-Remaining': max(0, remaining),
+                   'X-RateLimit-Reset': int(math.ceil(reset)), 'X-RateLimit-Resource': resource}
+        return remaining >= 0, headers
+
+    def search(self, query):
+        params = urllib.parse.parse_qs(query)
+        q = params.get('q', [''])[0]
+        perpage = min(100, int(params.get('per_page', ['30'])[0]))
+        page = int(params.get('page', ['1'])[0])
+        if page * perpage > max_results:
+            return 422, {'message': 'Only the first 1000 search results are available'}
+        language = re.search(r'language:(\S+)', q)
+        stars = re.search(r'stars:(\d+)\.\.(\d+)', q)
+        created = re.search(r'created:(\d{4}-\d\d-\d\d)', q)
+        if not created:
+            return 422, {'message': 'Validation Failed'}
+        repos = self.repos(datetime.date.fromisoformat(created.group(1)), language.group(1) if language else 'python')
+        if stars:
+            low, high = int(stars.group(1)), int(stars.group(2))
+            repos = [repo for repo in repos if low <= repo['stargazers_count'] <= high]
+        return 200, {'total_count': len(repos), 'incomplete_results': False,
+                     'items': repos[(page - 1) * perpage:page * perpage]}
+
+    def languages(self, name):
+        rnd = random.Random(name)
+        return 200, {language: rnd.randrange(1, 10**6) for language in rnd.sample(['Python', 'Shell', 'C', 'JavaScript', 'Java'], 2)}
+
+    #(status, headers, result) of a GET request; the result is json, or the bytes of a file
+    def dispatch(self, target):
+        url = urllib.parse.urlsplit(target)
+        if url.path == '/_stats':
+            return 200, {}, dict(self.stats)
+        match = re.match(r'/_codeload/([^/]+/[^/]+)/tar\.gz$', url.path)
+        if match:
+            self.stats['tarballs'] += 1
+            tarball = synthetic_tarball(match.group(1), self.args.tarball_kb)
+            if self.rnd.random() < self.args.corrupt_rate:
+                self.stats['corrupt'] += 1
+                tarball = tarball[:len(tarball) // 2]
+            return 200, {}, tarball
+        resource = 'search' if url.path.startswith('/search/') else 'core'
+        self.stats['requests'] += 1
+        if self.rnd.random() < self.args.error_rate:
+            self.stats['errors'] += 1
+            return 502, {}, {'message': 'Server Error'}
+        allowed, headers = self.rate_limit(resource)
+        if not allowed:
+            self.stats['rate_limited'] += 1
+            return 403, headers, {'message': 'API rate limit exceeded'}
+        match = re.match(r'/repos/([^/]+/[^/]+)/(languages|tarball)$', url.path)
+        if url.path == '/search/repositories':
+            status, result = self.search(url.query)
+        elif match and match.group(2) == 'languages':
+            status, result = self.languages(match.group(1))
+        elif match:
+            status, result = 302, {}
+            headers['Location'] = '/_codeload/%s/tar.gz' % match.group(1)
+        else:
+            status, result = 404, {'message': 'Not Found'}
+        return status, headers, result
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                requestline = await reader.readline()
+                if not requestline:
+                    break
+                method, target, version = requestline.decode('latin-1').split()
+                keepalive = version != 'HTTP/1.0'
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    if line.lower().startswith(b'connection:') and b'close' in line.lower():
+                        keepalive = False
+                status, headers, result = self.dispatch(target)
+                if self.args.latency:
+                    await asyncio.sleep(self.args.latency)
+                if isinstance(result, bytes):
+                    headers = dict(headers, **{'Content-Type': 'application/x-gzip', 'Transfer-Encoding': 'chunked'})
+                else:
+                    result = json.dumps(result).encode('utf-8')
+                    headers = dict(headers, **{'Content-Type': 'application/json', 'Content-Length': len(result)})
+                writer.write(('HTTP/1.1 %d %s\r\n%sConnection: %s\r\n\r\n' % (
+                    status, HTTP_STATUS.get(status, ''), ''.join('%s: %s\r\n' % item for item in headers.items()),
+                    'keep-alive' if keepalive else 'close')).encode('latin-1'))
+                if 'Transfer-Encoding' in headers:
+                    for i in range(0, len(result), chunk_size):
+                        writer.write(b'%x\r\n%s\r\n' % (len(result[i:i+chunk_size]), result[i:i+chunk_size]))
+                        await writer.drain()
+                    writer.write(b'0\r\n\r\n')
+                else:
+                    writer.write(result)
+                await writer.drain()
+                if not keepalive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(mock, host, port):
+    listener = await asyncio.start_server(mock.handle, host, port)
+    print("Mock GitHub API on http://%s:%d" % (host, port), flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(MockGitHub(args), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
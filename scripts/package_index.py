@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Java package -> module index: the packages of the processed Java dataset (those of its imports,
+# as to_package of the Training notebook) and of an optional explicit package -> module mapping,
+# in a sorted array of 64-bit polynomial hashes. A package, or a class import, resolves to the
+# module of its longest known package prefix. The hashes of all the package prefixes of a batch
+# of packages (e.g. all the imports of a file) are computed at once from the prefix sums of their
+# bytes, and looked up with one binary search (a false match needs a 64-bit hash collision).
+#
+#   hashes.bin              uint64   sorted hashes of the packages
+#   packages.bin, packages_offsets.bin   uint8/int64  utf-8 string table of the packages, in hash order
+#   package_modules.bin     int32    module id of every package
+#   package_freqs.bin       int64    # projects importing (classes of) every package
+#   modules.bin, modules_offsets.bin     uint8/int64  utf-8 string table of the modules
+#   module_freqs.bin        int64    # projects importing every module
+#   package_index.json      version, # packages and # modules
+#
+# Usage: ./package_index.py [<basedir>] [<minfreq>]
+#        (builds <basedir>/processed/package_index from the processed dataset, and the optional
+#         <basedir>/package_modules.json.gz {package: module} mapping)
+
+import collections
+import gzip
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from cooccurrence import sorted_unique
+from import_columns import ImportColumns, StringTable, StringTableWriter, columns_dir
+from train_vectors import config, load_projects, to_package
+from vector_store import memmap
+
+
+format_version = 1
+#odd, so that it is invertible modulo 2**64
+multiplier = 0x9E3779B97F4A7C15
+#multiplier**-1 modulo 2**64 (pow(multiplier, -1, 1 << 64) needs python 3.8)
+multiplier_inverse = 0xF1DE83E19937733D
+# max # packages hashed at once (the per-byte arrays should stay in cache)
+batch_size = 4096
+
+
+def package_index_dir(basedir):
+    return basedir+'/processed/package_index'
+
+
+#powers 0..n-1 of a number, modulo 2**64 (cached, doubling)
+_powers = {}
+
+def powers(base, n):
+    values = _powers.get(base)
+    if values is None or len(values) < n:
+        values = np.full(max(n, 2 * len(values) if values is not None else 1 << 16), base, dtype=np.uint64)
+        values[0] = 1
+        values = _powers[base] = np.cumprod(values)
+    return values[:n]
+
+
+#(package index, hash) of every package prefix (ending before a '.', or at the end) of packages
+#the hash of the bytes b[s:e] is sum(b[j] * multiplier**(j-s)), modulo 2**64
+def prefix_hashes(packages):
+    data = np.frombuffer(('\n'.join(packages) + '\n').encode('utf-8'), dtype=np.uint8)
+    weighted = data.astype(np.uint64) * powers(multiplier, len(data))
+    sums = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(weighted, dtype=np.uint64)])
+    newlines = np.nonzero(data == ord('\n'))[0]
+    ends = np.nonzero((data == ord('.')) | (data == ord('\n')))[0]
+    ids = np.searchsorted(newlines, ends)
+    starts = np.concatenate([[0], newlines[:-1] + 1])[ids]
+    return ids, (sums[ends] - sums[starts]) * powers(multiplier_inverse, len(data))[starts]
+
+
+#{package: # projects importing it} of a processed dataset
+def package_frequencies(basedir):
+    if os.path.isfile(columns_dir(basedir)+'/meta.json'):
+        columns = ImportColumns(columns_dir(basedir))
+        packageids = {}
+        importpackages = np.array([packageids.setdefault(to_package(imp), len(packageids)) for imp in columns.imports.tolist()],
+                                  dtype=np.int64)
+        #distinct (project, package) pairs
+        projects = np.repeat(columns.file_projects(), np.diff(columns.file_offsets))
+        keys = sorted_unique(projects.astype(np.int64) * len(packageids) + importpackages[columns.import_ids])
+        freqs = np.bincount(keys % len(packageids), minlength=len(packageids))
+        return {package: int(freqs[i]) for package, i in packageids.items()}
+    freqs = collections.Counter()
+    for _, fileimports in load_projects(basedir):
+        freqs.update(set(to_package(imp) for imports in fileimports.values() for imp in imports))
+    return dict(freqs)
+
+
+#package_modules: {package: module} (packages without a mapped prefix are their own modules)
+def write_package_index(dirname, package_freqs, package_modules=None, minfreq=1):
+    package_modules = package_modules or {}
+    packages = sorted(set(p for p, freq in package_freqs.items() if freq >= minfreq and p) | set(package_modules))
+    ids, hashes = prefix_hashes(packages)
+    #the hash of the whole package is the last of its prefixes
+    hashes = hashes[np.r_[ids[1:] != ids[:-1], True]] if packages else np.zeros(0, dtype=np.uint64)
+    order = np.argsort(hashes, kind='stable')
+    if len(np.unique(hashes)) != len(hashes):
+        raise ValueError("Package hash collision")
+    #the sorted packages come before their sub-packages, which inherit their mapped modules
+    modules, mapped = {}, {}
+    for package in packages:
+        parent = package.rpartition('.')[0]
+        while parent and parent not in modules:
+            parent = parent.rpartition('.')[0]
+        if package in package_modules:
+            modules[package], mapped[package] = package_modules[package], True
+        elif parent and mapped[parent]:
+            modules[package], mapped[package] = modules[parent], True
+        else:
+            modules[package], mapped[package] = package, False
+    moduleids = {}
+    packagemodules = np.array([moduleids.setdefault(modules[package], len(moduleids)) for package in packages], dtype=np.int32)
+
+    tmpdirname = dirname + '.tmp'
+    shutil.rmtree(tmpdirname, ignore_errors=True)
+    os.makedirs(tmpdirname)
+    hashes[order].tofile(tmpdirname+'/hashes.bin')
+    packagemodules[order].tofile(tmpdirname+'/package_modules.bin')
+    for name, strings in [('packages', [packages[i] for i in order]), ('modules', list(moduleids))]:
+        table = StringTableWriter(tmpdirname, name)
+        table.add(strings)
+        table.close()
+    meta = {'version': format_version, 'packages': len(packages), 'modules': len(moduleids), 'minfreq': minfreq}
+
+    #the frequency of every package of the dataset goes to its longest indexed prefix
+    index = PackageIndex(tmpdirname, meta)
+    names = list(package_freqs)
+    found = index.lookup(names)
+    freqs = np.zeros(len(packages), dtype=np.int64)
+    np.add.at(freqs, found[found >= 0], np.array([package_freqs[n] for n in names], dtype=np.int64)[found >= 0])
+    freqs.tofile(tmpdirname+'/package_freqs.bin')
+    np.bincount(packagemodules[order], weights=freqs, minlength=len(moduleids)).astype(np.int64).tofile(tmpdirname+'/module_freqs.bin')
+    with open(tmpdirname+'/package_index.json', 'w') as fd:
+        json.dump(meta, fd, indent=2)
+    shutil.rmtree(dirname, ignore_errors=True)
+    os.replace(tmpdirname, dirname)
+
+
+#read-only, memory-mapped package index
+class PackageIndex:
+
+    def __init__(self, dirname, meta=None):
+        if meta is None:
+            with open(dirname+'/package_index.json') as fd:
+                meta = json.load(fd)
+        if meta['version'] != format_version:
+            raise ValueError("Unsupported package index version %s in %s" % (meta['version'], dirname))
+        self.meta = meta
+        self.hashes = np.asarray(memmap(dirname+'/hashes.bin', np.uint64))
+        self.package_modules = np.asarray(memmap(dirname+'/package_modules.bin', np.int32))
+        self.packages = StringTable(np.asarray(memmap(dirname+'/packages.bin', np.uint8)),
+                                    np.asarray(memmap(dirname+'/packages_offsets.bin', np.int64)))
+        self.modules = StringTable(np.asarray(memmap(dirname+'/modules.bin', np.uint8)),
+                                   np.asarray(memmap(dirname+'/modules_offsets.bin', np.int64))).tolist()
+        #missing while the index is built
+        if os.path.isfile(dirname+'/package_freqs.bin'):
+            self.package_freqs = np.asarray(memmap(dirname+'/package_freqs.bin', np.int64))
+            self.module_freqs = np.asarray(memmap(dirname+'/module_freqs.bin', np.int64))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    #index of the longest indexed package prefix of every package or class, or -1
+    def lookup(self, packages):
+        if len(packages) > batch_size:
+            return np.concatenate([self.lookup(packages[i:i+batch_size]) for i in range(0, len(packages), batch_size)])
+        found = np.full(len(packages), -1, dtype=np.int64)
+        if len(packages) == 0 or len(self) == 0:
+            return found
+        ids, hashes = prefix_hashes(packages)
+        #sorted hashes search much faster (the same parts of the array are visited in turn)
+        order = np.argsort(hashes)
+        positions = np.empty(len(hashes), dtype=np.int64)
+        positions[order] = np.minimum(np.searchsorted(self.hashes, hashes[order]), len(self) - 1)
+        hit = self.hashes[positions] == hashes
+        if not hit.any():
+            return found
+        ids, positions = ids[hit], positions[hit]
+        #the prefixes of a package are in increasing length: the last hit wins
+        last = np.r_[ids[1:] != ids[:-1], True]
+        found[ids[last]] = positions[last]
+        return found
+
+    #module of every package or class (None if no package prefix is known)
+    def modules_for_packages(self, packages):
+        found = self.lookup(packages)
+        modules = self.package_modules[found].tolist()
+        return [self.modules[m] if i >= 0 else None for i, m in zip(found.tolist(), modules)]
+
+    #[(module, # projects)] of every package or class (None if no package prefix is known)
+    def modules_with_frequencies(self, packages):
+        found = self.lookup(packages)
+        modules = self.package_modules[found].tolist()
+        return [(self.modules[m], int(self.module_freqs[m])) if i >= 0 else None for i, m in zip(found.tolist(), modules)]
+
+    #the indexed packages of every module
+    def module_packages(self):
+        packages = collections.defaultdict(list)
+        for package, module in zip(self.packages.tolist(), self.package_modules.tolist()):
+            packages[self.modules[module]].append(package)
+        return packages
+
+
+#index of the libraries of a vector store (see vector_store.py), each its own module unless mapped,
+#(re)built on first use, and when it is outdated
+def load_package_index(store, package_modules_file, package_freqs=None):
+    dirname = store.dirname+'/package_index'
+    sources = [store.dirname+'/header.json'] + [package_modules_file] * os.path.isfile(package_modules_file)
+    if not os.path.isfile(dirname+'/package_index.json') or \
+            max(os.path.getmtime(f) for f in sources) > os.path.getmtime(dirname+'/package_index.json'):
+        package_modules = {}
+        if os.path.isfile(package_modules_file):
+            with gzip.open(package_modules_file, 'rt', encoding='utf-8') as fd:
+                package_modules = json.load(fd)
+        package_freqs = package_freqs or {}
+        write_package_index(dirname, {name: package_freqs.get(name, 0) for name in store.names.tolist()}, package_modules, 0)
+    return PackageIndex(dirname)
+
+
+if __name__ == '__main__':
+    basedir = sys.argv[1] if len(sys.argv) > 1 else '../datasets/java'
+    minfreq = int(sys.argv[2]) if len(sys.argv) > 2 else config['min_import_freq']
+
+    t0 = time.perf_counter()
+    package_modules = {}
+    if os.path.isfile(basedir+'/package_modules.json.gz'):
+        with gzip.open(basedir+'/package_modules.json.gz', 'rt', encoding='utf-8') as fd:
+            package_modules = json.load(fd)
+    write_package_index(package_index_dir(basedir), package_frequencies(basedir), package_modules, minfreq)
+    index = PackageIndex(package_index_dir(basedir))
+    print("Package index of %d packages and %d modules built in %.1fs" % (len(index), len(index.modules), time.perf_counter() - t0))
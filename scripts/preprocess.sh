@@ -5,19 +5,31 @@
 
 
 language=${1:-python}
+incremental=${2:-0} #only reprocess new and changed projects (see manifest.py)
 
 basedir=../datasets/$language
 
+options=""
+if [ $incremental -ne 0 ] ; then
+	options="--incremental"
+fi
+
 
 echo "[PREPROCESS: EXTRACTING IMPORTS]"
-./extract_imports.sh $basedir $language || exit 1
+./extract_tarballs.py $basedir $language $options || exit 1
 echo ; echo
 
 
 echo "[PREPROCESS: CREATING RAW IMPORT DATASET]"
-./create_import_dataset.py $basedir || exit 1
+./create_import_dataset.py $basedir $options || exit 1
 echo ; echo
 
 echo "[PREPROCESS: CREATING PROCESSED PROJECTFILEIMPORT DATASET]"
-./filter_import_dataset.py $basedir || exit 1
+./filter_import_dataset.py $basedir $options || exit 1
 echo ; echo
+
+if [ "$language" == "java" ]; then
+    echo "[PREPROCESS: CREATING PACKAGE INDEX]"
+    ./package_index.py $basedir || exit 1
+    echo ; echo
+fi
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Projection stage of the library map: lays out the vectors of a model (see vector_store.py) in 2D
+# and 3D, as a separate, faster alternative to the t-SNE runs of the Visualization notebook (which
+# does not use it yet). The layout is computed on the approximate k-nearest-neighbour graph of the
+# libraries (see ann_index.py), with the negative sampling SGD of UMAP/LargeVis: in every epoch, the
+# graph edges (sampled by weight) pull their two libraries together, and push each of them away
+# from a few random libraries, so that an epoch is linear in the # libraries. A layout starts from
+# the PCA of the vectors, or is warm-started from the previous map of the model: after retraining,
+# the libraries that were already on the map start where they were, and new ones at the mean of
+# their neighbours on the map, which then only takes a fraction of the epochs.
+#
+# The kNN graph is cached in the vector store (knn_rows.bin, knn_scores.bin and knn.json), and a
+# map is only recomputed when the hash of the model (its vectors and names) or the parameters
+# changed. Every map is written to <modeldir>/map<D>d_dim<dim>/, with the libraries in
+# level-of-detail order:
+#
+#   points.bin                     uint16  (count, D) coordinates, quantized within the bounds of meta.json
+#   names.bin, names_offsets.bin   uint8/int64  string table of the library names
+#   freqs.bin                      int32   # projects importing the library (see lib_dict_dim<dim>.json)
+#   rows.bin                       int32   row of the library in the vector store
+#   tiles.bin                      int64   (#tiles, 3 + D) level, tile coordinates, first row and # rows
+#   meta.json                      version, count, dims, bounds, level ends, model hash and parameters
+#
+# Level 0 holds the level0_size most frequent libraries, and every next level 4 times as many, so
+# the first rows are an overview of the map. Within a level, the libraries are grouped by tile of a
+# grid of 2^level cells (at most max_grid) per axis over the bounds, so that a viewer can read the
+# tiles in view, level by level, with range requests. With --json, the maps are also written in the
+# format of the notebook's vectors2D_dim<dim>.json and vectors3D_dim<dim>.json (replacing the
+# notebook's files, which it writes again when it is run).
+#
+# Usage: ./project_vectors.py <language> [<basedir>] [--dim N] [--dims 2,3] [--epochs N] [--json] ...
+
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from ann_index import exact_search, load_index
+from import_columns import StringTable, StringTableWriter
+from manifest import digest, file_sha1
+from vector_store import VectorStore, convert_model, memmap, vector_store_dir, vector_store_outdated
+
+
+format_version = 1
+
+parser = argparse.ArgumentParser(description='Lay out the library vectors of a model in 2D and 3D.')
+parser.add_argument('language')
+parser.add_argument('basedir', nargs='?', help='dataset folder (default = ../datasets/<language>)')
+parser.add_argument('--dim', type=int, default=100, help='vector dimension of the model')
+parser.add_argument('--dims', default='2,3', help='map dimensions')
+parser.add_argument('--neighbours', type=int, default=15, help='neighbours per library in the kNN graph')
+parser.add_argument('--epochs', type=int, default=200, help='epochs of a layout from scratch')
+parser.add_argument('--warm-epochs', type=int, default=50, help='epochs of a warm-started layout')
+parser.add_argument('--no-warm-start', action='store_true', help='lay out from scratch, ignoring the previous maps')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--json', action='store_true', help='also write vectors<D>D_dim<dim>.json')
+parser.add_argument('--force', action='store_true', help='recompute the maps even if they are up to date')
+
+# models up to this size get an exact kNN graph
+exact_knn_size = 5000
+# IVF lists probed per kNN query, and queries per search batch
+nprobe = 16
+knn_batch = 1024
+# random libraries pushed away per edge
+negative_samples = 5
+# UMAP's curve 1 / (1 + a d^(2b)) of the similarity at distance d, for min_dist = 0.1
+curve_a, curve_b = 1.577, 0.895
+# initial learning rates of a layout from scratch, and warm-started
+learning_rate = 1.0
+warm_learning_rate = 0.25
+# max gradient per coordinate and update
+max_gradient = 4.0
+# the PCA initialization spans [-init_scale, init_scale]
+init_scale = 10.0
+level0_size = 1000
+max_grid = {2: 32, 3: 8}
+
+
+def map_dir(modeldir, dims, dim):
+    return modeldir+'/map{}d_dim{}'.format(dims, dim)
+
+
+#hash of the vectors and names of a vector store
+def model_hash(store):
+    return digest([file_sha1(store.dirname+'/vectors.bin'), file_sha1(store.dirname+'/names.bin')])
+
+
+###################
+
+
+#(rows, cosine similarities) of the k nearest other libraries of every library, -1 padded
+def search_knn(store, k):
+    vectors = store.unit_vectors()
+    index = load_index(store) if len(vectors) > exact_knn_size else None
+    rows, scores = [], []
+    for start in range(0, len(vectors), knn_batch):
+        queries = vectors[start:start+knn_batch]
+        if index is None:
+            batchrows, batchscores = exact_search(vectors, queries, k + 1)
+        else:
+            batchrows, batchscores = index.search(queries, k + 1, nprobe)
+        #drops the library itself, or else the last neighbour, and pads small models to k neighbours
+        order = np.argsort(batchrows == np.arange(start, start + len(queries))[:, None], axis=1, kind='stable')
+        padding = ((0, 0), (0, k + 1 - batchrows.shape[1]))
+        rows.append(np.pad(np.take_along_axis(batchrows, order, axis=1)[:, :-1], padding, constant_values=-1))
+        scores.append(np.pad(np.take_along_axis(batchscores, order, axis=1)[:, :-1], padding, constant_values=-np.inf))
+    if not rows:
+        return np.zeros((0, k), dtype=np.int32), np.zeros((0, k), dtype=np.float32)
+    return np.concatenate(rows).astype(np.int32), np.concatenate(scores).astype(np.float32)
+
+
+#kNN graph of a vector store, cached in the store
+def load_knn(store, modelhash, k):
+    meta = None
+    if os.path.isfile(store.dirname+'/knn.json'):
+        with open(store.dirname+'/knn.json') as fd:
+            meta = json.load(fd)
+    if meta is not None and meta['version'] == format_version and meta['model'] == modelhash and meta['k'] == k:
+        return (np.fromfile(store.dirname+'/knn_rows.bin', dtype=np.int32).reshape(-1, k),
+                np.fromfile(store.dirname+'/knn_scores.bin', dtype=np.float32).reshape(-1, k))
+    t0 = time.perf_counter()
+    rows, scores = search_knn(store, k)
+    print("kNN graph of %d libraries (k=%d) in %.1fs" % (len(rows), k, time.perf_counter() - t0))
+    rows.tofile(store.dirname+'/knn_rows.bin')
+    scores.tofile(store.dirname+'/knn_scores.bin')
+    with open(store.dirname+'/knn.json', 'w') as fd:
+        json.dump({'version': format_version, 'model': modelhash, 'k': k, 'count': len(rows)}, fd, indent=2)
+    return rows, scores
+
+
+#UMAP's fuzzy graph: (heads, tails, weights) of the undirected edges; the weights of the edges of a
+#library decay from 1 (its nearest neighbour) with the scale at which they sum up to log2(k)
+def graph_edges(rows, scores):
+    count, k = rows.shape
+    valid = rows >= 0
+    distances = np.where(valid, 1 - scores, np.inf)
+    #libraries without neighbours (a model of a single library) have no edges
+    rho = np.where(valid[:, :1], distances[:, :1], 0)
+    target = np.log2(max(k, 2))
+    low, high = np.zeros((count, 1)), np.full((count, 1), np.inf)
+    sigma = np.ones((count, 1))
+    for _ in range(64):
+        total = np.exp(-np.maximum(distances - rho, 0) / sigma).sum(axis=1, keepdims=True)
+        over = total > target
+        high = np.where(over, sigma, high)
+        low = np.where(over, low, sigma)
+        sigma = np.where(np.isinf(high), sigma * 2, (low + high) / 2)
+    weights = np.exp(-np.maximum(distances - rho, 0) / sigma)
+
+    heads = np.repeat(np.arange(count, dtype=np.int64), k)[valid.ravel()]
+    tails = rows.ravel()[valid.ravel()].astype(np.int64)
+    weights = weights.ravel()[valid.ravel()]
+    #the union of both directions: w = 1 - (1 - w_ij)(1 - w_ji)
+    keys = np.minimum(heads, tails) * count + np.maximum(heads, tails)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    weights = 1 - np.exp(np.bincount(inverse, weights=np.log(np.maximum(1 - weights, 1e-12)), minlength=len(keys)))
+    return keys // count, keys % count, weights
+
+
+###################
+
+
+#layout at the PCA of the vectors
+def pca_layout(vectors, dims, seed):
+    rng = np.random.RandomState(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), 100000), replace=False)] if len(vectors) else vectors
+    mean = sample.mean(axis=0) if len(sample) else 0
+    _, _, components = np.linalg.svd(sample - mean, full_matrices=False)
+    layout = (vectors - mean) @ components[:dims].T
+    if layout.shape[1] < dims:
+        layout = np.hstack([layout, np.zeros((len(layout), dims - layout.shape[1]))])
+    #random jitter separates identical vectors
+    layout += rng.randn(*layout.shape) * 1e-4 * (np.abs(layout).max() if layout.size else 1)
+    return (layout * init_scale / max(np.abs(layout).max() if layout.size else 0, 1e-12)).astype(np.float32)
+
+
+#(layout, # libraries placed from the previous map): libraries of the previous map start where they
+#were, new ones at the mean of their neighbours on the previous map, or else at the PCA layout
+def warm_layout(names, previous, knnrows, initial):
+    prevnames, prevpoints = previous
+    prevrows = dict(zip(prevnames, range(len(prevnames))))
+    mapped = np.array([prevrows.get(name, -1) for name in names], dtype=np.int64)
+    known = mapped >= 0
+    layout = initial.copy()
+    layout[known] = prevpoints[mapped[known]]
+    neighbours = np.where(knnrows >= 0, knnrows, 0)
+    neighbourknown = known[neighbours] & (knnrows >= 0)
+    counts = neighbourknown.sum(axis=1)
+    sums = (layout[neighbours] * neighbourknown[:, :, None]).sum(axis=1)
+    placed = ~known & (counts > 0)
+    layout[placed] = sums[placed] / counts[placed, None]
+    return layout, int(known.sum())
+
+
+#sum of the rows of updates per index
+def accumulate(indices, updates, count):
+    return np.stack([np.bincount(indices, weights=updates[:, d], minlength=count) for d in range(updates.shape[1])], axis=1)
+
+
+#negative sampling SGD of the layout, in mini-batches of edges that each touch most libraries about once
+def optimize_layout(layout, heads, tails, weights, epochs, lr, seed):
+    count = len(layout)
+    if count < 2 or len(heads) == 0:
+        return layout
+    rng = np.random.RandomState(seed)
+    probabilities = weights / weights.max()
+    batchsize = max(1024, count // 4)
+    for epoch in range(epochs):
+        alpha = lr * (1 - epoch / epochs)
+        sampled = np.nonzero(rng.random_sample(len(probabilities)) < probabilities)[0]
+        rng.shuffle(sampled)
+        for start in range(0, len(sampled), batchsize):
+            batch = sampled[start:start+batchsize]
+            i, j = heads[batch], tails[batch]
+            diff = layout[i] - layout[j]
+            d2 = (diff * diff).sum(axis=1)
+            #libraries at the same place (e.g. warm-started from the quantized map) do not attract
+            with np.errstate(divide='ignore', invalid='ignore'):
+                coeff = np.where(d2 > 0, -2 * curve_a * curve_b * d2 ** (curve_b - 1) / (1 + curve_a * d2 ** curve_b), 0)
+            grad = np.clip(coeff[:, None] * diff, -max_gradient, max_gradient)
+            update = accumulate(i, grad, count) - accumulate(j, grad, count)
+
+            i = np.repeat(i, negative_samples)
+            negatives = rng.randint(count, size=len(i))
+            diff = layout[i] - layout[negatives]
+            d2 = (diff * diff).sum(axis=1)
+            coeff = np.where(negatives != i, 2 * curve_b / ((0.001 + d2) * (1 + curve_a * d2 ** curve_b)), 0)
+            grad = np.clip(coeff[:, None] * diff, -max_gradient, max_gradient)
+            update += accumulate(i, grad, count)
+            layout += (alpha * update).astype(np.float32)
+    return layout
+
+
+###################
+
+
+def level_ends(count):
+    ends = [min(count, level0_size)]
+    while ends[-1] < count:
+        ends.append(min(count, ends[-1] * 4))
+    return ends
+
+
+#(order of the libraries, tiles): by level of frequency, then by tile of the level's grid
+def level_of_detail(points, freqs, lo, hi):
+    count, dims = points.shape
+    byfreq = np.lexsort((np.arange(count), -freqs))
+    order, tiles = [], []
+    start = 0
+    for level, end in enumerate(level_ends(count)):
+        members = byfreq[start:end]
+        grid = min(2 ** level, max_grid[dims])
+        cells = np.clip(((points[members] - lo) / (hi - lo) * grid).astype(np.int64), 0, grid - 1)
+        tileids = np.ravel_multi_index(cells.T, (grid,) * dims)
+        members = members[np.argsort(tileids, kind='stable')]
+        tileids, firsts, sizes = np.unique(np.sort(tileids), return_index=True, return_counts=True)
+        for tileid, first, size in zip(tileids, firsts, sizes):
+            tiles.append([level] + list(np.unravel_index(tileid, (grid,) * dims)) + [start + first, size])
+        order.append(members)
+        start = end
+    order = np.concatenate(order) if order else np.zeros(0, dtype=np.int64)
+    return order, np.array(tiles, dtype=np.int64).reshape(-1, 3 + dims)
+
+
+def write_map(dirname, names, points, freqs, meta):
+    count, dims = points.shape
+    lo = points.min(axis=0) if count else np.zeros(dims)
+    hi = points.max(axis=0) if count else np.ones(dims)
+    hi = np.where(hi > lo, hi, lo + 1)
+    order, tiles = level_of_detail(points, freqs, lo, hi)
+
+    tmpdirname = dirname + '.tmp'
+    shutil.rmtree(tmpdirname, ignore_errors=True)
+    os.makedirs(tmpdirname)
+    np.round((points[order] - lo) / (hi - lo) * 65535).astype(np.uint16).tofile(tmpdirname+'/points.bin')
+    freqs[order].astype(np.int32).tofile(tmpdirname+'/freqs.bin')
+    order.astype(np.int32).tofile(tmpdirname+'/rows.bin')
+    tiles.tofile(tmpdirname+'/tiles.bin')
+    table = StringTableWriter(tmpdirname, 'names')
+    table.add([names[row] for row in order.tolist()])
+    table.close()
+    meta = dict(meta, version=format_version, count=count, dims=dims, bounds=[lo.tolist(), hi.tolist()],
+                levels=level_ends(count), tiles=len(tiles))
+    with open(tmpdirname+'/meta.json', 'w') as fd:
+        json.dump(meta, fd, indent=2)
+    shutil.rmtree(dirname, ignore_errors=True)
+    os.replace(tmpdirname, dirname)
+
+
+def read_map_meta(dirname):
+    if not os.path.isfile(dirname+'/meta.json'):
+        return None
+    with open(dirname+'/meta.json') as fd:
+        meta = json.load(fd)
+    return meta if meta.get('version') == format_version else None
+
+
+#(names, float32 points, freqs) of the levels up to maxlevel (default = all) of a map
+def read_map(dirname, maxlevel=None):
+    meta = read_map_meta(dirname)
+    if meta is None:
+        raise ValueError("No map in %s" % dirname)
+    count = meta['levels'][min(maxlevel, len(meta['levels']) - 1)] if maxlevel is not None and meta['levels'] else meta['count']
+    lo, hi = (np.array(bound, dtype=np.float32) for bound in meta['bounds'])
+    points = memmap(dirname+'/points.bin', np.uint16, (meta['count'], meta['dims']))[:count]
+    names = StringTable(np.asarray(memmap(dirname+'/names.bin', np.uint8)), np.asarray(memmap(dirname+'/names_offsets.bin', np.int64)))
+    return (names.tolist()[:count], lo + points.astype(np.float32) / 65535 * (hi - lo),
+            np.array(memmap(dirname+'/freqs.bin', np.int32, meta['count'])[:count]))
+
+
+#the notebook's vectors2D/vectors3D_dim<dim>.json: {library: coordinates}
+def write_json_map(filename, names, points):
+    with open(filename + '.tmp', 'w') as fd:
+        json.dump(dict(zip(names, points.tolist())), fd)
+    os.replace(filename + '.tmp', filename)
+
+
+#library frequencies of the lib_dict of a model, 0 if there is none
+def library_freqs(modeldir, dim, names):
+    filename = modeldir+'/lib_dict_dim{}.json'.format(dim)
+    if not os.path.isfile(filename):
+        return np.zeros(len(names), dtype=np.int64)
+    with open(filename, encoding='utf-8') as fd:
+        lib_dict = json.load(fd)
+    return np.array([lib_dict.get(name, {}).get('freq', 0) for name in names], dtype=np.int64)
+
+
+#computes (or keeps, when up to date) the map of a vector store in dims dimensions; returns its status
+def project(store, modeldir, dims, params, modelhash, names, freqs, edges, knnrows, warm=True, force=False):
+    dirname = map_dir(modeldir, dims, store.dim)
+    previous = read_map_meta(dirname)
+    if not force and previous is not None and previous['model'] == modelhash and previous['params'] == params:
+        return 'up to date'
+
+    t0 = time.perf_counter()
+    layout = pca_layout(store.unit_vectors(), dims, params['seed'])
+    epochs, lr, status = params['epochs'], learning_rate, 'from scratch'
+    if warm and previous is not None and previous['count'] > 0:
+        prevnames, prevpoints, _ = read_map(dirname)
+        layout, nknown = warm_layout(names, (prevnames, prevpoints), knnrows, layout)
+        if nknown > 0:
+            epochs, lr = params['warm_epochs'], warm_learning_rate
+            status = 'warm-started (%d of %d libraries on the previous map)' % (nknown, len(names))
+    layout = optimize_layout(layout, *edges, epochs, lr, params['seed'])
+    write_map(dirname, names, layout, freqs, {'model': modelhash, 'params': params, 'epochs': epochs,
+                                              'warm_started': status != 'from scratch'})
+    return '%s, %d epochs in %.1fs' % (status, epochs, time.perf_counter() - t0)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    basedir = args.basedir or '../datasets/' + args.language
+    modeldir = basedir+'/models'
+    if vector_store_outdated(modeldir, args.dim):
+        convert_model(modeldir, args.dim, args.language)
+    store = VectorStore(vector_store_dir(modeldir, args.dim))
+    names = store.names.tolist()
+    freqs = library_freqs(modeldir, args.dim, names)
+    params = {'neighbours': args.neighbours, 'epochs': args.epochs, 'warm_epochs': args.warm_epochs, 'seed': args.seed}
+
+    modelhash = model_hash(store)
+    knnrows, knnscores = load_knn(store, modelhash, args.neighbours)
+    edges = graph_edges(knnrows, knnscores)
+    for dims in [int(d) for d in args.dims.split(',')]:
+        status = project(store, modeldir, dims, params, modelhash, names, freqs, edges, knnrows, not args.no_warm_start, args.force)
+        print("%dD map of %d libraries: %s" % (dims, len(names), status))
+        if args.json:
+            write_json_map(modeldir+'/vectors{}D_dim{}.json'.format(dims, args.dim), *read_map(map_dir(modeldir, dims, args.dim))[:2])
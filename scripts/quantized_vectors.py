@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Compressed copies of the unit vectors of a vector store (see vector_store.py), so that the models
+# of several languages stay resident in one query process (see query_server.py --quantize):
+#
+#   float16   2 bytes per dimension
+#   int8      1 byte per dimension, and a float32 scale per vector (max |component| / 127)
+#   pq        product quantization: the dimensions are split into subspaces, and every subvector is
+#             coded as the nearest of 256 k-means centroids of its subspace, 1 byte per subspace
+#
+# Similarities are scored on the codes, a block of vectors at a time (pq: the inner products of a
+# query with the centroids of every subspace are summed up by code, without decoding the vectors),
+# and the best candidates can be re-ranked with their exact similarities, which only reads their
+# rows of the full-precision (memory-mapped) vectors. The codes are saved next to the vectors
+# (<kind>.json and <kind>*.bin) and, as the IVF index (see ann_index.py), built on first use.
+#
+# Run as a script, quantizes the models of the given model folders (converting their vectorsHD or
+# w2v model first if needed), and reports per model and kind the memory against float32 and float64
+# vectors, the queries per second against an exact search, and the overlap of the k nearest
+# libraries with the exact ones, without and with re-ranking (the queries are library vectors).
+#
+# Usage: ./quantized_vectors.py <modeldir>... [--dim N] [--kinds float16,int8,pq] [--subspaces N]
+#                               [--k N] [--rerank N] [--queries N] [--report report.json]
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from ann_index import exact_search, top_k
+from vector_store import VectorStore, convert_model, memmap, unit_rows, vector_store_dir, vector_store_outdated
+
+
+format_version = 1
+
+# # values of a block of decoded vectors (or of pq lookups) scored at once
+block_size = 1 << 20
+kinds = ['float16', 'int8', 'pq']
+
+
+class QuantizedVectors:
+
+    kind = None
+
+    def __len__(self):
+        return self.count
+
+    #approximate similarities (queries, vectors) of unit queries to all vectors, or to the given rows
+    def scores(self, queries, rows=None, out=None):
+        count = self.count if rows is None else len(rows)
+        if out is None:
+            out = np.empty((len(queries), count), dtype=np.float32)
+        step = max(1, block_size // max(1, self.block_cost(len(queries))))
+        for start in range(0, count, step):
+            end = min(start + step, count)
+            out[:, start:end] = self.score_block(queries, slice(start, end) if rows is None else rows[start:end])
+        return out
+
+    #(rows, scores) of the (approximately) k most similar vectors of every query, best first;
+    #with vectors (the full-precision vectors), the best rerank candidates are re-ranked exactly
+    def search(self, queries, k=10, rerank=0, vectors=None):
+        queries = unit_rows(np.atleast_2d(queries))
+        if vectors is None or rerank <= k:
+            return top_k(self.scores(queries), k)
+        rows, _ = top_k(self.scores(queries), rerank)
+        return exact_rerank(vectors, queries, rows, k)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays().values())
+
+    def save(self, dirname):
+        for name, array in self.arrays().items():
+            array.tofile(dirname+'/'+name+'.bin')
+        meta = dict(self.params, version=format_version, kind=self.kind, count=self.count, dim=self.dim)
+        with open(dirname+'/'+self.kind+'.json', 'w') as fd:
+            json.dump(meta, fd, indent=2)
+
+
+class Float16Vectors(QuantizedVectors):
+
+    kind = 'float16'
+
+    def __init__(self, codes, params=None):
+        self.codes = codes
+        self.count, self.dim = codes.shape
+        self.params = params or {}
+
+    @classmethod
+    def build(cls, vectors):
+        return cls(np.asarray(vectors, dtype=np.float16))
+
+    @classmethod
+    def load(cls, dirname, meta):
+        return cls(memmap(dirname+'/float16.bin', np.float16, (meta['count'], meta['dim'])), meta)
+
+    def arrays(self):
+        return {'float16': self.codes}
+
+    def block_cost(self, nqueries):
+        return self.dim + nqueries
+
+    def score_block(self, queries, rows):
+        return queries @ self.codes[rows].astype(np.float32).T
+
+    def decode(self, rows):
+        return self.codes[rows].astype(np.float32)
+
+
+class Int8Vectors(QuantizedVectors):
+
+    kind = 'int8'
+
+    def __init__(self, codes, scales, params=None):
+        self.codes = codes
+        self.scales = scales
+        self.count, self.dim = codes.shape
+        self.params = params or {}
+
+    @classmethod
+    def build(cls, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127 if len(vectors) else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1).astype(np.float32)
+        codes = np.clip(np.round(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return cls(codes, scales)
+
+    @classmethod
+    def load(cls, dirname, meta):
+        return cls(memmap(dirname+'/int8.bin', np.int8, (meta['count'], meta['dim'])),
+                   memmap(dirname+'/int8_scales.bin', np.float32, meta['count']), meta)
+
+    def arrays(self):
+        return {'int8': self.codes, 'int8_scales': self.scales}
+
+    def block_cost(self, nqueries):
+        return self.dim + nqueries
+
+    def score_block(self, queries, rows):
+        return (queries @ self.codes[rows].astype(np.float32).T) * self.scales[rows]
+
+    def decode(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+
+#k-means centroids of the rows of a sample
+def kmeans(sample, ncentroids, iterations, rng):
+    centroids = sample[rng.choice(len(sample), ncentroids, replace=len(sample) < ncentroids)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T - 0.5 * (centroids * centroids).sum(axis=1), axis=1)
+        counts = np.bincount(labels, minlength=ncentroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        #empty clusters restart at a random sample
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+    return centroids
+
+
+class PQVectors(QuantizedVectors):
+
+    kind = 'pq'
+
+    #codebooks: (subspaces, 256, subspace dim), codes: (subspaces, count), one row per subspace so
+    #that the codes of a subspace are contiguous
+    def __init__(self, codebooks, codes, params=None):
+        self.codebooks = codebooks
+        self.codes = codes
+        self.count = codes.shape[1]
+        self.dim = codebooks.shape[0] * codebooks.shape[2]
+        self.params = params or {}
+
+    @classmethod
+    def build(cls, vectors, subspaces=None, iterations=15, sample_size=65536, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        subspaces = subspaces or max(1, dim // 4)
+        if dim % subspaces != 0:
+            raise ValueError("%d dimensions cannot be split into %d subspaces" % (dim, subspaces))
+        rng = np.random.RandomState(seed)
+        sample = vectors
+        if len(vectors) > sample_size:
+            sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        width = dim // subspaces
+        codebooks = np.zeros((subspaces, 256, width), dtype=np.float32)
+        codes = np.zeros((subspaces, len(vectors)), dtype=np.uint8)
+        for m in range(subspaces):
+            columns = slice(m * width, (m + 1) * width)
+            if len(sample) > 0:
+                codebooks[m] = kmeans(sample[:, columns], 256, iterations, rng)
+            norms = 0.5 * (codebooks[m] * codebooks[m]).sum(axis=1)
+            for start in range(0, len(vectors), 65536):
+                block = vectors[start:start+65536, columns]
+                codes[m, start:start+len(block)] = np.argmax(block @ codebooks[m].T - norms, axis=1)
+        params = {'subspaces': subspaces, 'iterations': iterations, 'sample_size': sample_size, 'seed': seed}
+        return cls(codebooks, codes, params)
+
+    @classmethod
+    def load(cls, dirname, meta):
+        subspaces = meta['subspaces']
+        return cls(np.fromfile(dirname+'/pq_codebooks.bin', dtype=np.float32).reshape(subspaces, 256, -1),
+                   memmap(dirname+'/pq_codes.bin', np.uint8, (subspaces, meta['count'])), meta)
+
+    def arrays(self):
+        return {'pq_codebooks': self.codebooks, 'pq_codes': self.codes}
+
+    #a few queries are scored with lookups, more at once on the decoded vectors
+    def lookups(self, nqueries):
+        return nqueries * len(self.codebooks) <= self.dim
+
+    def block_cost(self, nqueries):
+        return nqueries * len(self.codebooks) if self.lookups(nqueries) else self.dim + nqueries
+
+    #asymmetric distance computation: lookup tables of the (query, subspace, centroid) inner products
+    def score_block(self, queries, rows):
+        if not self.lookups(len(queries)):
+            return queries @ self.decode(rows).T
+        width = self.codebooks.shape[2]
+        tables = np.einsum('qms,mcs->mqc', queries.reshape(len(queries), len(self.codebooks), width), self.codebooks)
+        scores = tables[0].take(self.codes[0, rows], axis=1)
+        for m in range(1, len(tables)):
+            scores += tables[m].take(self.codes[m, rows], axis=1)
+        return scores
+
+    def decode(self, rows):
+        codes = self.codes[:, rows]
+        width = self.codebooks.shape[2]
+        vectors = np.empty((codes.shape[1], self.dim), dtype=np.float32)
+        for m, codebook in enumerate(self.codebooks):
+            np.take(codebook, codes[m], axis=0, out=vectors[:, m*width:(m+1)*width])
+        return vectors
+
+
+quantizers = {cls.kind: cls for cls in (Float16Vectors, Int8Vectors, PQVectors)}
+
+
+#the k best of the candidate rows of every query (-1 padded), by exact similarity with the rows of
+#the full-precision vectors, which are normalized as they are read
+def exact_rerank(vectors, queries, rows, k):
+    valid = rows >= 0
+    candidates = unit_rows(np.asarray(vectors[np.where(valid, rows, 0).ravel()], dtype=np.float32)).reshape(rows.shape + (-1,))
+    scores = np.where(valid, np.einsum('qd,qcd->qc', queries, candidates), -np.inf).astype(np.float32)
+    best, bestscores = top_k(scores, k)
+    return np.where(np.isfinite(bestscores), np.take_along_axis(rows, best, axis=1), -1), bestscores
+
+
+#quantized vectors of a kind of a vector store, built and saved on first use
+def load_quantized(store, kind, **params):
+    cls = quantizers[kind]
+    if os.path.isfile(store.dirname+'/'+kind+'.json'):
+        with open(store.dirname+'/'+kind+'.json') as fd:
+            meta = json.load(fd)
+        if meta['version'] != format_version:
+            raise ValueError("Unsupported %s vectors version %s in %s" % (kind, meta['version'], store.dirname))
+        if meta['count'] == len(store) and all(meta.get(key) == value for key, value in params.items()):
+            return cls.load(store.dirname, meta)
+    quantized = cls.build(store.unit_vectors(), **params)
+    quantized.save(store.dirname)
+    return quantized
+
+
+###################
+
+
+parser = argparse.ArgumentParser(description='Quantize the library vectors of models, and report on the quantized search.')
+parser.add_argument('modeldirs', nargs='*', default=['../datasets/%s/models' % language for language in ('java', 'javascript', 'python')])
+parser.add_argument('--dim', type=int, default=100, help='vector dimension of the models')
+parser.add_argument('--kinds', default=','.join(kinds))
+parser.add_argument('--subspaces', type=int, help='pq subspaces (default = dim / 4)')
+parser.add_argument('--k', type=int, default=10)
+parser.add_argument('--rerank', type=int, default=50, help='candidates re-ranked exactly')
+parser.add_argument('--queries', type=int, default=1000)
+parser.add_argument('--batch', type=int, default=100, help='queries per batch')
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--report', help='also write the report as JSON')
+
+
+#queries per second of a search, in batches and one query at a time (on up to 200 queries)
+def timed(search, queries, batchsize):
+    t0 = time.perf_counter()
+    results = [search(queries[i:i+batchsize]) for i in range(0, len(queries), batchsize)]
+    batched = len(queries) / (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for query in queries[:200]:
+        search(query[None])
+    single = min(len(queries), 200) / (time.perf_counter() - t0)
+    return np.concatenate([rows for rows, _ in results]), batched, single
+
+
+def overlap(found, expected):
+    return float(np.mean([len(np.intersect1d(f[f >= 0], e)) / len(e) for f, e in zip(found, expected)]))
+
+
+#{kind: report} of a vector store
+def quantization_report(store, kinds, args):
+    vectors = store.unit_vectors()
+    rng = np.random.RandomState(args.seed)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    expected, batched, single = timed(lambda q: exact_search(vectors, q, args.k), queries, args.batch)
+    float32 = len(store) * store.dim * 4
+    report = {'exact': {'bytes': float32, 'batched_qps': batched, 'single_qps': single}}
+    for kind in kinds:
+        params = {'subspaces': args.subspaces} if kind == 'pq' and args.subspaces else {}
+        t0 = time.perf_counter()
+        quantized = load_quantized(store, kind, **params)
+        loadtime = time.perf_counter() - t0
+        found, batched, single = timed(lambda q: quantized.search(q, args.k), queries, args.batch)
+        reranked, rbatched, rsingle = timed(lambda q: quantized.search(q, args.k, args.rerank, store.vectors), queries, args.batch)
+        report[kind] = {'bytes': quantized.nbytes(), 'vs_float32': float32 / quantized.nbytes(), 'vs_float64': 2 * float32 / quantized.nbytes(),
+                        'load_seconds': loadtime, 'batched_qps': batched, 'single_qps': single,
+                        'batched_speedup': batched / report['exact']['batched_qps'], 'single_speedup': single / report['exact']['single_qps'],
+                        'overlap': overlap(found, expected), 'reranked_batched_qps': rbatched, 'reranked_single_qps': rsingle,
+                        'reranked_overlap': overlap(reranked, expected)}
+    return report
+
+
+def print_report(name, count, dim, report, args):
+    exact = report['exact']
+    print("%s: %d vectors (dim %d), float32 %.1f MB, %.0f batched / %.0f single queries/s exact" % (
+        name, count, dim, exact['bytes'] / 1e6, exact['batched_qps'], exact['single_qps']))
+    print("  %-8s %9s %6s %6s %9s %9s %8s %10s %10s %10s" % ('kind', 'MB', 'vs f32', 'vs f64', 'batch q/s', 'single q/s',
+          'overlap', 'rerank q/s', 'single q/s', 'overlap'))
+    for kind, r in report.items():
+        if kind != 'exact':
+            print("  %-8s %9.2f %5.1fx %5.1fx %9.0f %9.0f %8.3f %10.0f %10.0f %10.3f" % (kind, r['bytes'] / 1e6, r['vs_float32'], r['vs_float64'],
+                  r['batched_qps'], r['single_qps'], r['overlap'], r['reranked_batched_qps'], r['reranked_single_qps'], r['reranked_overlap']))
+    print("  overlap@%d with the exact nearest libraries, re-ranking the best %d candidates" % (args.k, args.rerank))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    reports = {}
+    for modeldir in args.modeldirs:
+        if vector_store_outdated(modeldir, args.dim):
+            convert_model(modeldir, args.dim)
+        store = VectorStore(vector_store_dir(modeldir, args.dim))
+        reports[modeldir] = quantization_report(store, args.kinds.split(','), args)
+        print_report(modeldir, len(store), store.dim, reports[modeldir], args)
+    for kind in args.kinds.split(','):
+        print("all models, %-8s %8.1f MB (float32 %.1f MB, float64 %.1f MB)" % (kind, sum(r[kind]['bytes'] for r in reports.values()) / 1e6,
+              sum(r['exact']['bytes'] for r in reports.values()) / 1e6, 2 * sum(r['exact']['bytes'] for r in reports.values()) / 1e6))
+    if args.report:
+        with open(args.report, 'w') as fd:
+            json.dump({'config': vars(args), 'models': reports}, fd, indent=2)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Batched similarity queries: the nearest libraries of many contexts (e.g. the imports of many
+# files) at once. The contexts are a sparse (contexts x vocabulary) matrix in CSR form, and their
+# centroids are one sparse x dense product with the unit vectors; a block of centroids is then
+# scored against the whole vocabulary with a single matrix product, and the top k of every row
+# selected, after masking out the context's own libraries and the libraries that do not pass the
+# context's filter (e.g. an intent, see intent_index.py). Searches within a small set of libraries
+# (e.g. a rare intent) only score those. With quantized vectors (see quantized_vectors.py), the
+# blocks are scored on the codes, and the best candidates re-ranked with their exact similarities.
+#
+# Usage: ./query_engine.py <vectorstoredir> <contexts.jsonl> [<k>]
+#        (reads a JSON list of libraries per line, and writes the k nearest libraries of each
+#         as a JSON list of [library, similarity] per line)
+
+import json
+import sys
+
+import numpy as np
+
+from ann_index import top_k
+from cooccurrence import sorted_unique
+from quantized_vectors import exact_rerank
+from vector_store import VectorStore, unit_rows
+
+
+# max # scores computed at once (a block of scores should stay cache-friendly)
+block_size = 1 << 22
+# # columns per chunk of the blocked top-k selection
+chunk_size = 64
+
+
+#(ids, offsets) CSR arrays of the known, distinct rows of every context
+def context_csr(store, contexts):
+    lengths = np.fromiter((len(c) for c in contexts), dtype=np.int64, count=len(contexts))
+    rows = store.indices([name for context in contexts for name in context])
+    qids = np.repeat(np.arange(len(contexts)), lengths)
+    keep = rows >= 0
+    #sorted, distinct (context, row) pairs
+    keys = sorted_unique(qids[keep] * len(store) + rows[keep])
+    ids = keys % len(store)
+    offsets = np.searchsorted(keys // len(store), np.arange(len(contexts) + 1))
+    return ids, offsets
+
+
+#top-k (rows, scores) of each row of a score matrix, best first, padded with -1/-inf
+#the k-th largest of the row's chunk maxima is a lower bound of its k-th largest score, so that
+#only the few scores above it need to be sorted (the chunks are strided: column j is in chunk
+#j % nchunks, so that the maxima are taken over contiguous rows of columns)
+def blocked_top_k(scores, k, chunk=chunk_size):
+    nrows, ncols = scores.shape
+    if k == 0:
+        return np.zeros((nrows, 0), dtype=np.int64), np.zeros((nrows, 0), dtype=scores.dtype)
+    nchunks = ncols // chunk
+    if nchunks < 4 * k:
+        rows, best = top_k(scores, k)
+        return np.where(np.isfinite(best), rows, -1), best
+    maxima = scores[:, :nchunks*chunk].reshape(nrows, chunk, nchunks).max(axis=1)
+    threshold = np.partition(maxima, nchunks - k, axis=1)[:, nchunks - k]
+    #-inf scores (masked out) are never candidates
+    threshold = np.maximum(threshold, np.finfo(scores.dtype).min)
+    candidates = scores >= threshold[:, None]
+    rowids, colids = np.nonzero(candidates)
+    values = scores[rowids, colids]
+    order = np.lexsort((-values, rowids))
+    rowids, colids, values = rowids[order], colids[order], values[order]
+    starts = np.searchsorted(rowids, np.arange(nrows))
+    rank = np.arange(len(rowids)) - starts[rowids]
+    keep = rank < k
+    rows = np.full((nrows, k), -1, dtype=np.int64)
+    best = np.full((nrows, k), -np.inf, dtype=scores.dtype)
+    rows[rowids[keep], rank[keep]] = colids[keep]
+    best[rowids[keep], rank[keep]] = values[keep]
+    return rows, best
+
+
+class QueryEngine:
+
+    #vectors: unit vectors; or, with codes (quantized vectors), the full-precision vectors (e.g. the
+    #memory-mapped vectors of a store), of which only the context and re-ranked rows are read
+    def __init__(self, vectors, codes=None, rerank=0):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.codes = codes
+        self.rerank = rerank
+
+    @classmethod
+    def from_store(cls, store, codes=None, rerank=0):
+        return cls(store.vectors if codes is not None else store.unit_vectors(), codes, rerank)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    #unit centroids of CSR contexts: a sparse (contexts x vocabulary) x (vocabulary x dim) product
+    def centroids(self, ids, offsets):
+        counts = np.diff(offsets)
+        sums = np.zeros((len(counts), self.vectors.shape[1]), dtype=np.float32)
+        nonempty = np.nonzero(counts)[0]
+        if len(nonempty) > 0:
+            vectors = self.vectors[ids] if self.codes is None else unit_rows(self.vectors[ids])
+            sums[nonempty] = np.add.reduceat(vectors, offsets[nonempty], axis=0)
+        return unit_rows(sums)
+
+    #top-k (rows, scores) of a block of scores of centroids, re-ranked exactly with quantized vectors
+    def select(self, block, centroids, k, columns=None):
+        rerank = self.codes is not None and self.rerank > k
+        rows, scores = blocked_top_k(block, min(self.rerank, block.shape[1]) if rerank else k)
+        if columns is not None:
+            rows = np.where(rows >= 0, columns[rows], -1)
+        if rerank:
+            rows, scores = exact_rerank(self.vectors, centroids, rows, k)
+        return rows, scores
+
+    #(rows, scores) of the k nearest libraries of every CSR context, best first
+    #filters: None, or one per context: None or a boolean (vocabulary,) mask of the allowed libraries
+    #rows are padded with -1 (scores with -inf) for contexts without known libraries or allowed results
+    def search(self, ids, offsets, k=10, exclude_context=True, filters=None):
+        ncontexts = len(offsets) - 1
+        k = min(k, len(self))
+        rows = np.full((ncontexts, k), -1, dtype=np.int64)
+        scores = np.full((ncontexts, k), -np.inf, dtype=np.float32)
+        centroids = self.centroids(ids, offsets)
+        counts = np.diff(offsets)
+        step = max(1, block_size // max(1, len(self)))
+        buffer = np.empty((min(step, ncontexts), len(self)), dtype=np.float32)
+        for start in range(0, ncontexts, step):
+            end = min(start + step, ncontexts)
+            if self.codes is None:
+                block = np.matmul(centroids[start:end], self.vectors.T, out=buffer[:end - start])
+            else:
+                block = self.codes.scores(centroids[start:end], out=buffer[:end - start])
+            if exclude_context:
+                first, last = offsets[start], offsets[end]
+                block[np.repeat(np.arange(end - start), counts[start:end]), ids[first:last]] = -np.inf
+            if filters is not None:
+                self.apply_filters(block, filters[start:end])
+            block[counts[start:end] == 0] = -np.inf
+            rows[start:end], scores[start:end] = self.select(block, centroids[start:end], k)
+        return rows, scores
+
+    #search() restricted to sorted candidate rows (e.g. the libraries of a rare intent), which
+    #are the only ones scored
+    def search_rows(self, ids, offsets, candidates, k=10, exclude_context=True):
+        ncontexts = len(offsets) - 1
+        k = min(k, len(candidates))
+        rows = np.full((ncontexts, k), -1, dtype=np.int64)
+        scores = np.full((ncontexts, k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return rows, scores
+        centroids = self.centroids(ids, offsets)
+        vectors = self.vectors[candidates] if self.codes is None else None
+        counts = np.diff(offsets)
+        #the candidate columns of the context libraries
+        positions = np.minimum(np.searchsorted(candidates, ids), len(candidates) - 1)
+        found = candidates[positions] == ids
+        step = max(1, block_size // len(candidates))
+        for start in range(0, ncontexts, step):
+            end = min(start + step, ncontexts)
+            block = centroids[start:end] @ vectors.T if vectors is not None else self.codes.scores(centroids[start:end], candidates)
+            if exclude_context:
+                first, last = offsets[start], offsets[end]
+                contextids = np.repeat(np.arange(end - start), counts[start:end])
+                block[contextids[found[first:last]], positions[first:last][found[first:last]]] = -np.inf
+            block[counts[start:end] == 0] = -np.inf
+            rows[start:end], scores[start:end] = self.select(block, centroids[start:end], k, candidates)
+        return rows, scores
+
+    #masks out the libraries that are not allowed, with one operation per distinct filter
+    @staticmethod
+    def apply_filters(block, filters):
+        groups = {}
+        for i, mask in enumerate(filters):
+            if mask is not None:
+                groups.setdefault(id(mask), (mask, []))[1].append(i)
+        for mask, members in groups.values():
+            block[members] = np.where(mask, block[members], -np.inf)
+
+    #[[(name, similarity), ...] of every context], for contexts given as lists of library names
+    def most_similar(self, store, contexts, k=10, filters=None):
+        rows, scores = self.search(*context_csr(store, contexts), k, filters=filters)
+        return [[(store.names[r], float(s)) for r, s in zip(rowlist, scorelist) if r >= 0]
+                for rowlist, scorelist in zip(rows.tolist(), scores.tolist())]
+
+
+if __name__ == '__main__':
+    store = VectorStore(sys.argv[1])
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    engine = QueryEngine.from_store(store)
+    with open(sys.argv[2], encoding='utf-8') as fd:
+        contexts = [json.loads(line) for line in fd if line.strip()]
+    for similar in engine.most_similar(store, contexts, k):
+        print(json.dumps(similar))
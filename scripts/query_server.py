@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Self-hosted query server implementing the Code Compass REST API (docs/code-compass-openapi.yaml)
+# over trained models, for the VS Code plugin (plugins/vscode):
+#
+#   POST /searchByIntent/{language}                  {"context": [...], "intent": ...} -> {"raw", "filtered"}
+#   POST /nearestCategories/{language}/{num}         [context...] -> {"cats", "nearestLibs"}
+#   POST /filteredNearestCategories/{language}/{num} {"context": [...], "filter": ...} -> {"cats", "nearestLibs"}
+#   POST /mapping/{language}/{specification}         package(s) or module -> mapping
+#   GET  /intents/{language}, /libs/{language}, /getSnippets/{language}
+#   POST /feedback
+#
+# The models of every language (<datasetsdir>/<language>/models, see train_vectors.py) are loaded
+# once, as memory-mapped vector stores (see vector_store.py), before a pool of worker processes is
+# forked: the workers share their pages, and run the similarity searches, while the asyncio event
+# loop only parses requests and serializes responses. A context vector is the mean of the unit
+# vectors of the known context libraries (see query_engine.py). With --quantize, the searches scan
+# float16, int8 or product-quantized copies of the vectors instead (see quantized_vectors.py), and
+# re-rank the best --rerank candidates exactly, so that the full-precision vectors are mostly not
+# paged in.
+#
+# Optional files in a models folder:
+#   annotations.json.gz      {library: {"stars", "usages", "license", "info", "description", "categories"}}
+#                            (the categories are indexed next to the vectors, see intent_index.py)
+#   package_modules.json.gz  {package: module}, for /mapping (without it, libraries are their own modules;
+#                            packages map to the module of their longest known prefix, see package_index.py)
+#
+# /mapping uses the package index of the processed dataset (<datasetsdir>/<language>/processed/package_index,
+# built by preprocess.sh for java) when there is one, and else indexes the libraries of the model.
+#
+# Usage: ./query_server.py [<datasetsdir>] [--port N] [--workers N] [--dim N] [--quantize KIND] [--api-key KEY]...
+
+import argparse
+import asyncio
+import concurrent.futures
+import gzip
+import json
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import time
+import traceback
+import urllib.parse
+
+import numpy as np
+
+from ann_index import load_index
+from intent_index import load_intent_index, top_level
+from package_index import PackageIndex, load_package_index, package_index_dir
+from quantized_vectors import load_quantized, quantizers
+from query_engine import QueryEngine, context_csr
+from vector_store import VectorStore, convert_model, vector_store_dir, vector_store_outdated
+
+
+# API language -> dataset language
+LANGUAGES = {'java': 'java', 'js': 'javascript', 'javascript': 'javascript', 'python': 'python'}
+
+# max # suggestions (collapsed libraries) in 'filtered' and 'nearestLibs' results
+max_suggestions = 20
+# max # raw suggestions of /searchByIntent
+max_raw = 100
+# max # categories of /nearestCategories
+max_categories = 50
+# intents with less than this fraction of the libraries are searched by scoring only their libraries
+sparse_intent = 1 / 16
+# max request body size
+max_body = 1 << 20
+
+HTTP_STATUS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+parser = argparse.ArgumentParser(description='Code Compass query server.')
+parser.add_argument('datasetsdir', nargs='?', default='../datasets')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8080)
+parser.add_argument('--workers', type=int, default=os.cpu_count(), help='search processes (0 = search in threads)')
+parser.add_argument('--dim', type=int, default=100, help='vector dimension of the models')
+parser.add_argument('--languages', default='java,javascript,python')
+parser.add_argument('--ann', action='store_true', help='search with an IVF index (see ann_index.py)')
+parser.add_argument('--nprobe', type=int, default=16)
+parser.add_argument('--quantize', choices=sorted(quantizers), help='search on quantized vectors (see quantized_vectors.py)')
+parser.add_argument('--rerank', type=int, default=50, help='candidates of a quantized search re-ranked exactly')
+parser.add_argument('--api-key', action='append', default=[], help='accepted API_KEY (default = accept any)')
+parser.add_argument('--feedback', help='file to append /feedback records to (default = <datasetsdir>/feedback.jsonl)')
+
+
+def read_json_gz(filename, default):
+    if not os.path.isfile(filename):
+        return default
+    with gzip.open(filename, 'rt', encoding='utf-8') as fd:
+        return json.load(fd)
+
+
+class LibraryModel:
+
+    def __init__(self, modeldir, dim=100, language=None, ann=False, nprobe=16, quantize=None, rerank=50):
+        if vector_store_outdated(modeldir, dim):
+            convert_model(modeldir, dim, language)
+        self.store = VectorStore(vector_store_dir(modeldir, dim))
+        self.names = self.store.names.tolist()
+        self.codes = load_quantized(self.store, quantize) if quantize else None
+        self.engine = QueryEngine.from_store(self.store, self.codes, rerank)
+        self.index = load_index(self.store) if ann else None
+        self.nprobe = nprobe
+
+        lib_dict = {}
+        if os.path.isfile(modeldir+'/lib_dict_dim{}.json'.format(dim)):
+            with open(modeldir+'/lib_dict_dim{}.json'.format(dim), encoding='utf-8') as fd:
+                lib_dict = json.load(fd)
+        self.annotations = read_json_gz(modeldir+'/annotations.json.gz', {})
+        for name, entry in lib_dict.items():
+            self.annotations.setdefault(name, {}).setdefault('usages', entry['freq'])
+        datasetindex = package_index_dir(os.path.dirname(os.path.normpath(modeldir)))
+        if os.path.isfile(datasetindex+'/package_index.json'):
+            self.package_index = PackageIndex(datasetindex)
+        else:
+            self.package_index = load_package_index(self.store, modeldir+'/package_modules.json.gz',
+                                                    {name: entry['freq'] for name, entry in lib_dict.items()})
+        self.module_packages = self.package_index.module_packages()
+        self.intent_index = load_intent_index(self.store, modeldir+'/annotations.json.gz', self.annotations)
+        self.intents = self.intent_index.intents
+
+    #rows and similarities of the num libraries nearest to a context, without the context itself,
+    #optionally among the libraries of an intent only (the IVF index only serves unfiltered searches)
+    def nearest_rows(self, context, num, intent=None):
+        ids, offsets = context_csr(self.store, [context])
+        if len(ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if intent:
+            if self.intent_index.density(intent) < sparse_intent:
+                found, scores = self.engine.search_rows(ids, offsets, self.intent_index.rows(intent), num)
+            else:
+                found, scores = self.engine.search(ids, offsets, num, filters=[self.intent_index.mask(intent)])
+            found, scores = found[0][found[0] >= 0], scores[0][found[0] >= 0]
+        elif self.index is not None:
+            found, scores = self.index.search(self.engine.centroids(ids, offsets), num + len(ids), self.nprobe)
+            keep = (found[0] >= 0) & ~np.isin(found[0], ids)
+            found, scores = found[0][keep][:num], scores[0][keep][:num]
+        else:
+            found, scores = self.engine.search(ids, offsets, num)
+            found, scores = found[0][found[0] >= 0], scores[0][found[0] >= 0]
+        return found, scores
+
+    def nearest(self, context, num, intent=None):
+        rows, scores = self.nearest_rows(context, num, intent)
+        return [self.names[r] for r in rows], scores.tolist()
+
+    def categories(self, name):
+        return self.annotations.get(name, {}).get('categories', [])
+
+    def annotate(self, name):
+        annotation = {'module': name, 'stars': None, 'usages': None, 'license': [], 'info': {},
+                      'description': '', 'categories': []}
+        annotation.update(self.annotations.get(name, {}))
+        annotation['module'] = name
+        return annotation
+
+    #annotations of the top-level libraries of names, in order, optionally filtered by intent
+    def suggestions(self, names, intent=None, limit=max_suggestions):
+        suggestions = []
+        seen = set()
+        for name in names:
+            module = top_level(name)
+            if module in seen:
+                continue
+            annotation = self.annotate(module if module in self.annotations else name)
+            if intent and intent not in annotation['categories']:
+                continue
+            seen.add(module)
+            annotation['module'] = module
+            suggestions.append(annotation)
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+    #[[category, # nearest libraries with that category], ...], most frequent first
+    def category_counts(self, rows):
+        return self.intent_index.category_counts(rows, max_categories)
+
+    #module of the longest known package prefix of every package or class (see package_index.py)
+    def modules_for_packages(self, packages):
+        return self.package_index.modules_for_packages(packages)
+
+    def module_for_package(self, package):
+        return self.modules_for_packages([package])[0]
+
+
+###################
+
+#the models of every language, loaded before the workers are forked
+models = {}
+
+
+def load_models(datasetsdir, languages, dim=100, ann=False, nprobe=16, quantize=None, rerank=50):
+    for language in languages:
+        modeldir = os.path.join(datasetsdir, language, 'models')
+        if os.path.isdir(modeldir):
+            t0 = time.perf_counter()
+            models[language] = LibraryModel(modeldir, dim, language, ann, nprobe, quantize, rerank)
+            print("Loaded %d %s libraries in %.2fs" % (len(models[language].names), language, time.perf_counter() - t0))
+
+
+#searches, run in the worker pool
+
+#the libraries of the intent are filtered while searching, so that even a rare intent has results
+def search_by_intent(language, context, intent, num=1000):
+    model = models[language]
+    names, _ = model.nearest(context, num, intent)
+    return {'raw': names[:max_raw], 'filtered': model.suggestions(names)}
+
+
+def nearest_categories(language, context, num, filter=None):
+    model = models[language]
+    rows, _ = model.nearest_rows(context, num)
+    names = [model.names[r] for r in rows]
+    if filter:
+        names, _ = model.nearest(context, num, filter)
+    return {'cats': model.category_counts(rows), 'nearestLibs': model.suggestions(names, filter)}
+
+
+#mapping specifications: (model, body) -> result, None if there is no mapping
+def map_modules_for_packages(model, packages):
+    modules = model.modules_for_packages(packages)
+    return [module for module in modules if module is not None]
+
+#mapping specifications of an array of packages (the others map a single package or module)
+LIST_MAPPINGS = {'modulesForPackages', 'categoriesForPackages'}
+
+MAPPINGS = {
+    'moduleForPackage':      lambda model, package: model.module_for_package(package),
+    'modulesForPackages':    map_modules_for_packages,
+    'categoriesForModule':   lambda model, module: model.categories(module) or None,
+    'categoriesForPackage':  lambda model, package: model.categories(model.module_for_package(package)) or None,
+    'categoriesForPackages': lambda model, packages: sorted(set(cat for module in map_modules_for_packages(model, packages)
+                                                                for cat in model.categories(module))),
+    'packagesForModule':     lambda model, module: model.module_packages.get(module) or None,
+}
+
+
+###################
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.status = status
+
+
+#request body validation: the value, or a 400
+def string_list(value, what):
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise HTTPError(400, 'Expected a list of %s' % what)
+    return value
+
+
+def optional_string(value, what):
+    if value is not None and not isinstance(value, str):
+        raise HTTPError(400, 'Expected a string or null as %s' % what)
+    return value
+
+
+class QueryServer:
+
+    def __init__(self, pool=None, api_keys=(), feedbackfile=None):
+        self.pool = pool
+        self.api_keys = set(api_keys)
+        self.feedbackfile = feedbackfile
+        self.routes = [
+            ('POST', re.compile(r'/searchByIntent/(\w+)$'), self.search_by_intent),
+            ('POST', re.compile(r'/nearestCategories/(\w+)/(\d+)$'), self.nearest_categories),
+            ('POST', re.compile(r'/filteredNearestCategories/(\w+)/(\d+)$'), self.filtered_nearest_categories),
+            ('POST', re.compile(r'/mapping/(\w+)/(\w+)$'), self.mapping),
+            ('GET', re.compile(r'/intents/(\w+)$'), self.intents),
+            ('GET', re.compile(r'/libs/(\w+)$'), self.libs),
+            ('GET', re.compile(r'/getSnippets/(\w+)$'), self.snippets),
+            ('POST', re.compile(r'/feedback$'), self.feedback),
+        ]
+
+    def model(self, language):
+        language = LANGUAGES.get(language, language)
+        if language not in models:
+            raise HTTPError(404, 'Unsupported language: ' + language)
+        return language, models[language]
+
+    async def run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.pool, function, *args)
+
+    async def search_by_intent(self, body, language):
+        language, _ = self.model(language)
+        if not isinstance(body, dict):
+            raise HTTPError(400, 'Expected {"context": [...], "intent": ...}')
+        context = string_list(body.get('context') or [], 'libraries as context')
+        return await self.run(search_by_intent, language, context, optional_string(body.get('intent'), 'intent'))
+
+    async def nearest_categories(self, body, language, num):
+        language, _ = self.model(language)
+        return await self.run(nearest_categories, language, string_list(body or [], 'libraries as context'), int(num))
+
+    async def filtered_nearest_categories(self, body, language, num):
+        language, _ = self.model(language)
+        if not isinstance(body, dict):
+            raise HTTPError(400, 'Expected {"context": [...], "filter": ...}')
+        context = string_list(body.get('context') or [], 'libraries as context')
+        return await self.run(nearest_categories, language, context, int(num), optional_string(body.get('filter'), 'filter'))
+
+    async def mapping(self, body, language, specification):
+        _, model = self.model(language)
+        if specification not in MAPPINGS:
+            raise HTTPError(404, 'Unknown mapping: ' + specification)
+        if specification in LIST_MAPPINGS:
+            string_list(body, 'packages for ' + specification)
+        elif not isinstance(body, str):
+            raise HTTPError(400, 'Expected a string for ' + specification)
+        try:
+            return MAPPINGS[specification](model, body)
+        except (AttributeError, TypeError):
+            raise HTTPError(400, 'Invalid body for ' + specification)
+
+    async def intents(self, body, language):
+        return self.model(language)[1].intents
+
+    async def libs(self, body, language):
+        return self.model(language)[1].names
+
+    async def snippets(self, body, language):
+        return {}
+
+    async def feedback(self, body):
+        if not isinstance(body, dict):
+            raise HTTPError(400, 'Expected a feedback object')
+        if self.feedbackfile:
+            with open(self.feedbackfile, 'a', encoding='utf-8') as fd:
+                fd.write(json.dumps(dict(body, time=time.time())) + '\n')
+        return {}
+
+    #(status, result) of a request
+    async def dispatch(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        if self.api_keys:
+            keys = urllib.parse.parse_qs(url.query).get('API_KEY', [])
+            if not self.api_keys.intersection(keys):
+                raise HTTPError(401, 'Invalid API_KEY')
+        path = urllib.parse.unquote(url.path)
+        allowed = False
+        for routemethod, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                if routemethod != method:
+                    allowed = True
+                    continue
+                try:
+                    data = json.loads(body.decode('utf-8')) if body else None
+                except ValueError:
+                    raise HTTPError(400, 'Invalid JSON body')
+                result = await handler(data, *match.groups())
+                return (204, None) if result is None else (200, result)
+        raise HTTPError(405 if allowed else 404, path)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                requestline = await reader.readline()
+                if not requestline:
+                    break
+                method, target, version = requestline.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                keepalive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+                try:
+                    if length > max_body:
+                        raise HTTPError(413)
+                    body = await reader.readexactly(length) if length else b''
+                    status, result = await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, result = e.status, {'error': str(e)}
+                except Exception:
+                    traceback.print_exc()
+                    status, result = 500, {'error': 'Internal error'}
+                payload = b'' if result is None else json.dumps(result).encode('utf-8')
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                              'Access-Control-Allow-Origin: *\r\nConnection: %s\r\n\r\n' % (
+                                  status, HTTP_STATUS.get(status, ''), len(payload),
+                                  'keep-alive' if keepalive else 'close')).encode('latin-1') + payload)
+                await writer.drain()
+                if not keepalive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(server, host, port):
+    listener = await asyncio.start_server(server.handle, host, port, limit=max_body)
+    print("Listening on http://%s:%d" % (host, port))
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    load_models(args.datasetsdir, args.languages.split(','), args.dim, args.ann, args.nprobe, args.quantize, args.rerank)
+    if not models:
+        sys.exit("No models found in " + args.datasetsdir)
+
+    pool = None
+    if args.workers > 0:
+        pool = concurrent.futures.ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('fork'))
+        #forks the workers now, before the event loop starts
+        pool.submit(int).result()
+    feedbackfile = args.feedback or os.path.join(args.datasetsdir, 'feedback.jsonl')
+    #shuts the worker pool down on kill too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        asyncio.run(serve(QueryServer(pool, args.api_key, feedbackfile), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool:
+            pool.shutdown()
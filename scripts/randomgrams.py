@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Streaming, vectorized generation of randomgram (target, context, label) training pairs: for
+# every library in an import sequence (e.g. a source file), up to window_size other libraries of
+# the same sequence are positive contexts, and negative_ratio times as many random libraries are
+# negative contexts (optionally checked against a co-occurrence index, see cooccurrence.py).
+#
+# When a sequence has more than window_size other libraries, the contexts are a weighted sample
+# without replacement, with the make_sampling_table probabilities as weights; otherwise they are
+# all the other libraries. Sequences are processed in chunks, grouped by length, so that each
+# group's pairs are generated with a few array operations. The pairs of a chunk are shuffled, the
+# chunks are visited in random order per epoch, and everything is yielded in fixed-size batches,
+# so memory stays flat regardless of the corpus size.
+#
+# Usage: ./randomgrams.py <columnsdir> [<#workers>]   (benchmarks pair generation on the files of
+#                                                      a columnar dataset, see import_columns.py)
+
+import math
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+
+# max # (positive) pairs generated per chunk of sequences, i.e. the shuffling window
+pairs_per_chunk = 1 << 20
+# max # targets of a long sequence whose contexts are sampled at once
+sample_rows = 256
+
+
+#subsampling probabilities of the notebook, as an array indexed by library id
+def make_sampling_table(lib_dict, sampling_factor=1e-4):
+    freqs = np.array([v["freq"] for v in lib_dict.values()], dtype=np.float64)
+    return np.minimum(1.0, np.sqrt(sampling_factor / (freqs / freqs.sum())))
+
+
+#(ids, offsets) CSR arrays from a list of id sequences
+def to_csr(sequences):
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    ids = np.fromiter((i for s in sequences for i in s), dtype=np.int32, count=int(offsets[-1]))
+    return ids, offsets
+
+
+_offdiagonal = {}
+
+#(i, j) index arrays of all ordered pairs i != j of a length
+def offdiagonal(length):
+    if length not in _offdiagonal:
+        i, j = np.nonzero(~np.eye(length, dtype=bool))
+        _offdiagonal[length] = (i, j)
+    return _offdiagonal[length]
+
+
+class RandomgramGenerator:
+
+    def __init__(self, sequences, vocab_size, sampling_table=None, window_size=1000, negative_ratio=1,
+                 cooccurrence=None, batch_size=2**15, seed=0):
+        if isinstance(sequences, tuple):
+            self.ids, self.offsets = sequences
+        else:
+            self.ids, self.offsets = to_csr(sequences)
+        self.lengths = np.diff(self.offsets)
+        self.vocab_size = vocab_size
+        self.sampling_table = None if sampling_table is None else np.asarray(sampling_table, dtype=np.float64)
+        self.window_size = window_size
+        self.negative_ratio = negative_ratio
+        self.cooccurrence = cooccurrence
+        self.batch_size = batch_size
+        self.seed = seed
+        self.conflicts = 0
+        self.chunks = self.make_chunks()
+
+    #contiguous sequence ranges of about pairs_per_chunk positive pairs each
+    def make_chunks(self):
+        npositives = self.lengths * np.minimum(np.maximum(self.lengths - 1, 0), self.window_size)
+        bounds = np.searchsorted(np.cumsum(npositives), np.arange(pairs_per_chunk, npositives.sum(), pairs_per_chunk), side='right')
+        bounds = np.unique(np.concatenate([[0], bounds, [len(self.lengths)]]))
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    #number of (positive + negative) pairs in an epoch
+    def epoch_pairs(self):
+        num = np.minimum(np.maximum(self.lengths - 1, 0), self.window_size)
+        return int((self.lengths * (num + np.floor(num * self.negative_ratio))).sum())
+
+    def steps_per_epoch(self):
+        return math.ceil(self.epoch_pairs() / self.batch_size)
+
+    def rng(self, epoch, worker=0):
+        return np.random.RandomState([self.seed, epoch, worker])
+
+    #positive pairs of equally long sequences (an (r, L) matrix)
+    def group_positives(self, rows, rng):
+        length = rows.shape[1]
+        if length - 1 <= self.window_size:
+            i, j = offdiagonal(length)
+            return rows[:, i].ravel(), rows[:, j].ravel()
+
+        #weighted sampling without replacement: the window_size largest keys u^(1/p)
+        targets, contexts = [], []
+        for row in rows:
+            weights = np.ones(length) if self.sampling_table is None else self.sampling_table[row]
+            for start in range(0, length, sample_rows):
+                block = np.arange(start, min(start + sample_rows, length))
+                keys = rng.random_sample((len(block), length)) ** (1.0 / weights)
+                keys[np.arange(len(block)), block] = -1.0
+                chosen = np.argpartition(-keys, self.window_size - 1, axis=1)[:, :self.window_size]
+                targets.append(np.repeat(row[block], self.window_size))
+                contexts.append(row[chosen].ravel())
+        return np.concatenate(targets), np.concatenate(contexts)
+
+    #all pairs of the sequences [start, end), shuffled
+    def chunk_pairs(self, start, end, rng):
+        lengths = self.lengths[start:end]
+        targets, contexts, negtargets = [], [], []
+        for length in np.unique(lengths):
+            if length < 2:
+                continue
+            seqs = start + np.nonzero(lengths == length)[0]
+            rows = self.ids[self.offsets[seqs][:, None] + np.arange(length)]
+            t, c = self.group_positives(rows, rng)
+            targets.append(t)
+            contexts.append(c)
+            num = min(length - 1, self.window_size)
+            nneg = int(math.floor(num * self.negative_ratio))
+            if nneg > 0:
+                negtargets.append(np.repeat(rows.ravel(), nneg))
+        if not targets:
+            return None
+
+        positives = sum(len(t) for t in targets)
+        targets = np.concatenate(targets + negtargets).astype(np.int32)
+        contexts = np.concatenate(contexts).astype(np.int32)
+        negatives = rng.randint(0, self.vocab_size, size=len(targets) - positives).astype(np.int32)
+        if self.cooccurrence is not None and len(negatives) > 0:
+            negatives, conflicts = self.cooccurrence.resample_negatives(targets[positives:], negatives, rng, self.vocab_size)
+            self.conflicts += conflicts
+        contexts = np.concatenate([contexts, negatives])
+        labels = np.zeros(len(targets), dtype=np.float32)
+        labels[:positives] = 1.0
+
+        order = rng.permutation(len(targets))
+        return targets[order], contexts[order], labels[order]
+
+    #generator: one epoch of (targets, contexts, labels) batches; the last one may be smaller
+    #with workers > 1, the chunks are generated in that many processes and prefetched
+    def epoch(self, epoch=0, workers=0, prefetch=4):
+        rng = self.rng(epoch)
+        chunkorder = rng.permutation(len(self.chunks))
+        if workers > 1:
+            chunkstream = self.prefetch_chunks(epoch, chunkorder, workers, prefetch)
+        else:
+            chunkstream = (self.chunk_pairs(*self.chunks[c], rng) for c in chunkorder)
+        yield from self.batches(chunkstream)
+
+    #generator: re-slices chunks of pairs into fixed-size batches
+    def batches(self, chunkstream):
+        pending = []
+        npending = 0
+        for pairs in chunkstream:
+            if pairs is None:
+                continue
+            pending.append(pairs)
+            npending += len(pairs[0])
+            if npending < self.batch_size:
+                continue
+            arrays = [np.concatenate(column) for column in zip(*pending)]
+            nfull = npending - npending % self.batch_size
+            for start in range(0, nfull, self.batch_size):
+                yield tuple(a[start:start + self.batch_size] for a in arrays)
+            pending = [tuple(a[nfull:] for a in arrays)]
+            npending -= nfull
+        if npending > 0:
+            yield tuple(np.concatenate(column) for column in zip(*pending))
+
+    def prefetch_chunks(self, epoch, chunkorder, workers, prefetch):
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue(prefetch * workers)
+        procs = [ctx.Process(target=self.worker, args=(epoch, chunkorder[w::workers], w, queue), daemon=True)
+                 for w in range(workers)]
+        for proc in procs:
+            proc.start()
+        try:
+            done = 0
+            while done < workers:
+                item = queue.get()
+                if isinstance(item, str):
+                    done += 1
+                    continue
+                pairs, conflicts = item
+                self.conflicts += conflicts
+                yield pairs
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.join()
+
+    def worker(self, epoch, chunks, w, queue):
+        rng = self.rng(epoch, w + 1)
+        for c in chunks:
+            self.conflicts = 0
+            pairs = self.chunk_pairs(*self.chunks[c], rng)
+            queue.put((pairs, self.conflicts))
+        queue.put('done')
+
+    #generator: endless ([targets, contexts], labels) batches, as expected by keras' fit_generator
+    def keras_batches(self, workers=0):
+        epoch = 0
+        while True:
+            for targets, contexts, labels in self.epoch(epoch, workers):
+                yield [targets, contexts], labels
+            epoch += 1
+
+
+if __name__ == '__main__':
+    from import_columns import ImportColumns
+
+    columns = ImportColumns(sys.argv[1])
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    fileids = [np.unique(ids) for _, ids in columns.iter_files()]
+    counts = columns.import_counts()
+    sampling_table = np.minimum(1.0, np.sqrt(1e-4 / np.maximum(counts / counts.sum(), 1e-12)))
+
+    generator = RandomgramGenerator(fileids, len(columns.imports), sampling_table, batch_size=2**15)
+    t0 = time.perf_counter()
+    npairs = 0
+    for targets, contexts, labels in generator.epoch(0, workers):
+        npairs += len(targets)
+    elapsed = time.perf_counter() - t0
+    print("%d files, %d pairs (%d expected) in %.2fs: %.0f pairs/s" % (
+        len(fileids), npairs, generator.epoch_pairs(), elapsed, npairs / elapsed))
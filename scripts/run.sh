@@ -14,7 +14,8 @@ if [ $# -eq 0 -o "$1" = "-h" -o "$1" = "--help" ] ; then
 	echo "  <maxprojects>   Maximum GitHub projects (default = 0: all)"
 	echo "  <minstars>      Min GitHub stars (default = 2)"
 	echo "  <maxsize>       Max project size (in kb) (default = 0)"
-	echo "  <usecache>      Cache intermediate files/scripts (default = 0)"
+	echo "  <usecache>      Cache intermediate files/scripts"
+	echo "                  and only reprocess new and changed projects (default = 0)"
 	exit 1
 fi
 
@@ -35,7 +36,7 @@ echo "[RUNNING CRAWL]"
 echo ; echo
 
 echo "[RUNNING PREPROCESS]"
-./preprocess.sh $language || exit 1
+./preprocess.sh $language $usecache || exit 1
 echo ; echo
 
 echo "DONE!"
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Single-pass import scanner for JavaScript/TypeScript sources. It extracts the modules of
+#   require('x'), import ... from 'x', import 'x', export ... from 'x' and import('x')
+# across line breaks, while skipping comments, strings, template literals (including nested ${...}
+# expressions) and regex literals. All regexes below either match at a fixed position or consume
+# what they match, so the scan is linear in the file size, also on minified bundles.
+#
+# Code, strings and comments are skipped by a single regex; Python only gets involved at the few
+# tokens that need context: a bare '/' (division or regex literal), template literals, and the
+# import/export/require keywords themselves.
+
+import re
+import sys
+import time
+
+
+# per-file budget: larger files are skipped, slower scans are cut off (returning what was found so far)
+max_file_size = 8*1024*1024
+max_file_seconds = 2.0
+# number of scans cut off at max_file_seconds, whose imports may be incomplete
+scan_stats = {'cut_off': 0}
+# upper bound on the length of an import clause or regex literal: a failed match at any position
+# never looks further ahead than this
+max_lexeme = 4096
+
+# everything that can be skipped without looking at the context: whitespace, punctuation, member
+# accesses, identifiers other than import/export/require, strings and comments
+SKIP = r'''(?:
+      [^'"`/\w$.%s]+
+    | \.[\w$]*
+    | (?!(?:import|export|require)(?![\w$]))[\w$]+
+    | '[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*'?
+    | "[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"?
+    | //[^\n]*
+    | /\*[^*]*\*+(?:[^/*][^*]*\*+)*/
+)*'''
+
+regex_skip = re.compile(SKIP % '', re.VERBOSE)
+# inside a ${...} template expression, braces need to be counted as well
+regex_skip_braces = re.compile(SKIP % '{}', re.VERBOSE)
+regex_keyword = re.compile(r'import|export|require')
+
+# the literal part of a template, up to its end or the next ${
+regex_template_chars = re.compile(r'[^`\\$]*(?:(?:\\[\s\S]|\$(?!\{))[^`\\$]*)*')
+regex_regex_literal = re.compile(r'/(?![*/])(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.){0,%d}\]){1,%d}/[a-zA-Z]*' % (max_lexeme, max_lexeme))
+
+# whitespace and comments between the parts of an import statement
+GAP = r'(?:\s|//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/)*'
+MODULE = r'''(?:'([^'\\\n]*)'|"([^"\\\n]*)"|`([^`\\$]*)`)'''
+# everything between 'import' and 'from': default/namespace/named bindings, 'type', commas
+IMPORT_CLAUSE = r'(?:[\w$*,]|\{[^{}\'"`]{0,%d}\}|\s|//[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/){0,%d}?' % (max_lexeme, max_lexeme)
+
+regex_js_static_import = re.compile(r'import(?:%s(?<=[\s/}*])|(?=[{*]))%s(?<=[\s}*/])from%s%s' % (GAP, IMPORT_CLAUSE, GAP, MODULE))
+regex_js_bare_import = re.compile(r'import%s%s' % (GAP, MODULE))
+regex_js_dynamic_import = re.compile(r'import%s\(%s%s' % (GAP, GAP, MODULE))
+regex_js_export_from = re.compile(r'export%s(?:type%s)?(?:\*(?:%sas%s[\w$]+)?|\{[^{}\'"`]{0,%d}\})%sfrom%s%s'
+                                  % (GAP, GAP, GAP, GAP, max_lexeme, GAP, GAP, MODULE))
+regex_js_require_call = re.compile(r'require%s\(%s%s' % (GAP, GAP, MODULE))
+
+# after these, a '/' starts a regex literal rather than a division
+regex_keyword_before = re.compile(r'(?<![\w$.])(?:return|typeof|instanceof|in|of|new|delete|void|throw|case|do|else|yield|await)$')
+
+
+def module_name(m):
+    return m.group(1) if m.group(1) is not None else m.group(2) if m.group(2) is not None else m.group(3)
+
+
+#a '/' is a regex literal, unless it follows something that ends an expression
+def starts_regex_literal(text, pos):
+    i = pos - 1
+    while i >= 0 and text[i].isspace():
+        i -= 1
+    if i < 0:
+        return True
+    prevchar = text[i]
+    if prevchar in ')]}\'"`':
+        return False
+    if prevchar.isalnum() or prevchar in '_$':
+        return regex_keyword_before.search(text, max(0, i - 9), i + 1) is not None
+    return True
+
+
+def match_import(text, pos, keyword):
+    if keyword == 'require':
+        return regex_js_require_call.match(text, pos)
+    if keyword == 'export':
+        return regex_js_export_from.match(text, pos)
+    return regex_js_dynamic_import.match(text, pos) or regex_js_bare_import.match(text, pos) \
+        or regex_js_static_import.match(text, pos)
+
+
+def scan_js_imports(text, max_seconds=None):
+    if len(text) > max_file_size:
+        return []
+    deadline = time.perf_counter() + (max_file_seconds if max_seconds is None else max_seconds)
+
+    imports = []
+    # one open-brace counter per ${ expression we are in
+    templates = []
+    pos = 0
+    end = len(text)
+    ntokens = 0
+    while True:
+        pos = (regex_skip_braces if templates else regex_skip).match(text, pos).end()
+        if pos >= end:
+            break
+        token = text[pos]
+
+        ntokens += 1
+        if ntokens % 4096 == 0 and time.perf_counter() > deadline:
+            scan_stats['cut_off'] += 1
+            break
+
+        if token == '`':
+            pos = scan_template(text, pos + 1, templates)
+        elif token == '{':
+            templates[-1] += 1
+            pos += 1
+        elif token == '}':
+            if templates[-1] > 0:
+                templates[-1] -= 1
+                pos += 1
+            else:
+                templates.pop()
+                pos = scan_template(text, pos + 1, templates)
+        elif token == '/':
+            if text.startswith('/*', pos):
+                #unterminated block comment
+                break
+            lexeme = starts_regex_literal(text, pos) and regex_regex_literal.match(text, pos)
+            pos = lexeme.end() if lexeme else pos + 1
+        else:
+            keyword = regex_keyword.match(text, pos).group(0)
+            statement = match_import(text, pos, keyword)
+            if statement:
+                imports.append(module_name(statement))
+                pos = statement.end()
+            else:
+                pos += len(keyword)
+
+    return imports
+
+
+#continues a template literal after its opening backtick or the } closing a ${ expression
+def scan_template(text, pos, templates):
+    pos = regex_template_chars.match(text, pos).end()
+    if text.startswith('${', pos):
+        templates.append(0)
+        return pos + 2
+    return pos + 1
+
+
+if __name__ == '__main__':
+    for fname in sys.argv[1:]:
+        with open(fname, 'r', errors='ignore') as fd:
+            print(fname, scan_js_imports(fd.read()))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Import-only scanner for Python sources. It yields the same 'module:name' imports as compiling the
+# module and walking the IMPORT_NAME/IMPORT_FROM/IMPORT_STAR opcodes of its top-level code object
+# (i.e. only module-level imports, not the ones inside function or class bodies), but without
+# compiling anything, so it is a lot faster and also works on files with syntax errors (e.g. Python 2).
+#
+# The scanner never looks at individual tokens: a single regex skips over all 'boring' source
+# (code, strings, comments, line continuations) in one go, and only stops at the start of lines
+# that may begin an import statement or a def/class body.
+
+import re
+import sys
+
+
+# whitespace within a statement, including backslash continuations
+WS = r'(?:[ \t\f]|\\\r?\n)'
+DOTTED = r'\w+(?:%s*\.%s*\w+)*' % (WS, WS)
+ALIASED = r'%s(?:%s+as%s+\w+)?' % (DOTTED, WS, WS)
+
+# everything up to the next interesting line start; strings (incl. unterminated ones) and comments
+# are consumed as a whole so that their content can never be mistaken for an import statement
+SKIP = r'''(?:
+      [^'"#\\\n]+
+    | \\[\s\S]
+    | '\'\'[^'\\]*(?:(?:\\[\s\S]|'(?!''))[^'\\]*)*(?:'\'\'|\Z)
+    | """[^"\\]*(?:(?:\\[\s\S]|"(?!""))[^"\\]*)*(?:"""|\Z)
+    | '[^'\\\n]*(?:\\[\s\S][^'\\\n]*)*'?
+    | "[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"?
+    | \#[^\n]*
+    | \n(?!%s)
+)*'''
+
+# module level: stop at (possibly compound) import statements and at blocks the compiler never
+# emits module-level imports for (function and class bodies, 'if 0:'/'if False:')
+MODULE_STOP = r'''([ \t]*)(?:
+      (?:(?:try|else|finally|(?:el)?if\b[^:\n]*|except\b[^:\n]*)[ \t]*:[ \t]*)?(?=(?:import|from)\b)
+    | (?=(?:async[ \t]+)?(?:def|class)\b|if[ \t]+(?:0|False)[ \t]*:)
+)'''
+
+# inside a skipped block with header indentation <= %d: stop at the first code line that is not
+# indented deeper (continuation lines starting with a closing bracket do not count)
+BLOCK_STOP = r'[ \t]{0,%d}[^ \t\r\n\f#)\]}]'
+
+regex_module_skip = re.compile(SKIP % MODULE_STOP, re.VERBOSE)
+regex_module_stop = re.compile(MODULE_STOP, re.VERBOSE)
+regex_import = re.compile(r'import%s+(%s(?:%s*,%s*%s)*)' % (WS, ALIASED, WS, WS, ALIASED))
+regex_from_import = re.compile(r'from\b%s*\.*%s*(%s)?%s*\bimport\b%s*(\*|\([^)]*\)?|%s(?:%s*,%s*%s)*)'
+                               % (WS, WS, DOTTED, WS, WS, ALIASED, WS, WS, ALIASED))
+regex_next_statement = re.compile(r'%s*;%s*' % (WS, WS))
+regex_ws = re.compile(WS)
+regex_comment = re.compile(r'#[^\n]*')
+
+block_skip_regexes = {}
+
+def block_skip_regex(indent):
+    if indent not in block_skip_regexes:
+        block_skip_regexes[indent] = re.compile(SKIP % (BLOCK_STOP % indent), re.VERBOSE)
+    return block_skip_regexes[indent]
+
+
+def parse_names(namelist):
+    names = []
+    for item in regex_comment.sub('', namelist).strip('()').split(','):
+        parts = regex_ws.sub(' ', item).split()
+        if len(parts) > 0:
+            names.append(("".join(parts[:-2]) if len(parts) > 2 and parts[-2] == 'as' else "".join(parts),
+                          len(parts) > 2 and parts[-2] == 'as'))
+    return names
+
+
+#mirrors the opcodes: 'import a.b as c' is IMPORT_NAME a.b + IMPORT_FROM b
+def import_statement_names(text, pos):
+    m = regex_import.match(text, pos)
+    if m:
+        imports = []
+        for name, aliased in parse_names(m.group(1)):
+            parts = name.split('.')
+            if aliased and len(parts) > 1:
+                imports.extend(name+':'+part for part in parts[1:])
+            else:
+                imports.append(name)
+        return imports, m.end()
+
+    m = regex_from_import.match(text, pos)
+    if m:
+        module = regex_ws.sub('', m.group(1) or '')
+        if m.group(2) == '*':
+            return [module+':*'], m.end()
+        return [module+':'+name for name, _ in parse_names(m.group(2))], m.end()
+
+    return [], pos
+
+
+def scan_python_imports(text):
+    #make sure every line, including the first one, starts after a newline
+    text = '\n' + text
+    end = len(text)
+    imports = []
+
+    pos = regex_module_skip.match(text).end()
+    while pos < end:
+        m = regex_module_stop.match(text, pos+1)
+        indent = len(m.group(1))
+        pos = m.end()
+
+        if text.startswith(('import', 'from'), pos):
+            newimports, pos = import_statement_names(text, pos)
+            imports.extend(newimports)
+            while newimports:
+                m = regex_next_statement.match(text, pos)
+                if not m:
+                    break
+                newimports, pos = import_statement_names(text, m.end())
+                imports.extend(newimports)
+        else:
+            #def, class or dead 'if': skip its body
+            pos = block_skip_regex(indent).match(text, pos).end()
+            #the first line that is not part of the body may itself be an import statement
+            if pos < end and regex_module_stop.match(text, pos+1):
+                continue
+
+        pos = regex_module_skip.match(text, pos).end()
+
+    return imports
+
+
+if __name__ == '__main__':
+    for fname in sys.argv[1:]:
+        with open(fname, 'r', errors='ignore') as fd:
+            print(fname, scan_python_imports(fd.read()))
@@ -18,7 +18,7 @@ command -v $PYTHON >/dev/null 2>&1 || { echo >&2 "Cannot find $PYTHON. Aborting.
 command -v $PIP >/dev/null 2>&1 || { echo >&2 "Cannot find $PIP. Aborting." ; exit 1; }
 
 
-$SUDO $PIP install pygithub tqdm pandas dis
+$SUDO $PIP install pygithub tqdm pandas numpy dis
 echo
 
 [ -f apikey.txt ] || { echo >&2 "Please provide your GitHub API key in file apikey.txt. Aborting. " ; exit 1; }
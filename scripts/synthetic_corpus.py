@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Deterministic generator of synthetic GitHub projects for the six languages of extract_imports.py,
+# written as tarballs into datasetNN folders the way crawl.sh downloads them, for offline benchmarks
+# (see bench_suite.py). Every project works in one or two 'domains' of libraries that are imported
+# together, and draws the imports of its files Zipf-distributed from those, and from the popular
+# libraries of its language (standard library, frameworks). Besides regular sources:
+#
+#   forks      copies of an earlier project with one edited file (the duplicates of the filter stage)
+#   minified   JavaScript projects that ship a minified bundle on a single line
+#   generated  a huge generated source file (imports in the header, then a long body)
+#   invalid    files that are no valid source: truncated code, or binary garbage
+#
+# The same seed and options always give byte-identical tarballs.
+#
+# Usage: ./synthetic_corpus.py <basedir> <language> [--projects N] [--per-dataset N] [--seed N] ...
+
+import argparse
+import gzip
+import io
+import os
+import random
+import tarfile
+
+
+parser = argparse.ArgumentParser(description='Generate a synthetic dataset folder of project tarballs.')
+parser.add_argument('basedir')
+parser.add_argument('language', choices=['python', 'javascript', 'java', 'csharp', 'php', 'ruby'])
+parser.add_argument('--projects', type=int, default=1000)
+parser.add_argument('--per-dataset', type=int, default=1000, help='projects per dataset folder')
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--forks', type=float, default=0.15, help='fraction of forked projects')
+parser.add_argument('--minified', type=float, default=0.05, help='fraction of JavaScript projects with a minified bundle')
+parser.add_argument('--generated', type=float, default=0.01, help='fraction of projects with a huge generated file')
+parser.add_argument('--generated-kb', type=int, default=512, help='size of a generated file')
+parser.add_argument('--invalid', type=float, default=0.005, help='fraction of invalid source files')
+
+# libraries per language, by decreasing popularity
+vocabsize = 5000
+# domains of libraries imported together
+ndomains = 300
+# fraction of the imports of a file from the popular libraries
+popular_ratio = 0.35
+
+extensions = {'python': '.py', 'javascript': '.js', 'java': '.java', 'csharp': '.cs', 'php': '.php', 'ruby': '.rb'}
+
+
+#import name of the library of a popularity rank (with a submodule, class, or relative file)
+def import_name(language, rank, rnd):
+    sub, item = rnd.randrange(8), rnd.randrange(20)
+    if language == 'python':
+        return rnd.choice(['lib%d' % rank, 'lib%d.sub%d' % (rank, sub), 'lib%d.sub%d.Item%d' % (rank, sub, item)])
+    if language == 'javascript':
+        return rnd.choice(['pkg%d' % rank, 'pkg%d/lib/sub%d' % (rank, sub), '@scope%d/pkg%d' % (rank % 97, rank),
+                           './util%d' % item if rnd.random() < 0.3 else 'pkg%d' % rank])
+    if language == 'java':
+        return 'org.lib%d.sub%d.Class%d' % (rank, sub, item)
+    if language == 'csharp':
+        return 'Lib%d.Sub%d' % (rank, sub)
+    if language == 'php':
+        return 'Vendor%d\\Pkg%d\\Class%d' % (rank, sub, item)
+    return rnd.choice(['gem%d' % rank, 'gem%d/sub%d' % (rank, sub)])
+
+
+#popularity ranks of the imports of a file: Zipf around the project's domains, or of the popular libraries
+def draw_ranks(rnd, domains, count):
+    ranks = []
+    for _ in range(count):
+        if rnd.random() < popular_ratio:
+            ranks.append(int(rnd.paretovariate(1.2)) - 1)
+        else:
+            ranks.append(domains[rnd.randrange(len(domains))] * 7919 + int(rnd.paretovariate(1.0)))
+    return [rank % vocabsize for rank in ranks]
+
+
+def python_source(rnd, imports, bodylines):
+    lines = ['#!/usr/bin/env python', '"""Generated module: import os is mentioned in this docstring."""', '']
+    for i, name in enumerate(imports):
+        parts = name.split('.')
+        if len(parts) > 1 and rnd.random() < 0.4:
+            lines.append('from %s import %s' % ('.'.join(parts[:-1]), parts[-1]))
+        elif rnd.random() < 0.1:
+            lines.append('import %s as alias%d' % (name, i))
+        else:
+            lines.append('import %s' % name)
+    lines.append('')
+    for i in range(bodylines):
+        lines.append('CONSTANT_%d = {"key": %d, "text": "import nothing; from here import none"}' % (i, i))
+        if i % 50 == 49:
+            lines.append('def function_%d(x):\n    import json\n    return json.dumps(x) + "%d"\n' % (i, i))
+    return '\n'.join(lines) + '\n'
+
+
+def javascript_source(rnd, imports, bodylines, minified=False):
+    sp, nl = ('', '') if minified else (' ', '\n')
+    parts = []
+    for i, name in enumerate(imports):
+        kind = rnd.random()
+        if kind < 0.4:
+            parts.append('var m%d%s=%srequire("%s");%s' % (i, sp, sp, name, nl))
+        elif kind < 0.8:
+            parts.append('import{a%d,b%d as c%d}from"%s";' % (i, i, i, name) if minified else
+                         'import {\n  a%d,\n  b%d as c%d,\n} from \'%s\';\n' % (i, i, i, name))
+        else:
+            parts.append('import d%d from "%s";%s' % (i, name, nl))
+    for i in range(bodylines):
+        parts.append('function f%d(n,e){if(n>e){return n.import||"require(x)"}return n*e/%d}%s' % (i, i + 1, nl))
+        if minified and i % 20 == 0:
+            #a bundle inlines the imports of its modules
+            parts.append('var r%d=require("%s");' % (i, imports[i % len(imports)]))
+    return ''.join(parts)
+
+
+def java_source(rnd, imports, bodylines):
+    parts = ['/* Copyright notice\n * import fake.Comment;\n */\npackage com.example.p%d;\n\n' % rnd.randrange(100)]
+    parts.extend('import %s;\n' % name for name in imports)
+    parts.append('\npublic class Gen%d {\n' % rnd.randrange(1000))
+    for i in range(bodylines):
+        parts.append('    private static final String F%d = "value: import x.y; class";\n' % i)
+        parts.append('    public int m%d(int x) { return x * %d; }\n' % (i, i))
+    parts.append('}\n')
+    return ''.join(parts)
+
+
+def csharp_source(rnd, imports, bodylines):
+    parts = ['// <auto-generated> class </auto-generated>\n']
+    parts.extend('using %s;\n' % name for name in imports)
+    parts.append('\nnamespace Example.N%d\n{\n    public partial class Gen%d\n    {\n' % (rnd.randrange(100), rnd.randrange(1000)))
+    for i in range(bodylines):
+        parts.append('        public string P%d { get; set; } = "using Fake; class";\n' % i)
+        parts.append('        public int M%d(int x) { return x * %d; }\n' % (i, i))
+    parts.append('    }\n}\n')
+    return ''.join(parts)
+
+
+def php_source(rnd, imports, bodylines):
+    parts = ['<?php\n/** Generated class: use Foo; */\nnamespace App\\Models%d;\n\n' % rnd.randrange(100)]
+    parts.extend('use %s;\n' % name for name in imports)
+    parts.append('\nclass Gen%d extends Model\n{\n' % rnd.randrange(1000))
+    for i in range(bodylines):
+        parts.append('    protected $f%d = \'value ; class\';\n' % i)
+        parts.append('    public function m%d($x) { return $x * %d; }\n' % (i, i))
+    parts.append('}\n')
+    return ''.join(parts)
+
+
+def ruby_source(rnd, imports, bodylines):
+    lines = ['# frozen_string_literal: true']
+    lines.extend("require '%s'" % name for name in imports)
+    if rnd.random() < 0.3:
+        lines.append("require_relative 'lib/helper%d'" % rnd.randrange(10))
+    lines.append('\nclass Gen%d' % rnd.randrange(1000))
+    for i in range(bodylines):
+        lines.append('  def m%d(x)\n    x * %d # require "nothing"\n  end' % (i, i))
+    lines.append('end')
+    return '\n'.join(lines) + '\n'
+
+
+renderers = {'python': python_source, 'javascript': javascript_source, 'java': java_source,
+             'csharp': csharp_source, 'php': php_source, 'ruby': ruby_source}
+
+
+def source_file(language, rnd, domains, bodylines):
+    imports = [import_name(language, rank, rnd) for rank in draw_ranks(rnd, domains, rnd.randint(1, 15))]
+    return renderers[language](rnd, imports, bodylines)
+
+
+#an invalid source: a truncated file, or binary garbage
+def invalid_file(rnd, text):
+    if rnd.random() < 0.5:
+        return text[:rnd.randrange(1, max(2, len(text)))]
+    return bytes(rnd.randrange(256) for _ in range(rnd.randint(100, 5000)))
+
+
+#{path: text (or bytes)} of a project; kinds: what the project includes
+def project_files(language, rnd, kinds, options):
+    domains = [rnd.randrange(ndomains) for _ in range(rnd.choice([1, 1, 2]))]
+    files = {}
+    for i in range(min(200, int(rnd.lognormvariate(2, 0.8)) + 1)):
+        folder = rnd.choice(['src', 'lib', 'src/core', 'app', 'test'])
+        ext = '.ts' if language == 'javascript' and rnd.random() < 0.2 else extensions[language]
+        files['%s/module%d%s' % (folder, i, ext)] = source_file(language, rnd, domains, rnd.randint(5, 80))
+    if 'minified' in kinds:
+        files['dist/bundle.min.js'] = javascript_source(rnd, [import_name(language, rank, rnd) for rank in draw_ranks(rnd, domains, 200)],
+                                                         rnd.randint(2000, 8000), minified=True)
+    if 'generated' in kinds:
+        #about 100 bytes per body line
+        files['generated/Generated%s' % extensions[language]] = source_file(language, rnd, domains, options['generated_kb'] * 1024 // 100)
+    for path in list(files):
+        if rnd.random() < options['invalid']:
+            files[path] = invalid_file(rnd, files[path])
+    return files
+
+
+#generator of (project, {path: text or bytes}, kind)
+def generate_projects(language, nprojects, seed=42, forks=0.15, minified=0.05, generated=0.01, generated_kb=512, invalid=0.005):
+    rnd = random.Random('%s:%d' % (language, seed))
+    options = {'generated_kb': generated_kb, 'invalid': invalid}
+    projects = []
+    for i in range(nprojects):
+        project = 'user%d/%s-project%d' % (rnd.randrange(1000), language, i)
+        if projects and rnd.random() < forks:
+            files = dict(rnd.choice(projects))
+            path = rnd.choice(sorted(files))
+            files[path] = source_file(language, rnd, [rnd.randrange(ndomains)], rnd.randint(5, 80))
+            kind = 'fork'
+        else:
+            kinds = [kind for kind, fraction in [('minified', minified if language == 'javascript' else 0), ('generated', generated)]
+                     if rnd.random() < fraction]
+            files = project_files(language, rnd, kinds, options)
+            kind = '+'.join(kinds) or 'regular'
+            #forks are only made of small projects
+            if not kinds:
+                projects.append(files)
+        yield project, files, kind
+
+
+#a GitHub-like tarball (a <project>-master root folder), with constant timestamps
+def write_tarball(filename, project, files):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'wb') as fd, gzip.GzipFile('', 'wb', fileobj=fd, mtime=0) as gz, tarfile.open(fileobj=gz, mode='w') as tar:
+        for name, text in sorted(files.items()):
+            data = text.encode('utf-8') if isinstance(text, str) else text
+            info = tarfile.TarInfo('%s-master/%s' % (project.split('/')[-1], name))
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+#writes <basedir>/datasetNN/<owner>/<project>.tgz; returns the corpus statistics
+def write_corpus(basedir, language, nprojects, per_dataset=1000, seed=42, **options):
+    stats = {'projects': 0, 'files': 0, 'bytes': 0}
+    for i, (project, files, kind) in enumerate(generate_projects(language, nprojects, seed, **options)):
+        write_tarball('%s/dataset%02d/%s.tgz' % (basedir, 1 + i // per_dataset, project), project, files)
+        stats['projects'] += 1
+        stats['files'] += len(files)
+        stats['bytes'] += sum(len(text) for text in files.values())
+        stats[kind] = stats.get(kind, 0) + 1
+    return stats
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    stats = write_corpus(args.basedir, args.language, args.projects, args.per_dataset, args.seed, forks=args.forks,
+                         minified=args.minified, generated=args.generated, generated_kb=args.generated_kb, invalid=args.invalid)
+    print("%(projects)d projects, %(files)d files, %(bytes)d bytes:" % stats,
+          {kind: count for kind, count in stats.items() if kind not in ('projects', 'files', 'bytes')})
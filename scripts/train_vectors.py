@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Trains the library vectors of the Training notebook from the processed import dataset, and
+# exports them to <basedir>/models as w2v_dim<dim>.txt.gz, vectorsHD_dim<dim>.json.gz,
+# (reversed_)lib_dict_dim<dim>.json and a vectors_dim<dim> vector store (see vector_store.py).
+# Two engines train the same model, i.e. the sigmoid of a scaled cosine similarity between a
+# target and a context library vector:
+#
+#   keras    the notebook's Keras model (needs keras/tensorflow), trained with rmsprop
+#   hogwild  plain numpy SGD in --jobs worker processes, which update embedding arrays in shared
+#            memory without any locking (Hogwild): as every mini-batch only touches a few rows,
+#            conflicting updates are rare and harmless
+#
+# Usage: ./train_vectors.py <language> [<basedir>] [--engine hogwild|keras] [--jobs N] [--epochs N] ...
+
+import argparse
+import ctypes
+import glob
+import gzip
+import json
+import multiprocessing
+import os
+import string
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from cooccurrence import CooccurrenceIndex
+from import_columns import ImportColumns, columns_dir
+from import_dataset import iter_projects
+from randomgrams import RandomgramGenerator, make_sampling_table, to_csr
+from vector_store import vector_store_dir, write_vector_store
+
+
+#same defaults as the notebook
+config = {
+        'true_negative_sampling':   True,
+        'negative_sampling_ratio':  1,
+        'reduce_dict_size':         True,
+        'min_import_freq':          2,
+        'max_import_freq':          1000000,
+        'min_imports':              2,
+        'window_size':              1000,
+        'vector_dim':               100,
+        'epochs':                   100,
+        'batch_size':               2**15,
+        'sampling_factor':          1e-4,
+        'engine':                   'hogwild',
+        'jobs':                     os.cpu_count(),
+        'learning_rate':            0.025,
+        'minibatch_size':           256,
+        'seed':                     0,
+}
+
+parser = argparse.ArgumentParser(description='Train library vectors from a processed import dataset.')
+parser.add_argument('language')
+parser.add_argument('basedir', nargs='?', help='dataset folder (default = ../datasets/<language>)')
+parser.add_argument('--engine', choices=['hogwild', 'keras'], default=config['engine'])
+parser.add_argument('--jobs', type=int, default=config['jobs'], help='hogwild worker processes (default = #cpus)')
+parser.add_argument('--epochs', type=int, default=config['epochs'])
+parser.add_argument('--dim', type=int, default=config['vector_dim'], help='vector dimension')
+parser.add_argument('--window-size', type=int, default=config['window_size'])
+parser.add_argument('--negative-ratio', type=float, default=config['negative_sampling_ratio'])
+parser.add_argument('--no-true-negative-sampling', action='store_true')
+parser.add_argument('--learning-rate', type=float, default=config['learning_rate'], help='hogwild initial learning rate')
+parser.add_argument('--seed', type=int, default=config['seed'])
+
+
+###################
+
+# for javascript (NPM)
+accepted_first_chars = string.ascii_letters + string.digits + '@'
+
+def to_lib(imp):      # converts imp to library part (i.e. ignore everything after .)
+    return imp.split('.')[0].split(':')[0]
+
+def to_package(imp):  # converts imp to package
+    return '.'.join(imp.split('.')[:-1])
+
+
+#(mapping, is_valid) of the notebook for a language
+def language_mapping(language):
+    if language == 'python':
+        return to_lib, lambda x: True
+    if language == 'java':
+        return to_package, lambda x: True
+    if language == 'javascript':
+        return (lambda x: x), (lambda x: x[0] in accepted_first_chars)
+    raise ValueError('Unsupported language: ' + language)
+
+
+#generator of (project, fileimports), from the columnar dataset if there is one
+def load_projects(basedir):
+    if os.path.isfile(columns_dir(basedir)+'/meta.json'):
+        columns = ImportColumns(columns_dir(basedir))
+        importnames = columns.imports.tolist()
+        for p in range(len(columns)):
+            yield columns.projects[p], {columns.files[f]: [importnames[i] for i in columns.file_imports(f)]
+                                        for f in columns.project_file_range(p)}
+    else:
+        for filename in sorted(glob.glob(basedir+'/processed/*.json.gz')):
+            yield from iter_projects(filename)
+
+
+#maps the ids of a CSR matrix, and drops those mapped to -1
+def filter_csr(ids, offsets, remap):
+    newids = remap[ids]
+    keep = newids >= 0
+    rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    counts = np.bincount(rows[keep], minlength=len(offsets) - 1)
+    return newids[keep].astype(np.int32), np.concatenate([[0], np.cumsum(counts)])
+
+
+#CSR matrix of the given rows
+def select_rows(ids, offsets, rows):
+    lengths = np.diff(offsets)[rows]
+    newoffsets = np.concatenate([[0], np.cumsum(lengths)])
+    positions = np.repeat(offsets[rows] - newoffsets[:-1], lengths) + np.arange(newoffsets[-1])
+    return ids[positions], newoffsets
+
+
+#returns (lib_dict, file sequences, project sequences), the sequences as CSR arrays of lib indices
+def build_corpus(projects, language, config):
+    mapping, is_valid = language_mapping(language)
+    libids = {}
+    filelibs = []
+    projectlibs = []
+    for project, files in tqdm(projects):
+        projectset = set()
+        for fname, imps in files.items():
+            fileset = set(mapping(imp) for imp in imps if is_valid(imp))
+            fileset.discard('')
+            projectset.update(fileset)
+            if fileset:
+                filelibs.append([libids.setdefault(lib, len(libids)) for lib in fileset])
+        if projectset:
+            projectlibs.append([libids.setdefault(lib, len(libids)) for lib in projectset])
+    libnames = sorted(libids, key=libids.get)
+
+    #frequency = number of projects importing a library
+    projectids, projectoffsets = to_csr(projectlibs)
+    freqs = np.bincount(projectids, minlength=len(libnames))
+    keep = np.ones(len(libnames), dtype=bool)
+    if config['reduce_dict_size']:
+        keep = (freqs >= config['min_import_freq']) & (freqs <= config['max_import_freq'])
+    remap = np.full(len(libnames), -1, dtype=np.int64)
+    remap[keep] = np.arange(np.count_nonzero(keep))
+    lib_dict = {libnames[i]: {"index": int(remap[i]), "freq": int(freqs[i])} for i in np.nonzero(keep)[0]}
+
+    fileids, fileoffsets = filter_csr(*to_csr(filelibs), remap)
+    fileids, fileoffsets = select_rows(fileids, fileoffsets, np.nonzero(np.diff(fileoffsets) > 0)[0])
+    projectids, projectoffsets = filter_csr(projectids, projectoffsets, remap)
+    projectids, projectoffsets = select_rows(projectids, projectoffsets, np.nonzero(np.diff(projectoffsets) > config['min_imports'])[0])
+    return lib_dict, (fileids, fileoffsets), (projectids, projectoffsets)
+
+
+###################
+
+
+def train_keras(pairs, vocab_size, config):
+    from keras.models import Model
+    from keras.layers import Input, Dense, Reshape, Embedding, dot
+
+    input_target = Input((1,))
+    input_context = Input((1,))
+
+    embedding = Embedding(vocab_size, config['vector_dim'], name='embedding')
+    target = Reshape((config['vector_dim'], 1))(embedding(input_target))
+    context = Reshape((config['vector_dim'], 1))(embedding(input_context))
+
+    dot_product = Reshape((1,))(dot([target, context], 1, normalize=True))
+    output = Dense(1, activation='sigmoid', use_bias=True)(dot_product)
+
+    model = Model(inputs=[input_target, input_context], outputs=output)
+    model.compile(loss='binary_crossentropy', optimizer='rmsprop')
+
+    #(batch, 1) shaped inputs, as declared
+    batches = (((t[:, None], c[:, None]), l) for (t, c), l in pairs.keras_batches())
+    fit = getattr(model, 'fit_generator', model.fit)
+    fit(batches, steps_per_epoch=pairs.steps_per_epoch(), verbose=2, epochs=config['epochs'])
+    return embedding.get_weights()[0]
+
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+#rows[indices] += updates, summing the updates of repeated indices (faster than np.add.at)
+def scatter_add(rows, indices, updates):
+    order = np.argsort(indices, kind='stable')
+    indices = indices[order]
+    starts = np.concatenate([[0], np.nonzero(indices[1:] != indices[:-1])[0] + 1])
+    rows[indices[starts]] += np.add.reduceat(updates[order], starts, axis=0)
+
+
+#one SGD step on a mini-batch; returns its summed log loss
+#model: p = sigmoid(w * cos(E[t], E[c]) + b)
+def sgd_step(embeddings, dense, targets, contexts, labels, lr):
+    u = embeddings[targets]
+    v = embeddings[contexts]
+    nu = np.sqrt((u * u).sum(axis=1)) + 1e-8
+    nv = np.sqrt((v * v).sum(axis=1)) + 1e-8
+    s = (u * v).sum(axis=1) / (nu * nv)
+    w, b = float(dense[0]), float(dense[1])
+    p = sigmoid(w * s + b)
+    g = p - labels
+    gs = (g * w)[:, None]
+
+    du = gs * (v / (nu * nv)[:, None] - (s / (nu * nu))[:, None] * u)
+    dv = gs * (u / (nu * nv)[:, None] - (s / (nv * nv))[:, None] * v)
+    scatter_add(embeddings, np.concatenate([targets, contexts]), np.concatenate([du, dv]) * -lr)
+    dense[0] -= lr * (g * s).mean()
+    dense[1] -= lr * g.mean()
+    return -(labels * np.log(p + 1e-7) + (1 - labels) * np.log(1 - p + 1e-7)).sum()
+
+
+#shared state of the hogwild workers, inherited through fork
+_shared = {}
+
+def hogwild_worker(w):
+    pairs, config, jobs = _shared['pairs'], _shared['config'], _shared['jobs']
+    embeddings = np.frombuffer(_shared['embeddings'], dtype=np.float32).reshape(-1, config['vector_dim'])
+    dense = np.frombuffer(_shared['dense'], dtype=np.float64)
+    progress = np.frombuffer(_shared['progress'], dtype=np.float64).reshape(jobs, 2)
+
+    total = max(1.0, pairs.epoch_pairs() * config['epochs'] / jobs)
+    done = 0
+    mb = config['minibatch_size']
+    for epoch in range(config['epochs']):
+        rng = pairs.rng(epoch, w + 1)
+        chunkorder = pairs.rng(epoch).permutation(len(pairs.chunks))
+        for c in chunkorder[w::jobs]:
+            chunk = pairs.chunk_pairs(*pairs.chunks[c], rng)
+            if chunk is None:
+                continue
+            targets, contexts, labels = chunk
+            loss = 0.0
+            for start in range(0, len(targets), mb):
+                lr = config['learning_rate'] * max(1e-4, 1.0 - done / total)
+                loss += sgd_step(embeddings, dense, targets[start:start+mb], contexts[start:start+mb],
+                                 labels[start:start+mb], lr)
+                done += min(mb, len(targets) - start)
+            progress[w] += (len(targets), loss)
+
+
+def train_hogwild(pairs, vocab_size, config, jobs):
+    dim = config['vector_dim']
+    embeddings = multiprocessing.RawArray(ctypes.c_float, vocab_size * dim)
+    rng = np.random.RandomState(config['seed'])
+    np.frombuffer(embeddings, dtype=np.float32)[:] = rng.uniform(-0.05, 0.05, vocab_size * dim)
+    dense = multiprocessing.RawArray(ctypes.c_double, [1.0, 0.0])
+    progress = multiprocessing.RawArray(ctypes.c_double, jobs * 2)
+    _shared.update(pairs=pairs, config=config, jobs=jobs, embeddings=embeddings, dense=dense, progress=progress)
+
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=hogwild_worker, args=(w,), daemon=True) for w in range(jobs)]
+    t0 = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    status = np.frombuffer(progress, dtype=np.float64).reshape(jobs, 2)
+    total = pairs.epoch_pairs() * config['epochs']
+    with tqdm(total=total, unit='pairs', unit_scale=True) as pbar:
+        while any(proc.is_alive() for proc in procs):
+            time.sleep(0.5)
+            npairs, loss = status.sum(axis=0)
+            pbar.update(int(npairs) - pbar.n)
+            pbar.set_postfix(loss='%.4f' % (loss / max(1.0, npairs)))
+    for proc in procs:
+        proc.join()
+    if any(proc.exitcode != 0 for proc in procs):
+        raise RuntimeError("Hogwild worker failed")
+    npairs, loss = status.sum(axis=0)
+    print("%d pairs in %.1fs, mean loss %.4f" % (npairs, time.perf_counter() - t0, loss / max(1.0, npairs)))
+    return np.frombuffer(embeddings, dtype=np.float32).reshape(vocab_size, dim).copy()
+
+
+def train(lib_dict, filesequences, projectsequences, config, engine='hogwild', jobs=1):
+    vocab_size = len(lib_dict)
+    cooccurrence = None
+    if config['true_negative_sampling']:
+        cooccurrence = CooccurrenceIndex.build_csr(*projectsequences, vocab_size=vocab_size)
+        print(len(cooccurrence), "co-occurring library pairs")
+    sampling_table = make_sampling_table(lib_dict, config['sampling_factor'])
+    pairs = RandomgramGenerator(filesequences, vocab_size, sampling_table, window_size=config['window_size'],
+                                negative_ratio=config['negative_sampling_ratio'], cooccurrence=cooccurrence,
+                                batch_size=config['batch_size'], seed=config['seed'])
+    print(pairs.epoch_pairs(), "pairs per epoch")
+    if engine == 'keras':
+        return train_keras(pairs, vocab_size, config)
+    return train_hogwild(pairs, vocab_size, config, jobs)
+
+
+###################
+
+
+def write_models(modeldir, lib_dict, vectors, dim, language=None):
+    os.makedirs(modeldir, exist_ok=True)
+    names = list(lib_dict)
+    with open(modeldir+'/lib_dict_dim{}.json'.format(dim), 'w', encoding='utf-8') as out:
+        json.dump(lib_dict, out)
+    with open(modeldir+'/reversed_lib_dict_dim{}.json'.format(dim), 'w', encoding='utf-8') as out:
+        json.dump({v["index"]: k for k, v in lib_dict.items()}, out)
+
+    with gzip.open(modeldir+'/vectorsHD_dim{}.json.gz'.format(dim), 'wt') as out:
+        json.dump({name: vectors[i].tolist() for i, name in enumerate(names)}, out)
+
+    with gzip.open(modeldir+'/w2v_dim{}.txt.gz'.format(dim), 'wt') as out:
+        out.write('{} {}\n'.format(vectors.shape[0], vectors.shape[1]))
+        for i, name in enumerate(names):
+            out.write('{} {}\n'.format(name, ' '.join(str(x) for x in vectors[i].tolist())))
+
+    write_vector_store(vector_store_dir(modeldir, dim), names, vectors, language)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    basedir = args.basedir or '../datasets/' + args.language
+    config.update(engine=args.engine, epochs=args.epochs, vector_dim=args.dim, window_size=args.window_size,
+                  negative_sampling_ratio=args.negative_ratio, learning_rate=args.learning_rate, seed=args.seed,
+                  true_negative_sampling=not args.no_true_negative_sampling)
+
+    lib_dict, filesequences, projectsequences = build_corpus(load_projects(basedir), args.language, config)
+    print(len(lib_dict), "libraries,", len(filesequences[1]) - 1, "files,", len(projectsequences[1]) - 1, "projects")
+
+    vectors = train(lib_dict, filesequences, projectsequences, config, args.engine, max(1, args.jobs))
+    write_models(basedir+'/models', lib_dict, vectors, config['vector_dim'], args.language)
+    print("Vectors written to", basedir+'/models')
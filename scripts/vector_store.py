@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2019, Nokia
+# Licensed under the BSD 3-Clause License
+
+
+# Binary library vector store, loadable with numpy.memmap, so that opening a model takes no
+# parsing and processes using the same model share its pages:
+#
+#   vectors.bin                        float32  (count, dim) matrix, one row per library
+#   names.bin, names_offsets.bin       uint8/int64  utf-8 string table of the library names
+#   hashtable.bin                      int32    open addressing table: row + 1 of a name at slot
+#                                               crc32(name) (linear probing), 0 for empty slots
+#   header.json                        version, count, dim, language and normalization flag
+#
+# Converters read the vectorsHD_dim<dim>.json.gz and w2v_dim<dim>.txt.gz models of the notebooks.
+#
+# Usage: ./vector_store.py <modeldir> [<dim> [<language>]] [--normalize]
+#        (converts <modeldir>/vectorsHD_dim<dim>.json.gz or w2v_dim<dim>.txt.gz into
+#         <modeldir>/vectors_dim<dim>, and compares the load times)
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from import_columns import StringTable, StringTableWriter
+
+
+format_version = 1
+
+
+def vector_store_dir(modeldir, dim):
+    return modeldir+'/vectors_dim{}'.format(dim)
+
+
+def name_hash(name):
+    return zlib.crc32(name.encode('utf-8'))
+
+
+def unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+#slots of a power of two table, at most half full
+def make_hashtable(names):
+    size = 1 << max(1, (2 * len(names) - 1).bit_length())
+    table = np.zeros(size, dtype=np.int32)
+    mask = size - 1
+    for row, name in enumerate(names):
+        slot = name_hash(name) & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = row + 1
+    return table
+
+
+def write_vector_store(dirname, names, vectors, language=None, normalize=False):
+    names = list(names)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.shape[0] != len(names):
+        raise ValueError("%d names for %d vectors" % (len(names), vectors.shape[0]))
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate library names")
+    if normalize:
+        vectors = unit_rows(vectors)
+
+    tmpdirname = dirname + '.tmp'
+    shutil.rmtree(tmpdirname, ignore_errors=True)
+    os.makedirs(tmpdirname)
+    vectors.tofile(tmpdirname+'/vectors.bin')
+    make_hashtable(names).tofile(tmpdirname+'/hashtable.bin')
+    table = StringTableWriter(tmpdirname, 'names')
+    table.add(names)
+    table.close()
+    header = {'version': format_version, 'count': len(names), 'dim': int(vectors.shape[1]),
+              'language': language, 'normalized': bool(normalize), 'dtype': 'float32'}
+    with open(tmpdirname+'/header.json', 'w') as fd:
+        json.dump(header, fd, indent=2)
+    shutil.rmtree(dirname, ignore_errors=True)
+    os.replace(tmpdirname, dirname)
+
+
+def memmap(fname, dtype, shape=None):
+    #numpy cannot memory-map empty files
+    if os.path.getsize(fname) == 0:
+        return np.zeros(shape or 0, dtype=dtype)
+    return np.memmap(fname, dtype=dtype, mode='r', shape=shape)
+
+
+#read-only, memory-mapped library vectors
+class VectorStore:
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(dirname+'/header.json') as fd:
+            self.header = json.load(fd)
+        if self.header['version'] != format_version:
+            raise ValueError("Unsupported vector store version %s in %s" % (self.header['version'], dirname))
+        self.dim = self.header['dim']
+        self.language = self.header['language']
+        self.normalized = self.header['normalized']
+        #plain ndarray views of the mappings, which index much faster than np.memmap
+        self.vectors = np.asarray(memmap(dirname+'/vectors.bin', np.float32, (self.header['count'], self.dim)))
+        self.names = StringTable(np.asarray(memmap(dirname+'/names.bin', np.uint8)),
+                                 np.asarray(memmap(dirname+'/names_offsets.bin', np.int64)))
+        self.hashtable = np.asarray(memmap(dirname+'/hashtable.bin', np.int32))
+        self.mask = len(self.hashtable) - 1
+        self._unit = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    #row of a library name, or -1
+    def index(self, name):
+        encoded = name.encode('utf-8')
+        slot = zlib.crc32(encoded) & self.mask
+        data, offsets = self.names.data, self.names.offsets
+        while True:
+            row = int(self.hashtable[slot]) - 1
+            if row < 0 or data[offsets[row]:offsets[row+1]].tobytes() == encoded:
+                return row
+            slot = (slot + 1) & self.mask
+
+    #rows of many names (-1 for unknown ones)
+    def indices(self, names):
+        return np.array([self.index(name) for name in names], dtype=np.int64)
+
+    def __contains__(self, name):
+        return self.index(name) >= 0
+
+    def __getitem__(self, name):
+        row = self.index(name)
+        if row < 0:
+            raise KeyError(name)
+        return self.vectors[row]
+
+    def get(self, name, default=None):
+        row = self.index(name)
+        return default if row < 0 else self.vectors[row]
+
+    #unit length vectors, e.g. for cosine similarities (a copy, unless the store is normalized)
+    def unit_vectors(self):
+        if self.normalized:
+            return self.vectors
+        if self._unit is None:
+            self._unit = unit_rows(self.vectors)
+        return self._unit
+
+    def to_dict(self):
+        return dict(zip(self.names.tolist(), self.vectors.tolist()))
+
+
+###################
+
+
+#(names, vectors) of a vectorsHD_dim<dim>.json.gz model
+def read_vectors_json(filename):
+    with gzip.open(filename, 'rt') as fd:
+        vectors = json.load(fd)
+    return list(vectors), np.array(list(vectors.values()), dtype=np.float32).reshape(len(vectors), -1)
+
+
+#(names, vectors) of a w2v_dim<dim>.txt.gz (word2vec text format) model
+def read_w2v(filename):
+    with gzip.open(filename, 'rt') as fd:
+        count, dim = (int(x) for x in fd.readline().split())
+        names = []
+        vectors = np.zeros((count, dim), dtype=np.float32)
+        for row, line in enumerate(fd):
+            name, values = line.rstrip('\n').split(' ', 1)
+            names.append(name)
+            vectors[row] = np.array(values.split(' '), dtype=np.float32)
+    return names, vectors[:len(names)]
+
+
+#the vectorsHD and w2v model files of a dimension
+def model_files(modeldir, dim):
+    return modeldir+'/vectorsHD_dim{}.json.gz'.format(dim), modeldir+'/w2v_dim{}.txt.gz'.format(dim)
+
+
+#whether the vector store of a dimension is missing, or older than its vectorsHD or w2v model (e.g.
+#one retrained in the Training notebook, which only rewrites vectorsHD_dim<dim>.json.gz)
+def vector_store_outdated(modeldir, dim):
+    headerfile = vector_store_dir(modeldir, dim)+'/header.json'
+    if not os.path.isfile(headerfile):
+        return True
+    return any(os.path.isfile(f) and os.path.getmtime(f) > os.path.getmtime(headerfile) for f in model_files(modeldir, dim))
+
+
+#converts the vectorsHD or w2v model of a dimension, whichever exists (by default in the language
+#of the store it replaces)
+def convert_model(modeldir, dim, language=None, normalize=False):
+    jsonfile, w2vfile = model_files(modeldir, dim)
+    headerfile = vector_store_dir(modeldir, dim)+'/header.json'
+    if language is None and os.path.isfile(headerfile):
+        with open(headerfile) as fd:
+            language = json.load(fd).get('language')
+    if os.path.isfile(jsonfile):
+        names, vectors = read_vectors_json(jsonfile)
+    elif os.path.isfile(w2vfile):
+        names, vectors = read_w2v(w2vfile)
+    else:
+        raise FileNotFoundError("No vectorsHD or w2v model of dimension %d in %s" % (dim, modeldir))
+    write_vector_store(vector_store_dir(modeldir, dim), names, vectors, language, normalize)
+    return len(names)
+
+
+if __name__ == '__main__':
+    normalize = '--normalize' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--normalize']
+    modeldir = args[0] if len(args) > 0 else '../datasets/python/models'
+    dim = int(args[1]) if len(args) > 1 else 100
+    language = args[2] if len(args) > 2 else None
+
+    count = convert_model(modeldir, dim, language, normalize)
+    print("%d vectors written to %s" % (count, vector_store_dir(modeldir, dim)))
+
+    for name, read in [('vectorsHD_dim{}.json.gz', read_vectors_json), ('w2v_dim{}.txt.gz', read_w2v)]:
+        if os.path.isfile(modeldir+'/'+name.format(dim)):
+            t0 = time.perf_counter()
+            read(modeldir+'/'+name.format(dim))
+            print("%-24s loaded in %.3fs" % (name.format(dim), time.perf_counter() - t0))
+    t0 = time.perf_counter()
+    store = VectorStore(vector_store_dir(modeldir, dim))
+    store[store.names[len(store) - 1]]
+    print("%-24s loaded in %.3fs" % ('vectors_dim{}'.format(dim), time.perf_counter() - t0))